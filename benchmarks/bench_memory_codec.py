@@ -0,0 +1,95 @@
+"""
+Benchmark the memory entry encodings: v1 JSON-prefixed text vs. v2 binary records.
+
+Encodes N synthetic entries (a mix of short user turns and long agent replies up to
+MAX_ENTRY_CHARS) in both formats, stores each set in its own SQLite memory store and
+reports the database size and the time to decode every entry (the work
+list_message_objects() does on a cold cache). It also times list_message_objects()
+right after one more turn is written, which only decodes the new entries.
+
+Usage:
+    python -m benchmarks.bench_memory_codec [--entries 2000] [--rounds 10]
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import src.memory as memory
+from src.memory_store import DEFAULT_NAMESPACE, SqliteMemoryStore, StoredEntry
+
+_WORDS = (
+    "build test deploy failed passed branch commit review lint error warning module function "
+    "config cache memory scheduler repo release merge fix refactor timeout retry"
+).split()
+
+
+def _messages(rng: random.Random, n: int) -> list[memory.Message]:
+    out: list[memory.Message] = []
+    for i in range(n):
+        if i % 2 == 0:
+            text = " ".join(rng.choices(_WORDS, k=rng.randint(5, 30)))
+            out.append(memory.Message("user", text, ts=1_700_000_000.0 + i, meta={"source": "discord", "tokens": 20}))
+        else:
+            lines = [" ".join(rng.choices(_WORDS, k=12)) + f" in src/module_{rng.randrange(50)}.py" for _ in range(rng.randint(2, 60))]
+            text = "\n".join(lines)[: memory.MAX_ENTRY_CHARS]
+            out.append(memory.Message("assistant", text, ts=1_700_000_000.0 + i, meta={"source": "discord", "tokens": len(text) // 4}))
+    return out
+
+
+def _measure(root: Path, name: str, entries: list[StoredEntry], rounds: int) -> tuple[int, float]:
+    store = SqliteMemoryStore(root / name / memory.SQLITE_FILENAME)
+    store.append(DEFAULT_NAMESPACE, entries)
+    store._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = (root / name / memory.SQLITE_FILENAME).stat().st_size
+    timings: list[float] = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for entry in store.scan(DEFAULT_NAMESPACE):
+            memory._decode_entry(entry)
+        timings.append((time.perf_counter() - t0) * 1000)
+    store.close()
+    return size, statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    msgs = _messages(random.Random(0), args.entries)
+    v1 = [StoredEntry(ts=m.ts, kind=m.kind, role=m.role, payload=memory._encode_message(m)) for m in msgs]
+    v2 = [memory._to_stored(m) for m in msgs]
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        v1_size, v1_ms = _measure(root, "v1", v1, args.rounds)
+        v2_size, v2_ms = _measure(root, "v2", v2, args.rounds)
+
+    print(f"entries={args.entries}")
+    print(f"v1 json:   db={v1_size / 1024:,.0f} KiB  scan+decode={v1_ms:.1f} ms")
+    print(f"v2 binary: db={v2_size / 1024:,.0f} KiB  scan+decode={v2_ms:.1f} ms")
+    print(f"size {v2_size / v1_size:.0%} of v1, decode {v2_ms / v1_ms:.0%} of v1")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        memory.QUEUE_DIR = directory
+        memory.LOCK_FILE = directory / ".lock"
+        memory.MAX_ENTRIES_BEFORE_SUMMARY = 10**9
+        memory.store = memory.open_store(directory)
+        memory.store.append(DEFAULT_NAMESPACE, v2)
+        t0 = time.perf_counter()
+        memory.list_message_objects()
+        cold_ms = (time.perf_counter() - t0) * 1000
+        memory.add_turn("one more question", "one more answer")
+        t0 = time.perf_counter()
+        memory.list_message_objects()
+        refresh_ms = (time.perf_counter() - t0) * 1000
+        memory.store.close()
+    print(f"list_message_objects: cold={cold_ms:.1f} ms  after one write={refresh_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark lexical retrieval over a large archive.
+
+Builds a LexicalIndex over N synthetic archived turns and reports build time and
+search latency (mean / p95 / max) for a set of mixed rare and common queries.
+
+Usage:
+    python -m benchmarks.bench_memory_index [--docs 100000] [--queries 200]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from src.memory_index import LexicalIndex
+
+_COMMON = "status update please check the build deploy repo branch review fix test error log".split()
+
+
+def _synthetic_turn(rng: random.Random, i: int) -> str:
+    words = rng.choices(_COMMON, k=12) + [f"topic{rng.randrange(5000)}", f"file{rng.randrange(20000)}.py"]
+    rng.shuffle(words)
+    return f"User: {' '.join(words[:7])}\nAgent: {' '.join(words[7:])} #{i}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    index = LexicalIndex()
+    t0 = time.perf_counter()
+    index.add_many((i + 1, _synthetic_turn(rng, i)) for i in range(args.docs))
+    build = time.perf_counter() - t0
+
+    print(f"docs={args.docs} build={build:.2f}s")
+    queries = {
+        "mixed": lambda: f"{rng.choice(_COMMON)} topic{rng.randrange(5000)} file{rng.randrange(20000)}.py build",
+        "common-only": lambda: " ".join(rng.sample(_COMMON, 3)),
+    }
+    for name, make_query in queries.items():
+        latencies: list[float] = []
+        for _ in range(args.queries):
+            query = make_query()
+            t0 = time.perf_counter()
+            index.search(query, k=3)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        latencies.sort()
+        print(
+            f"{name} search ms: mean={statistics.mean(latencies):.2f} "
+            f"p95={latencies[int(len(latencies) * 0.95) - 1]:.2f} max={latencies[-1]:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark memory write throughput: one commit per turn vs. group commit.
+
+Writes N synthetic turns into a fresh SQLite memory store, first with add_turn()
+(one durable commit per turn) and then with add_turns() in batches, and reports
+turns per second for each. Compaction is disabled so only the write path is measured.
+
+Usage:
+    python -m benchmarks.bench_memory_writes [--turns 2000] [--batch 100]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import src.memory as memory
+
+
+def _turns(n: int) -> list[tuple[str, str]]:
+    return [(f"question {i} about file{i}.py", f"answer {i}: checked the build and the tests") for i in range(n)]
+
+
+def _fresh_store(root: Path, name: str) -> None:
+    directory = root / name
+    memory.QUEUE_DIR = directory
+    memory.LOCK_FILE = directory / ".lock"
+    memory.store = memory.open_store(directory)
+    memory._snapshots.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    memory.MAX_ENTRIES_BEFORE_SUMMARY = 10**9
+    turns = _turns(args.turns)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+
+        _fresh_store(root, "single")
+        t0 = time.perf_counter()
+        for user, assistant in turns:
+            memory.add_turn(user, assistant, source="scheduler")
+        single = time.perf_counter() - t0
+        memory.store.close()
+
+        _fresh_store(root, "batched")
+        t0 = time.perf_counter()
+        for i in range(0, len(turns), args.batch):
+            memory.add_turns(turns[i:i + args.batch], source="scheduler")
+        batched = time.perf_counter() - t0
+        memory.store.close()
+
+    print(f"turns={args.turns} batch={args.batch}")
+    print(f"add_turn  (commit per turn):  {args.turns / single:,.0f} turns/s")
+    print(f"add_turns (group commit):     {args.turns / batched:,.0f} turns/s ({single / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+import asyncio
+import json
 import os
 import re
-import subprocess
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
 
 from src.config_store import get_repo_path
 from src.logs import get_logger
@@ -11,12 +15,24 @@ logger = get_logger(__name__)
 # Mutable so it can be updated at runtime (e.g., via /cwd command) via config_store.
 repo_path = get_repo_path()
 
+# Hard limit for a single agent invocation (seconds).
+AGENT_TIMEOUT_SECONDS = float(os.getenv("AGENT_TIMEOUT_SECONDS", "1800"))
+# How long to wait for the process group to exit after SIGTERM before sending SIGKILL.
+AGENT_KILL_GRACE_SECONDS = float(os.getenv("AGENT_KILL_GRACE_SECONDS", "5"))
+# Read size for incremental stdout/stderr consumption.
+_READ_CHUNK_BYTES = 4096
+# Max size of a single stream-json line (the final "result" event carries the whole response).
+_STREAM_LINE_LIMIT = 16 * 1024 * 1024
+
+# Receives incremental response text while the agent is still running.
+ChunkCallback = Callable[[str], Awaitable[None]]
+
 
 def _sanitize_prompt(prompt: str) -> str:
     """
-    Sanitize user input before passing to agent. 
-    No shell is used (list argv), 
-    so shell injection is not possible; 
+    Sanitize user input before passing to agent.
+    No shell is used (list argv),
+    so shell injection is not possible;
     this guards against other abuse.
     """
     if not prompt or not prompt.strip():
@@ -27,32 +43,214 @@ def _sanitize_prompt(prompt: str) -> str:
     return sanitized
 
 
+def get_model() -> str:
+    """Return the Cursor model used for agent runs (CURSOR_MODEL)."""
+    return os.getenv("CURSOR_MODEL", "composer-1.5")
 
-def generate_response(prompt: str) -> str:
+
+def _build_command(prompt: str, *, stream: bool = False) -> list[str]:
+    """
+    Sanitize the prompt and return the agent argv. Raises EmptyPromptError on empty input.
+    stream=True asks the CLI for newline-delimited JSON events with partial text deltas.
+    """
     sanitized = _sanitize_prompt(prompt)
     if not sanitized:
         raise EmptyPromptError("Please send a non-empty message.")
 
-    model = os.getenv("CURSOR_MODEL", "composer-1.5")
+    model = get_model()
     cmd = [
         "agent",
         "-p", "--force", "--model", model,
         sanitized,
-        "--output-format=text",
     ]
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=1800,
+    if stream:
+        return cmd + ["--output-format=stream-json", "--stream-partial-output"]
+    return cmd + ["--output-format=text"]
+
+
+def _handle_result(returncode: int, stdout: str, stderr: str) -> str:
+    """Log the agent result and return stdout, or raise AgentError on a non-zero exit."""
+    logger.info("Return code: %s", returncode)
+    logger.info("STDOUT: %s", stdout)
+    logger.info("STDERR: %s", stderr)
+    if returncode == 0:
+        logger.info(f"Successfully generated response: bytes: {len(stdout)}")
+        return stdout
+    logger.error(f"Error generating response: {stderr}")
+    raise AgentError("Sorry, I encountered an error. Please try again later.", stderr=stderr or "")
+
+
+def generate_response(prompt: str, *, timeout: float | None = None) -> str:
+    """
+    Blocking wrapper around generate_response_async. Prefer the async version from coroutines.
+    Same behavior: timeouts raise AgentError and kill the agent's whole process group.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(generate_response_async(prompt, timeout=timeout))
+    # Called on an event loop thread: run the engine on its own loop in a worker thread.
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-sync") as pool:
+        return pool.submit(asyncio.run, generate_response_async(prompt, timeout=timeout)).result()
+
+
+async def _drain(stream: asyncio.StreamReader, sink: list[bytes]) -> None:
+    """Read a pipe incrementally until EOF so the child never blocks on a full pipe buffer."""
+    while True:
+        chunk = await stream.read(_READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        sink.append(chunk)
+
+
+class _StreamJsonParser:
+    """
+    Accumulate the CLI's stream-json events.
+    Assistant text events are deltas; the final "result" event carries the full response.
+    Lines that are not JSON (older CLIs, plain text output) are treated as raw text.
+    """
+
+    def __init__(self) -> None:
+        self.deltas: list[str] = []
+        self.result: Optional[str] = None
+
+    def feed(self, line: str) -> str:
+        """Consume one output line and return the newly produced text (may be empty)."""
+        stripped = line.strip()
+        if not stripped:
+            return ""
+        try:
+            event = json.loads(stripped)
+        except ValueError:
+            self.deltas.append(line)
+            return line
+        if not isinstance(event, dict):
+            return ""
+        if event.get("type") == "result":
+            if isinstance(event.get("result"), str):
+                self.result = event["result"]
+            return ""
+        if event.get("type") != "assistant":
+            return ""
+        content = (event.get("message") or {}).get("content") or []
+        text = "".join(
+            part.get("text", "") for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+        if text:
+            self.deltas.append(text)
+        return text
+
+    def text(self) -> str:
+        return self.result if self.result is not None else "".join(self.deltas)
+
+
+async def _drain_stream_json(
+    stream: asyncio.StreamReader,
+    parser: _StreamJsonParser,
+    on_chunk: ChunkCallback,
+) -> None:
+    """Parse stream-json lines as they arrive and forward text deltas to on_chunk."""
+    while True:
+        raw = await stream.readline()
+        if not raw:
+            return
+        text = parser.feed(raw.decode("utf-8", errors="replace"))
+        if not text:
+            continue
+        try:
+            await on_chunk(text)
+        except Exception:
+            # A failed Discord edit must not abort the agent run.
+            logger.exception("Streaming chunk callback failed")
+
+
+async def _kill_process_group(proc: asyncio.subprocess.Process) -> None:
+    """Terminate the agent and everything it spawned (SIGTERM, then SIGKILL after a grace period)."""
+    if proc.returncode is not None:
+        return
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=AGENT_KILL_GRACE_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+
+async def _abort(proc: asyncio.subprocess.Process, readers: list[asyncio.Future]) -> None:
+    """Kill the agent's process group and stop the pipe readers that are still running."""
+    await _kill_process_group(proc)
+    for reader in readers:
+        reader.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    # Read the pipes to EOF: a reader that failed mid-line leaves its pipe paused, and the
+    # subprocess transport only closes once both pipes report EOF.
+    for stream in (proc.stdout, proc.stderr):
+        try:
+            await asyncio.wait_for(stream.read(), timeout=AGENT_KILL_GRACE_SECONDS)
+        except (asyncio.TimeoutError, ValueError, OSError):
+            pass
+
+
+async def generate_response_async(
+    prompt: str,
+    *,
+    timeout: float | None = None,
+    on_chunk: Optional[ChunkCallback] = None,
+    on_start: Optional[Callable[[int], None]] = None,
+) -> str:
+    """
+    Run the agent CLI without tying up a thread.
+    The agent runs in its own process group so timeouts and task cancellation
+    kill the whole tree, not just the top-level process.
+    With on_chunk, the CLI streams its output and each text delta is passed to
+    on_chunk as soon as it is produced; the full response is still returned.
+    on_start, if given, is called with the agent's PID right after it is spawned.
+    """
+    cmd = _build_command(prompt, stream=on_chunk is not None)
+    limit = AGENT_TIMEOUT_SECONDS if timeout is None else timeout
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
         cwd=repo_path,
+        start_new_session=True,
+        limit=_STREAM_LINE_LIMIT,
     )
-    logger.info("Return code: %s", result.returncode)
-    logger.info("STDOUT: %s", result.stdout)
-    logger.info("STDERR: %s", result.stderr)
-    output = result.stdout
-    if result.returncode == 0:
-        logger.info(f"Successfully generated response: bytes: {len(output)}")
-        return output
-    logger.error(f"Error generating response: {result.stderr}")
-    raise AgentError("Sorry, I encountered an error. Please try again later.", stderr=result.stderr or "")
\ No newline at end of file
+    if on_start is not None:
+        on_start(proc.pid)
+    out: list[bytes] = []
+    err: list[bytes] = []
+    parser = _StreamJsonParser()
+    if on_chunk is not None:
+        stdout_reader = _drain_stream_json(proc.stdout, parser, on_chunk)
+    else:
+        stdout_reader = _drain(proc.stdout, out)
+    reader_tasks = [asyncio.ensure_future(stdout_reader), asyncio.ensure_future(_drain(proc.stderr, err))]
+    readers = asyncio.gather(*reader_tasks)
+    try:
+        await asyncio.wait_for(asyncio.shield(readers), timeout=limit)
+        returncode = await proc.wait()
+    except asyncio.TimeoutError:
+        logger.error("Agent timed out after %ss (pid=%s); killing process group", limit, proc.pid)
+        await _abort(proc, reader_tasks)
+        raise AgentError("Sorry, the agent took too long and was stopped.", stderr="timeout")
+    except BaseException as e:
+        # Cancellation, or a reader failure such as a stream-json line over _STREAM_LINE_LIMIT:
+        # never leave the agent running with nobody draining its pipes.
+        if isinstance(e, asyncio.CancelledError):
+            logger.info("Agent run cancelled (pid=%s); killing process group", proc.pid)
+        else:
+            logger.exception("Agent output handling failed (pid=%s); killing process group", proc.pid)
+        await _abort(proc, reader_tasks)
+        raise
+    if on_chunk is not None:
+        stdout = parser.text()
+    else:
+        stdout = b"".join(out).decode("utf-8", errors="replace")
+    stderr = b"".join(err).decode("utf-8", errors="replace")
+    return _handle_result(returncode, stdout, stderr)
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import time
 from typing import Optional
 
 import discord
@@ -9,9 +10,29 @@ load_dotenv()
 
 import src.ai as ai
 from src.config_store import get_repo_path, set_repo_path
+from src.delivery import deliver
+from src.inbox import STATE_COALESCED, STATE_MERGED, STATE_REJECTED, inbox
+from src.job_registry import format_jobs, registry
+from src.job_scheduler import priority_for_source, scheduler
 from src.logs import get_logger
-from src.memory import add_turn, list_messages, reset_memory
+from src.memory_store import DEFAULT_NAMESPACE
+from src.proactive import PROACTIVE_SKIP_UNCHANGED, ProactivePacer, capture_state, is_quiet_reply
+from src.memory import (
+    Message,
+    aadd_turn,
+    alist_message_objects,
+    amemory_generation,
+    areset_memory,
+    asearch_archive,
+    estimate_tokens,
+    namespace_for,
+    render_for_context,
+    without_prompt_turns,
+)
+from src.response_cache import response_cache
 from src.schema import AgentError, EmptyPromptError, EnvironmentVariablesNotFoundError    
+from src.singleflight import SingleFlight
+from src.streaming import DiscordStreamWriter
 logger = get_logger(__name__)
 
 token = os.getenv("DISCORD_TOKEN")
@@ -28,11 +49,25 @@ PROACTIVE_PROMPT = os.getenv(
     "Send a short proactive update. If you have nothing useful, say 'No updates.'",
 )
 _proactive_task: Optional[asyncio.Task] = None  # prevent duplicate loops on reconnect
+# Backs the proactive interval off while quiet; Discord messages reset it (see src.proactive).
+proactive_pacer = ProactivePacer(PROACTIVE_INTERVAL_SECONDS)
+
+# Coalesces concurrent agent_run calls with the same effective prompt and repo.
+_inflight = SingleFlight()
 
 # Memory-to-prompt budgeting
 # Caps how much stored memory is prepended to the agent prompt to keep latency/cost stable.
 MAX_MEMORY_PROMPT_CHARS = int(os.getenv("MAX_MEMORY_PROMPT_CHARS", "12000"))
+MAX_MEMORY_PROMPT_TOKENS = int(os.getenv("MAX_MEMORY_PROMPT_TOKENS", str(MAX_MEMORY_PROMPT_CHARS // 4)))
 MAX_MEMORY_ITEMS = int(os.getenv("MAX_MEMORY_ITEMS", "12"))
+# Archived turns relevant to the prompt are recalled on top of the rolling summary.
+MEMORY_RETRIEVAL_TOP_K = int(os.getenv("MEMORY_RETRIEVAL_TOP_K", "3"))
+MEMORY_RETRIEVAL_MAX_TOKENS = int(os.getenv("MEMORY_RETRIEVAL_MAX_TOKENS", "600"))
+# Packed prefix per memory namespace for its last seen memory_generation(); rebuilt only when it changes.
+_prefix_cache: dict[str, tuple[int, str]] = {}
+
+# Stream partial agent output into Discord by editing the reply as chunks arrive (set to 0 to disable).
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
 
 
 def _get_discord_client():
@@ -40,35 +75,145 @@ def _get_discord_client():
     intents.message_content = True
     return discord.Client(intents=intents)
 
-def _build_memory_prefix(prior: list[str]) -> str:
+def _entry_tokens(msg: Message) -> int:
+    """Token estimate recorded at write time (computed here only for entries that predate it)."""
+    tokens = (msg.meta or {}).get("tokens")
+    if isinstance(tokens, int):
+        return tokens
+    return estimate_tokens(render_for_context(msg))
+
+
+def _build_memory_prefix(prior: list[Message]) -> str:
     """
-    Build a bounded memory prefix string from stored messages.
-    Strategy: take the most recent items up to MAX_MEMORY_ITEMS, then trim to MAX_MEMORY_PROMPT_CHARS.
+    Pack whole memory entries into a prefix bounded by MAX_MEMORY_PROMPT_TOKENS and MAX_MEMORY_ITEMS.
+    Strategy: the latest summary is always included; the remaining budget goes to the newest
+    entries first (then older summaries). Entries are never cut in half; output keeps stored order.
     """
     if not prior:
         return ""
-    recent = prior[-MAX_MEMORY_ITEMS:]
-    joined = "\n".join(recent).strip()
-    if not joined:
+    picked: set[int] = set()
+    budget = MAX_MEMORY_PROMPT_TOKENS
+    summaries = [i for i, m in enumerate(prior) if m.kind == "summary"]
+    if summaries:
+        latest = summaries[-1]
+        picked.add(latest)
+        budget -= _entry_tokens(prior[latest])
+    others = [i for i in reversed(range(len(prior))) if prior[i].kind != "summary"]
+    others += [i for i in reversed(summaries[:-1])]
+    for i in others:
+        if len(picked) >= MAX_MEMORY_ITEMS:
+            break
+        cost = _entry_tokens(prior[i])
+        if cost > budget:
+            continue
+        picked.add(i)
+        budget -= cost
+    rendered = (render_for_context(prior[i]) for i in sorted(picked))
+    return "\n".join(r for r in rendered if r).strip()
+
+
+async def _memory_prefix(namespace: str = DEFAULT_NAMESPACE) -> str:
+    """Return the packed memory prefix, reusing the cached one while memory is unchanged."""
+    version = await amemory_generation(namespace)
+    cached = _prefix_cache.get(namespace)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    prefix = _build_memory_prefix(await alist_message_objects(namespace))
+    _prefix_cache[namespace] = (version, prefix)
+    return prefix
+
+
+async def _recalled_context(prompt: str, mem_prefix: str, namespace: str = DEFAULT_NAMESPACE) -> str:
+    """Top-k archived turns relevant to the prompt that are not already in the memory prefix."""
+    if MEMORY_RETRIEVAL_TOP_K <= 0:
+        return ""
+    picked: list[str] = []
+    budget = MEMORY_RETRIEVAL_MAX_TOKENS
+    for text in await asearch_archive(prompt, k=MEMORY_RETRIEVAL_TOP_K, namespace=namespace):
+        cost = estimate_tokens(text)
+        if text in mem_prefix or cost > budget:
+            continue
+        picked.append(text)
+        budget -= cost
+    if not picked:
         return ""
-    if len(joined) <= MAX_MEMORY_PROMPT_CHARS:
-        return joined
-    # Keep the most recent tail within budget.
-    return joined[-MAX_MEMORY_PROMPT_CHARS:]
+    return "Relevant earlier context:\n" + "\n".join(picked)
+
 
+async def agent_run(
+    prompt: str,
+    *,
+    source: str = "discord",
+    on_chunk: Optional[ai.ChunkCallback] = None,
+    use_cache: bool = True,
+    namespace: Optional[str] = None,
+) -> str:
+    """
+    Run the agent on the prompt. On success returns the response and adds to memory. On error raises EmptyPromptError or AgentError; caller should send the error message (do not add to memory).
 
-async def agent_run(prompt: str) -> str:
-    """Run the agent on the prompt. On success returns the response and adds to memory. On error raises EmptyPromptError or AgentError; caller should send the error message (do not add to memory)."""
-    # Run blocking generate_response in a thread so the event loop can process Discord heartbeats
-    prior = list_messages()
-    mem_prefix = _build_memory_prefix(prior)
+    source ("discord" | "scheduler" | "proactive") selects the job scheduler priority class and is recorded in memory.
+    on_chunk, if given, receives partial output as the agent produces it.
+    use_cache=False bypasses the response cache for this call. A cache hit is not recorded in memory again.
+    namespace selects the memory namespace read and written (see memory.namespace_for); default is shared.
+    """
+    namespace = namespace or DEFAULT_NAMESPACE
+    mem_prefix = await _memory_prefix(namespace)
+    recalled = await _recalled_context(prompt, mem_prefix, namespace)
+    if recalled:
+        mem_prefix = recalled + "\n\n" + mem_prefix if mem_prefix else recalled
     combined_prompt = prompt
     if mem_prefix:
         combined_prompt = mem_prefix + "\n\n" + prompt
-    res_message = await asyncio.to_thread(ai.generate_response, combined_prompt)
-    add_turn(prompt, res_message, source="discord")
 
-    return res_message
+    cache_key = None
+    if use_cache and response_cache.enabled:
+        # Key on memory without this prompt's own earlier turns: otherwise recording the answer
+        # would change the key of the next identical request and the cache could never hit.
+        memory_state = _build_memory_prefix(without_prompt_turns(await alist_message_objects(namespace), prompt))
+        if recalled:
+            memory_state = recalled + "\n\n" + memory_state
+        cache_key = await response_cache.make_key(prompt, memory_state, ai.repo_path)
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            # Not recorded again: the run that filled the entry already stored this exact turn.
+            return cached
+
+    repo = ai.repo_path
+
+    async def _run_and_record(broadcast: ai.ChunkCallback) -> str:
+        # Runs once per coalesced group, so memory and the cache are written exactly once.
+        started = time.monotonic()
+        job = registry.register(source, prompt)
+
+        def _record_pid(pid: int) -> None:
+            job.pid = pid
+
+        # Native asyncio subprocess: no executor thread is pinned while the agent runs.
+        # The scheduler bounds concurrent agent processes and serializes runs per repo.
+        try:
+            res = await scheduler.run(
+                lambda: ai.generate_response_async(
+                    combined_prompt, on_chunk=broadcast if on_chunk else None, on_start=_record_pid
+                ),
+                priority=priority_for_source(source),
+                repo=repo,
+            )
+        except asyncio.CancelledError:
+            if not job.cancel_requested:
+                raise
+            # Cancelled via /cancel: every coalesced caller gets an ordinary agent error.
+            raise AgentError(f"🛑 Job #{job.id} was cancelled.", stderr="cancelled")
+        finally:
+            registry.finish(job)
+        if cache_key is not None:
+            response_cache.put(cache_key, res, elapsed=time.monotonic() - started)
+        await aadd_turn(prompt, res, source=source, namespace=namespace)
+        return res
+
+    # Identical effective prompts against the same repo (and memory namespace) share one agent subprocess.
+    flight_key = (namespace, ai._sanitize_prompt(combined_prompt), os.path.realpath(repo))
+    return await _inflight.do(flight_key, _run_and_record, on_chunk=on_chunk)
 
 
 client = _get_discord_client()
@@ -109,17 +254,45 @@ async def _proactive_loop() -> None:
         PROACTIVE_CHANNEL_ID,
     )
 
+    # State recorded after the last agent run; an unchanged state means there is nothing to report.
+    baseline = None
     while not client.is_closed():
         try:
-            async with channel.typing():
-                msg = await agent_run(PROACTIVE_PROMPT)
-            msg = (msg or "").strip()
-            if msg:
-                await channel.send(msg)
+            repo = ai.repo_path
+            namespace = namespace_for(source="proactive", repo_path=repo)
+            state = await capture_state(repo, namespace, proactive_pacer.last_activity)
+            if PROACTIVE_SKIP_UNCHANGED and state == baseline:
+                proactive_pacer.quiet()
+                logger.info("Proactive tick skipped: nothing changed (next in %.0fs)", proactive_pacer.interval)
+            else:
+                # A cached answer would be the last "No updates." for a state that just changed.
+                async with channel.typing():
+                    msg = await agent_run(PROACTIVE_PROMPT, source="proactive", namespace=namespace, use_cache=False)
+                msg = (msg or "").strip()
+                if is_quiet_reply(msg):
+                    proactive_pacer.quiet()
+                else:
+                    proactive_pacer.active()
+                if msg:
+                    await deliver(channel, msg)
+                # Taken after the run so the run's own memory write is not seen as a change.
+                baseline = await capture_state(repo, namespace, proactive_pacer.last_activity)
         except Exception:
             logger.exception("Proactive loop iteration failed")
 
-        await asyncio.sleep(PROACTIVE_INTERVAL_SECONDS)
+        await proactive_pacer.sleep()
+
+
+def _format_inbox_stats(stats: dict) -> str:
+    channels = ", ".join(f"{k}: {v}" for k, v in stats["channels"].items()) or "none"
+    return (
+        f"Inbox ({stats['policy']}, max {stats['channel_max_depth']}/channel, {stats['global_max_depth']} total)\n"
+        f"running={stats['running']} waiting={stats['waiting']} max_waiting={stats['max_waiting']}\n"
+        f"waiting by channel: {channels}\n"
+        f"avg_wait={stats['avg_wait']}s max_wait={stats['max_wait']}s\n"
+        f"admitted={stats['admitted']} queued={stats['queued']} merged={stats['merged']} "
+        f"dropped={stats['dropped']} rejected={stats['rejected']}"
+    )
 
 
 @client.event
@@ -136,6 +309,7 @@ async def on_message(message):
     if message.author == client.user:
         return
     logger.info(f"Message received, total bytes: {len(message.content)}")
+    proactive_pacer.note_activity()
     await message.add_reaction("🤖")
 
     prompt = message.content
@@ -157,19 +331,69 @@ async def on_message(message):
         await message.channel.send(f"Working directory set to: {new_path}")
         return
     
-    # Handle /reset-memory to clear all stored conversation history
+    namespace = namespace_for(channel_id=message.channel.id, repo_path=ai.repo_path)
+
+    # Handle /reset-memory to clear this channel's stored conversation history
     if prompt.startswith("/reset-memory"):
-        reset_memory()
-        await message.channel.send("✅ Memory reset: All conversation history has been cleared.")
+        await areset_memory(namespace)
+        await message.channel.send("✅ Memory reset: This channel's conversation history for the current repo has been cleared.")
         return
 
-    async with message.channel.typing():
-        try:
-            res_message = await agent_run(prompt)
-            await message.channel.send(res_message)
-        except (EmptyPromptError, AgentError) as e:
-            await message.channel.send(str(e))
-            # Do not add to memory on error
+    # Handle /queue to show inbox depths and counters
+    if prompt.startswith("/queue"):
+        await deliver(message.channel, _format_inbox_stats(inbox.stats()))
+        return
+
+    # Handle /jobs to list in-flight agent runs and /cancel <id> to stop one
+    if prompt.startswith("/jobs"):
+        await deliver(message.channel, format_jobs(registry.jobs()))
+        return
+    if prompt.startswith("/cancel"):
+        parts = prompt.split(maxsplit=1)
+        if len(parts) < 2 or not parts[1].strip().lstrip("#").isdigit():
+            await deliver(message.channel, "Usage: /cancel <job id> (see /jobs)")
+            return
+        job_id = int(parts[1].strip().lstrip("#"))
+        if registry.cancel(job_id):
+            await deliver(message.channel, f"🛑 Cancelling job #{job_id}.")
+        else:
+            await deliver(message.channel, f"No job #{job_id} is in flight.")
+        return
+
+    ticket = inbox.submit(message.channel.id, prompt, author=message.author.id)
+    if ticket.state == STATE_COALESCED:
+        # Folded into this author's pending request; its reply answers both.
+        return
+    if ticket.state == STATE_REJECTED:
+        await deliver(message.channel, f"⏳ Busy: {ticket.position} requests are already waiting here. Please try again later.")
+        return
+    if ticket.state == STATE_MERGED:
+        await deliver(message.channel, f"➕ Added to queued request #{ticket.position}; one reply will cover both.")
+        return
+    if ticket.position:
+        await deliver(message.channel, f"⏳ Queued: position {ticket.position} in this channel.")
+
+    async with inbox.turn(ticket) as admitted:
+        if not admitted:
+            await deliver(message.channel, "⚠️ Dropped: the queue overflowed before your request started. Please resend it.")
+            return
+        # Later messages may have been merged into this one while it waited or debounced.
+        prompt = ticket.prompt
+        async with message.channel.typing():
+            writer = DiscordStreamWriter(message.channel) if STREAM_RESPONSES else None
+            try:
+                if writer is not None:
+                    res_message = await agent_run(prompt, source="discord", on_chunk=writer.push, namespace=namespace)
+                    await writer.finish(res_message)
+                else:
+                    res_message = await agent_run(prompt, source="discord", namespace=namespace)
+                    await deliver(message.channel, res_message)
+            except (EmptyPromptError, AgentError) as e:
+                if writer is not None and writer.started:
+                    # Stop pending edits and drop the progress cursor from the partial reply.
+                    await writer.finish()
+                await deliver(message.channel, str(e))
+                # Do not add to memory on error
 
 def listen_to_discord():
     if not token:
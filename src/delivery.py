@@ -0,0 +1,258 @@
+"""
+Outbound Discord delivery.
+
+Every reply goes through one ChannelDelivery queue per channel instead of calling
+channel.send() directly:
+
+- Long text is split at code-fence, paragraph and line boundaries into messages of at
+  most DISCORD_MESSAGE_LIMIT chars; a code block cut in half is closed and reopened
+  (with its language tag) in the next message so formatting survives.
+- Text longer than DELIVERY_ATTACHMENT_CHARS is sent as a file attachment with a
+  short preview instead of a wall of messages.
+- Small messages queued while the channel is busy are batched into one message.
+- Sends are paced by a token bucket per channel (Discord rate-limits message
+  creation per channel route, 5 per 5 seconds), and a 429 is retried after its
+  retry_after instead of failing the reply.
+
+Each channel has its own worker task, so a slow or rate-limited channel never delays
+another one, and callers only wait for their own message.
+
+Streamed replies (src.streaming) post their messages through the same queue and make
+their edits and deletes through edit()/delete(), so they share the channel's bucket
+and 429 handling.
+"""
+import asyncio
+import io
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+import discord
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+DISCORD_MESSAGE_LIMIT = 2000
+DELIVERY_ATTACHMENT_CHARS = int(os.getenv("DELIVERY_ATTACHMENT_CHARS", "8000"))
+DELIVERY_BUCKET_SIZE = int(os.getenv("DELIVERY_BUCKET_SIZE", "5"))
+DELIVERY_BUCKET_SECONDS = float(os.getenv("DELIVERY_BUCKET_SECONDS", "5"))
+# Workers exit after this long without work and are recreated on demand.
+DELIVERY_IDLE_SECONDS = float(os.getenv("DELIVERY_IDLE_SECONDS", "60"))
+_MAX_RETRIES = 3
+_PREVIEW_CHARS = 300
+
+_FENCE_RE = re.compile(r"^\s*```(\S*)", re.MULTILINE)
+
+
+def _open_fence(text: str) -> Optional[str]:
+    """Language tag of the code fence left open at the end of `text` ("" for untagged), or None."""
+    lang: Optional[str] = None
+    for match in _FENCE_RE.finditer(text):
+        lang = match.group(1) if lang is None else None
+    return lang
+
+
+def _cut_point(text: str, limit: int) -> int:
+    """Best place to cut `text` at or before `limit`: a fence, a paragraph, a line, a space, else hard."""
+    window = text[:limit]
+    # Cutting right before an opening fence keeps the whole code block together.
+    cut = window.rfind("\n```")
+    if cut > limit // 4 and _open_fence(window[:cut]) is None:
+        return cut + 1
+    for sep in ("\n\n", "\n", " "):
+        cut = window.rfind(sep)
+        if cut > limit // 4:
+            return cut
+    return limit
+
+
+def split_for_discord(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """Split text into messages of at most `limit` chars without breaking code block formatting."""
+    chunks: list[str] = []
+    rest = text.strip()
+    reopen = ""
+    while rest:
+        rest = reopen + rest
+        if len(rest) <= limit:
+            chunks.append(rest)
+            break
+        # Leave room to close a fence that the cut might leave open.
+        cut = _cut_point(rest, limit - 4)
+        head, rest = rest[:cut].rstrip(), rest[cut:].lstrip("\n")
+        lang = _open_fence(head)
+        if lang is not None:
+            head += "\n```"
+            reopen = f"```{lang}\n"
+        else:
+            reopen = ""
+        chunks.append(head)
+    return chunks or [""]
+
+
+@dataclass
+class _Outgoing:
+    text: str
+    done: asyncio.Future
+    batchable: bool = True
+
+
+@dataclass
+class _TokenBucket:
+    """capacity sends per `per` seconds, refilled continuously."""
+
+    capacity: int
+    per: float
+    tokens: float = field(init=False)
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self) -> None:
+        self.tokens = float(self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.per / self.capacity)
+
+    def drain_for(self, seconds: float) -> None:
+        """Empty the bucket so the next send waits `seconds` (after a 429)."""
+        self._refill()
+        self.tokens = -seconds * self.capacity / self.per
+
+
+class ChannelDelivery:
+    """Ordered, paced outbound queue for one channel."""
+
+    def __init__(
+        self,
+        channel: Any,
+        *,
+        bucket_size: int = DELIVERY_BUCKET_SIZE,
+        bucket_seconds: float = DELIVERY_BUCKET_SECONDS,
+        idle_seconds: float = DELIVERY_IDLE_SECONDS,
+    ):
+        self.channel = channel
+        self.idle_seconds = idle_seconds
+        self._bucket = _TokenBucket(bucket_size, bucket_seconds)
+        self._queue: asyncio.Queue[_Outgoing] = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._carry: Optional[_Outgoing] = None
+        self.sent = 0
+        self.batched = 0
+        self.retried = 0
+
+    def submit(self, text: str, *, batchable: bool = True) -> asyncio.Future:
+        """Queue text for delivery; the returned future resolves to the sent messages."""
+        item = _Outgoing(text, asyncio.get_running_loop().create_future(), batchable)
+        self._queue.put_nowait(item)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return item.done
+
+    async def _run(self) -> None:
+        while True:
+            item, self._carry = self._carry, None
+            if item is None:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=self.idle_seconds)
+                except asyncio.TimeoutError:
+                    return
+            group = [item]
+            text = item.text.strip()
+            # Batch small messages that piled up while we were sending or paced.
+            while item.batchable and not self._queue.empty():
+                nxt = self._queue.get_nowait()
+                joined = f"{text}\n\n{nxt.text.strip()}"
+                if not nxt.batchable or len(joined) > DISCORD_MESSAGE_LIMIT:
+                    self._carry = nxt
+                    break
+                group.append(nxt)
+                text = joined
+            if len(group) > 1:
+                self.batched += len(group) - 1
+            try:
+                sent = await self._deliver(text)
+            except Exception as e:
+                for g in group:
+                    if not g.done.done():
+                        g.done.set_exception(e)
+            else:
+                for g in group:
+                    if not g.done.done():
+                        g.done.set_result(sent)
+
+    async def _deliver(self, text: str) -> list[Any]:
+        if len(text) > DELIVERY_ATTACHMENT_CHARS:
+            preview = split_for_discord(text[:_PREVIEW_CHARS], DISCORD_MESSAGE_LIMIT)[0]
+            note = f"{preview}…\n\n(Full response attached: {len(text)} chars)"
+            return [await self._send(content=note, file_text=text)]
+        return [await self._send(content=chunk) for chunk in split_for_discord(text)]
+
+    async def _send(self, *, content: str, file_text: Optional[str] = None) -> Any:
+        async def request() -> Any:
+            if file_text is None:
+                return await self.channel.send(content)
+            attachment = discord.File(io.BytesIO(file_text.encode("utf-8")), filename="response.md")
+            return await self.channel.send(content, file=attachment)
+
+        msg = await self._paced(request, "send")
+        self.sent += 1
+        return msg
+
+    async def edit(self, message: Any, content: str) -> None:
+        """Edit a message posted through this queue, paced and retried like a send."""
+        await self._paced(lambda: message.edit(content=content), "edit")
+
+    async def delete(self, message: Any) -> None:
+        """Delete a message posted through this queue, paced and retried like a send."""
+        await self._paced(message.delete, "delete")
+
+    async def _paced(self, request: Callable[[], Awaitable[Any]], action: str) -> Any:
+        for attempt in range(_MAX_RETRIES + 1):
+            await self._bucket.acquire()
+            try:
+                return await request()
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == _MAX_RETRIES:
+                    raise
+                retry_after = float(getattr(e, "retry_after", None) or 1.0)
+                self.retried += 1
+                logger.warning("Discord rate limit on channel %s; retrying in %.1fs", action, retry_after)
+                self._bucket.drain_for(retry_after)
+
+
+_deliveries: dict[Any, ChannelDelivery] = {}
+
+
+def _channel_key(channel: Any) -> Any:
+    key = getattr(channel, "id", None)
+    return key if isinstance(key, int) else id(channel)
+
+
+def delivery_for(channel: Any) -> ChannelDelivery:
+    """The delivery queue for `channel` (created on first use, one per channel id)."""
+    key = _channel_key(channel)
+    delivery = _deliveries.get(key)
+    if delivery is None:
+        delivery = ChannelDelivery(channel)
+        _deliveries[key] = delivery
+    else:
+        # fetch_channel() and message.channel hand out different objects for the same
+        # channel; keep one queue and bucket and just send through the latest object.
+        delivery.channel = channel
+    return delivery
+
+
+async def deliver(channel: Any, text: str, *, batchable: bool = True) -> None:
+    """Send text to a channel through its delivery queue and wait until it has been sent."""
+    await delivery_for(channel).submit(text, batchable=batchable)
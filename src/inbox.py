@@ -0,0 +1,264 @@
+"""
+Admission control for incoming Discord requests.
+
+Without it every message starts an agent run immediately, so one chatty channel can
+queue dozens of long agent runs and starve everyone else. Inbox puts a bounded queue
+in front of each channel:
+
+- A channel runs one request at a time. Later requests wait in the channel's inbox
+  and the caller learns its queue position right away.
+- Depth is bounded per channel (INBOX_CHANNEL_MAX_DEPTH) and across all channels
+  (INBOX_GLOBAL_MAX_DEPTH). Only waiting requests count; running ones do not.
+- When a bound is hit, INBOX_FULL_POLICY decides:
+  "reject" turns the new request away;
+  "drop_oldest" drops the oldest waiting request (in the channel if the channel is
+  full, otherwise across all channels) to make room;
+  "merge" appends the new prompt to the newest waiting request in the channel, so
+  both are answered by one run.
+- Bursts are coalesced: users often send one thought as several quick messages. A
+  request waits INBOX_DEBOUNCE_SECONDS after its author's latest message before it
+  starts (never longer than INBOX_DEBOUNCE_MAX_SECONDS after the first one), and
+  follow-ups from the same author in the same channel are folded into it while it
+  has not started yet, whether it is debouncing or still waiting in the inbox.
+
+Like the job scheduler there are no worker tasks: callers wait on a future that is
+resolved when their turn comes. stats() reports depths, wait times and policy
+counters so worker counts can be sized from real traffic.
+"""
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Hashable, Optional
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+POLICY_REJECT = "reject"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_MERGE = "merge"
+_POLICIES = (POLICY_REJECT, POLICY_DROP_OLDEST, POLICY_MERGE)
+
+INBOX_CHANNEL_MAX_DEPTH = int(os.getenv("INBOX_CHANNEL_MAX_DEPTH", "5"))
+INBOX_GLOBAL_MAX_DEPTH = int(os.getenv("INBOX_GLOBAL_MAX_DEPTH", "20"))
+INBOX_FULL_POLICY = os.getenv("INBOX_FULL_POLICY", POLICY_REJECT)
+INBOX_DEBOUNCE_SECONDS = float(os.getenv("INBOX_DEBOUNCE_SECONDS", "1.5"))
+INBOX_DEBOUNCE_MAX_SECONDS = float(os.getenv("INBOX_DEBOUNCE_MAX_SECONDS", "6"))
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_MERGED = "merged"
+STATE_COALESCED = "coalesced"
+STATE_REJECTED = "rejected"
+STATE_DROPPED = "dropped"
+STATE_DONE = "done"
+
+
+@dataclass(eq=False)
+class Ticket:
+    """One admitted (or turned away) request."""
+
+    key: Hashable
+    prompt: str
+    seq: int
+    enqueued: float
+    author: Optional[Hashable] = None
+    state: str = STATE_QUEUED
+    # Time of the latest message folded into this request.
+    last_at: float = 0.0
+    # True until the request actually starts; follow-ups can only join before that.
+    absorbing: bool = True
+    # Position in the channel's inbox when admitted; 0 means it runs immediately.
+    position: int = 0
+    # Number of later requests merged into this one.
+    merged: int = 0
+    merged_into: Optional["Ticket"] = field(default=None, repr=False)
+    turn: Optional[asyncio.Future] = field(default=None, repr=False)
+
+    @property
+    def accepted(self) -> bool:
+        return self.state in (STATE_QUEUED, STATE_RUNNING)
+
+
+class Inbox:
+    """Bounded per-channel and global request queues with a full-queue policy."""
+
+    def __init__(
+        self,
+        channel_max_depth: int = INBOX_CHANNEL_MAX_DEPTH,
+        global_max_depth: int = INBOX_GLOBAL_MAX_DEPTH,
+        policy: str = INBOX_FULL_POLICY,
+        debounce_seconds: float = INBOX_DEBOUNCE_SECONDS,
+        debounce_max_seconds: float = INBOX_DEBOUNCE_MAX_SECONDS,
+    ):
+        if policy not in _POLICIES:
+            logger.warning("Unknown INBOX_FULL_POLICY %r; using %r", policy, POLICY_REJECT)
+            policy = POLICY_REJECT
+        self.channel_max_depth = max(0, channel_max_depth)
+        self.global_max_depth = max(0, global_max_depth)
+        self.policy = policy
+        self.debounce_seconds = max(0.0, debounce_seconds)
+        self.debounce_max_seconds = max(self.debounce_seconds, debounce_max_seconds)
+        self._waiting: dict[Hashable, deque[Ticket]] = {}
+        self._running: dict[Hashable, Ticket] = {}
+        self._seq = itertools.count()
+        self._counters = {"admitted": 0, "queued": 0, "rejected": 0, "dropped": 0, "merged": 0, "coalesced": 0}
+        self._max_global_depth = 0
+        self._waited_total = 0.0
+        self._waited_max = 0.0
+        self._started = 0
+
+    def depth(self, key: Optional[Hashable] = None) -> int:
+        """Waiting requests in one channel, or across all channels when key is None."""
+        if key is not None:
+            return len(self._waiting.get(key, ()))
+        return sum(len(q) for q in self._waiting.values())
+
+    def submit(self, key: Hashable, prompt: str, author: Optional[Hashable] = None) -> Ticket:
+        """Admit a request for channel `key`; check the ticket's state and position for the outcome."""
+        now = time.monotonic()
+        ticket = Ticket(key=key, prompt=prompt, seq=next(self._seq), enqueued=now, author=author, last_at=now)
+        ticket.turn = asyncio.get_running_loop().create_future()
+        waiting = self._waiting.setdefault(key, deque())
+        target = self._coalesce_target(key, author)
+        if target is not None:
+            target.prompt = f"{target.prompt}\n{prompt}"
+            target.last_at = now
+            target.merged += 1
+            ticket.state = STATE_COALESCED
+            ticket.merged_into = target
+            ticket.position = len(waiting) if target.state == STATE_QUEUED else 0
+            self._counters["coalesced"] += 1
+            return ticket
+        if key not in self._running and not waiting:
+            self._counters["admitted"] += 1
+            self._start(ticket)
+            return ticket
+
+        channel_full = len(waiting) >= self.channel_max_depth
+        if channel_full or self.depth() >= self.global_max_depth:
+            if self.policy == POLICY_MERGE and waiting:
+                target = waiting[-1]
+                target.prompt = f"{target.prompt}\n\n{prompt}"
+                target.merged += 1
+                ticket.state = STATE_MERGED
+                ticket.merged_into = target
+                ticket.position = len(waiting)
+                self._counters["merged"] += 1
+                return ticket
+            victim = self._oldest_waiting(key if channel_full else None)
+            if self.policy != POLICY_DROP_OLDEST or victim is None:
+                ticket.state = STATE_REJECTED
+                ticket.position = len(waiting)
+                self._counters["rejected"] += 1
+                logger.info("Inbox full for %s (waiting=%d, global=%d); request rejected", key, len(waiting), self.depth())
+                return ticket
+            self._drop(victim)
+
+        waiting.append(ticket)
+        ticket.position = len(waiting)
+        self._counters["admitted"] += 1
+        self._counters["queued"] += 1
+        self._max_global_depth = max(self._max_global_depth, self.depth())
+        return ticket
+
+    def _coalesce_target(self, key: Hashable, author: Optional[Hashable]) -> Optional[Ticket]:
+        """The not-yet-started request of the same author that a new message should join, if any."""
+        if author is None:
+            return None
+        waiting = self._waiting.get(key)
+        # Only the newest request in the channel may grow, so answers keep message order.
+        newest = waiting[-1] if waiting else self._running.get(key)
+        if newest is not None and newest.absorbing and newest.author == author:
+            return newest
+        return None
+
+    def _oldest_waiting(self, key: Optional[Hashable]) -> Optional[Ticket]:
+        queues = [self._waiting.get(key, deque())] if key is not None else list(self._waiting.values())
+        heads = [q[0] for q in queues if q]
+        return min(heads, key=lambda t: t.seq, default=None)
+
+    def _drop(self, ticket: Ticket) -> None:
+        self._waiting[ticket.key].remove(ticket)
+        ticket.state = STATE_DROPPED
+        self._counters["dropped"] += 1
+        logger.info("Inbox dropped oldest waiting request for %s", ticket.key)
+        if not ticket.turn.done():
+            ticket.turn.set_result(None)
+
+    def _start(self, ticket: Ticket) -> None:
+        waited = time.monotonic() - ticket.enqueued
+        self._waited_total += waited
+        self._waited_max = max(self._waited_max, waited)
+        self._started += 1
+        ticket.state = STATE_RUNNING
+        self._running[ticket.key] = ticket
+        if not ticket.turn.done():
+            ticket.turn.set_result(None)
+
+    def _finish(self, ticket: Ticket) -> None:
+        ticket.state = STATE_DONE
+        if self._running.get(ticket.key) is ticket:
+            del self._running[ticket.key]
+        waiting = self._waiting.get(ticket.key)
+        if waiting:
+            self._start(waiting.popleft())
+        elif waiting is not None:
+            del self._waiting[ticket.key]
+
+    @asynccontextmanager
+    async def turn(self, ticket: Ticket) -> AsyncIterator[bool]:
+        """
+        Wait until the ticket may run and hold the channel for the block.
+        Yields False (without holding anything) if the ticket was dropped while waiting.
+        """
+        try:
+            await ticket.turn
+        except asyncio.CancelledError:
+            waiting = self._waiting.get(ticket.key)
+            if ticket.state == STATE_QUEUED and waiting and ticket in waiting:
+                waiting.remove(ticket)
+            elif ticket.state == STATE_RUNNING:
+                self._finish(ticket)
+            raise
+        if ticket.state != STATE_RUNNING:
+            yield False
+            return
+        try:
+            await self._debounce(ticket)
+            yield True
+        finally:
+            self._finish(ticket)
+
+    async def _debounce(self, ticket: Ticket) -> None:
+        """Hold a started request until its author has been quiet for debounce_seconds."""
+        cap = ticket.enqueued + self.debounce_max_seconds
+        # Without an author nothing can be coalesced, so there is nothing to wait for.
+        while ticket.author is not None:
+            remaining = min(ticket.last_at + self.debounce_seconds, cap) - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        ticket.absorbing = False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "debounce_seconds": self.debounce_seconds,
+            "channel_max_depth": self.channel_max_depth,
+            "global_max_depth": self.global_max_depth,
+            "running": len(self._running),
+            "waiting": self.depth(),
+            "max_waiting": self._max_global_depth,
+            "channels": {str(k): len(q) for k, q in self._waiting.items() if q},
+            "avg_wait": round(self._waited_total / self._started, 3) if self._started else 0.0,
+            "max_wait": round(self._waited_max, 3),
+            **self._counters,
+        }
+
+
+inbox = Inbox()
@@ -0,0 +1,109 @@
+"""
+Registry of in-flight agent runs, for /jobs and /cancel.
+
+comm_service.agent_run registers one Job per agent invocation that actually runs
+(coalesced callers share it). A job records its source, start time, prompt preview
+and, once the agent CLI has been spawned, its PID. Until then it is waiting for a
+job scheduler slot.
+
+cancel() cancels the job's task. ai.generate_response_async kills the agent's whole
+process group on cancellation and the scheduler releases the slot on the way out,
+so queued work starts right away. agent_run turns the cancellation into an
+AgentError for its callers.
+"""
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+PREVIEW_CHARS = 60
+
+
+def _preview(prompt: str) -> str:
+    text = " ".join(prompt.split())
+    return text if len(text) <= PREVIEW_CHARS else text[: PREVIEW_CHARS - 1] + "…"
+
+
+@dataclass(eq=False)
+class Job:
+    id: int
+    source: str
+    preview: str
+    task: asyncio.Task = field(repr=False)
+    started: float = field(default_factory=time.monotonic)
+    pid: Optional[int] = None
+    cancel_requested: bool = False
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def state(self) -> str:
+        return "running" if self.pid is not None else "waiting"
+
+
+class JobRegistry:
+    """In-flight agent runs by id."""
+
+    def __init__(self) -> None:
+        self._jobs: dict[int, Job] = {}
+        self._ids = itertools.count(1)
+
+    def register(self, source: str, prompt: str, task: Optional[asyncio.Task] = None) -> Job:
+        """Track the current (or given) task as a job until finish() is called."""
+        job = Job(
+            id=next(self._ids),
+            source=source,
+            preview=_preview(prompt),
+            task=task or asyncio.current_task(),
+        )
+        self._jobs[job.id] = job
+        return job
+
+    def finish(self, job: Job) -> None:
+        self._jobs.pop(job.id, None)
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        return sorted(self._jobs.values(), key=lambda j: j.id)
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a job; returns False if there is no such job in flight."""
+        job = self._jobs.get(job_id)
+        if job is None or job.task.done():
+            return False
+        job.cancel_requested = True
+        job.task.cancel()
+        logger.info("Cancelling job #%d (source=%s, pid=%s)", job.id, job.source, job.pid)
+        return True
+
+
+def format_elapsed(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{secs:02d}s"
+    return f"{secs}s"
+
+
+def format_jobs(jobs: list[Job]) -> str:
+    if not jobs:
+        return "No agent jobs in flight."
+    lines = []
+    for job in jobs:
+        pid = f"pid={job.pid}" if job.pid is not None else "waiting for a slot"
+        lines.append(f"#{job.id} [{job.source}] {format_elapsed(job.elapsed)} {pid} — {job.preview}")
+    return "\n".join(lines)
+
+
+registry = JobRegistry()
@@ -0,0 +1,167 @@
+"""
+Central scheduler for agent runs.
+
+Every agent invocation (Discord messages, scheduled tasks, the proactive loop) asks
+this scheduler for a slot before spawning the Cursor CLI, so at most
+AGENT_MAX_CONCURRENCY agent processes run at once.
+
+- Priority classes: interactive Discord requests first, then scheduled tasks,
+  then proactive updates (lower number = served first).
+- Aging: every AGENT_AGING_SECONDS a job waits, it is promoted by one class,
+  so low-priority work can't starve behind a steady stream of interactive requests.
+- Optional per-repo serialization (AGENT_SERIALIZE_PER_REPO=1): only one job runs
+  against a given repo path at a time; jobs for a busy repo are skipped (not blocked)
+  so other repos keep moving. Off by default: every run uses the same configured
+  repo, so serializing would cap concurrency at one regardless of AGENT_MAX_CONCURRENCY.
+
+There are no worker tasks: callers wait on a future that is granted when a slot
+frees up, so the scheduler works with whichever event loop the caller runs on.
+"""
+import asyncio
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCHEDULED = 1
+PRIORITY_PROACTIVE = 2
+
+# Maps agent_run sources to priority classes.
+SOURCE_PRIORITIES: dict[str, int] = {
+    "discord": PRIORITY_INTERACTIVE,
+    "scheduler": PRIORITY_SCHEDULED,
+    "proactive": PRIORITY_PROACTIVE,
+}
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "2"))
+AGENT_AGING_SECONDS = float(os.getenv("AGENT_AGING_SECONDS", "300"))
+AGENT_SERIALIZE_PER_REPO = os.getenv("AGENT_SERIALIZE_PER_REPO", "0") == "1"
+
+
+@dataclass
+class _Pending:
+    priority: int
+    repo: Optional[str]
+    enqueued: float
+    seq: int
+    grant: asyncio.Future = field(repr=False)
+
+
+def _repo_key(repo: Optional[str]) -> Optional[str]:
+    return os.path.realpath(repo) if repo else None
+
+
+class AgentScheduler:
+    """Bounded, priority-aware admission for agent runs."""
+
+    def __init__(
+        self,
+        max_workers: int = AGENT_MAX_CONCURRENCY,
+        aging_seconds: float = AGENT_AGING_SECONDS,
+        serialize_per_repo: bool = AGENT_SERIALIZE_PER_REPO,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.aging_seconds = aging_seconds
+        self.serialize_per_repo = serialize_per_repo
+        self._pending: list[_Pending] = []
+        self._running = 0
+        self._busy_repos: set[str] = set()
+        self._seq = itertools.count()
+
+    def _effective_priority(self, entry: _Pending, now: float) -> float:
+        if self.aging_seconds <= 0:
+            return entry.priority
+        return entry.priority - (now - entry.enqueued) / self.aging_seconds
+
+    def _dispatch(self) -> None:
+        """Grant free slots to the best eligible waiting jobs."""
+        now = time.monotonic()
+        while self._running < self.max_workers:
+            eligible = [
+                p for p in self._pending
+                if not p.grant.done() and (p.repo is None or p.repo not in self._busy_repos)
+            ]
+            if not eligible:
+                return
+            best = min(eligible, key=lambda p: (self._effective_priority(p, now), p.seq))
+            self._pending.remove(best)
+            self._running += 1
+            if best.repo is not None:
+                self._busy_repos.add(best.repo)
+            best.grant.set_result(None)
+
+    def _release(self, entry: _Pending) -> None:
+        self._running -= 1
+        if entry.repo is not None:
+            self._busy_repos.discard(entry.repo)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, repo: Optional[str] = None) -> AsyncIterator[None]:
+        """Wait for a run slot (and, with serialize_per_repo, exclusive use of `repo`) and hold it for the block."""
+        entry = _Pending(
+            priority=priority,
+            repo=_repo_key(repo) if self.serialize_per_repo else None,
+            enqueued=time.monotonic(),
+            seq=next(self._seq),
+            grant=asyncio.get_running_loop().create_future(),
+        )
+        self._pending.append(entry)
+        self._dispatch()
+        if not entry.grant.done():
+            logger.info(
+                "Agent job queued (priority=%s, running=%d, pending=%d)",
+                priority, self._running, len(self._pending),
+            )
+        try:
+            await entry.grant
+        except asyncio.CancelledError:
+            if entry in self._pending:
+                self._pending.remove(entry)
+            elif entry.grant.done() and not entry.grant.cancelled():
+                # Granted and cancelled in the same tick: hand the slot back.
+                self._release(entry)
+            raise
+        waited = time.monotonic() - entry.enqueued
+        if waited >= 1:
+            logger.info("Agent job started after waiting %.1fs (priority=%s)", waited, priority)
+        try:
+            yield
+        finally:
+            self._release(entry)
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        *,
+        priority: int = PRIORITY_INTERACTIVE,
+        repo: Optional[str] = None,
+    ) -> T:
+        """Run `factory()` once a slot is available. The coroutine is only created after admission."""
+        async with self.slot(priority, repo):
+            return await factory()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "running": self._running,
+            "pending": len(self._pending),
+            "busy_repos": sorted(self._busy_repos),
+        }
+
+
+scheduler = AgentScheduler()
+
+
+def priority_for_source(source: str) -> int:
+    """Return the priority class for an agent_run source (unknown sources run last)."""
+    return SOURCE_PRIORITIES.get(source, PRIORITY_PROACTIVE)
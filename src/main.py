@@ -9,10 +9,24 @@ from apscheduler.triggers.cron import CronTrigger
 
 from src.comm_service import agent_run, listen_to_discord, start_discord_client
 from src.logs import get_logger
-from src.memory import reset_memory
+from src.watchdog import start_watchdog_if_enabled
+from src.config_store import get_repo_path
+from src.memory import (
+    acompact_all_stores,
+    compact_all_stores,
+    compact_store,
+    namespace_for,
+    reset_all_memory,
+    reset_memory,
+    restore_memory,
+    snapshot_memory,
+)
 
 logger = get_logger(__name__)
 
+# Optional cron expression (minute hour day month day_of_week) for periodic memory store compaction.
+MEMORY_COMPACT_SCHEDULE = os.getenv("MEMORY_COMPACT_SCHEDULE", "")
+
 app = typer.Typer()
 
 os.makedirs(".cursor", exist_ok=True)
@@ -49,11 +63,23 @@ async def run_task(task_name: str):
             logger.error(f"Empty task content for {task_name}")
             return
         
-        await agent_run(task_content)
+        await agent_run(
+            task_content,
+            source="scheduler",
+            namespace=namespace_for(task=task_name, repo_path=get_repo_path()),
+        )
         logger.info(f"Completed scheduled task: {task_name}")
     except Exception as e:
         logger.error(f"Error running task {task_name}: {e}", exc_info=True)
 
+async def run_memory_compaction():
+    """Compact every memory store off the event loop (scheduled job)."""
+    try:
+        reports = await acompact_all_stores()
+        logger.info(f"Memory compaction reclaimed {sum(r.reclaimed for r in reports)} bytes")
+    except Exception as e:
+        logger.error(f"Memory compaction failed: {e}", exc_info=True)
+
 def parse_cron_expression(cron_str: str) -> dict:
     """Parse cron expression (minute hour day month day_of_week) into APScheduler format
     
@@ -98,12 +124,25 @@ async def _run_scheduler():
     config = load_task_config()
     tasks = config.get("tasks", {})
     
-    if not tasks:
+    if not tasks and not MEMORY_COMPACT_SCHEDULE:
         logger.warning("No tasks found in configuration")
         return
     
     # Create async scheduler
     scheduler_instance = AsyncIOScheduler()
+
+    if MEMORY_COMPACT_SCHEDULE:
+        try:
+            scheduler_instance.add_job(
+                run_memory_compaction,
+                trigger=CronTrigger(**parse_cron_expression(MEMORY_COMPACT_SCHEDULE)),
+                id="memory-compact",
+                name="memory-compact - compact, vacuum and verify memory stores",
+                replace_existing=True,
+            )
+            logger.info(f"Scheduled memory store compaction: {MEMORY_COMPACT_SCHEDULE}")
+        except Exception as e:
+            logger.error(f"Failed to schedule memory compaction: {e}", exc_info=True)
     
     # Schedule each task
     for task_name, task_config in tasks.items():
@@ -153,6 +192,9 @@ def scheduler():
 async def _run_all():
     """Run both Discord client and scheduler concurrently"""
     logger.info("Starting fullauto services...")
+
+    # Opt-in (LOOP_WATCHDOG=1): log event-loop stalls with the stack of the blocking call.
+    watchdog = start_watchdog_if_enabled()
     
     # Create tasks for both services
     discord_task = asyncio.create_task(start_discord_client())
@@ -172,6 +214,10 @@ async def _run_all():
         except Exception:
             pass
         logger.info("Services stopped.")
+    finally:
+        if watchdog is not None:
+            logger.info(f"Loop watchdog stats: {watchdog.stats()}")
+            watchdog.stop()
 
 @app.command()
 def run():
@@ -179,11 +225,52 @@ def run():
     asyncio.run(_run_all())
 
 @app.command()
-def reset_memory_cmd():
-    """Reset/clear all stored memory (conversation history)."""
+def reset_memory_cmd(
+    namespace: str = typer.Option(None, "--namespace", help="Only reset this memory namespace (default: all)."),
+):
+    """Reset/clear stored memory (conversation history)."""
     logger.info("Resetting memory...")
-    reset_memory()
+    if namespace:
+        reset_memory(namespace)
+    else:
+        reset_all_memory()
     logger.info("Memory reset completed.")
 
+@app.command()
+def memory_compact(
+    namespace: str = typer.Option(None, "--namespace", help="Only compact this memory namespace (default: all)."),
+):
+    """Rewrite memory stores into a minimal layout, verify every entry decodes and report space reclaimed."""
+    reports = [compact_store(namespace)] if namespace else compact_all_stores()
+    for r in reports:
+        status = "ok" if r.ok else "PROBLEMS"
+        typer.echo(
+            f"{r.namespace}: {status} entries={r.entries} re-encoded={r.reencoded} "
+            f"undecodable={r.undecodable} legacy-files-removed={r.legacy_files_removed} "
+            f"size={r.size_before}->{r.size_after} reclaimed={r.reclaimed}"
+        )
+        for problem in r.integrity_problems:
+            typer.echo(f"  integrity: {problem}")
+    if not all(r.ok for r in reports):
+        raise typer.Exit(code=1)
+
+@app.command()
+def memory_snapshot(
+    path: Path = typer.Argument(..., help="File to write the snapshot to."),
+    namespace: str = typer.Option("default", "--namespace", help="Memory namespace to snapshot."),
+):
+    """Write a consistent snapshot of a memory namespace to a single file."""
+    snapshot_memory(path, namespace)
+    typer.echo(f"Snapshot of {namespace} written to {path}")
+
+@app.command()
+def memory_restore(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="Snapshot file to restore."),
+    namespace: str = typer.Option("default", "--namespace", help="Memory namespace to restore into."),
+):
+    """Replace a memory namespace with a snapshot written by memory-snapshot."""
+    restore_memory(path, namespace)
+    typer.echo(f"Restored {namespace} from {path}")
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,62 +1,122 @@
 """
-Persistent memory manager using FIFO queue with automatic summarization.
+Persistent memory manager with automatic summarization.
 
 This module provides a disk-backed memory system that maintains conversation context
-across agent sessions. Memory is stored in a FIFO (First-In-First-Out) queue that
-persists to disk at `/root/.fullauto/memory`.
+across agent sessions. Entries are stored in order in a pluggable backend
+(see src.memory_store; SQLite in WAL mode by default) under `FULLAUTO_HOME/memory`.
 
 How it works:
-1. **Message Storage**: Each agent interaction (user message + agent response) is
-   stored as a single entry in the queue. Messages are automatically persisted to disk.
+1. **Message Storage**: Each agent interaction is stored as a user entry and an
+   assistant entry. Entries are committed to disk as they are added.
 
-2. **Automatic Summarization**: When the queue exceeds MAX_MESSAGES_BEFORE_SUMMARY (5),
-   all messages are extracted and sent to the agent for summarization. The agent
-   creates a concise summary that captures key facts and decisions.
+2. **Automatic Summarization**: When raw entries exceed MAX_ENTRIES_BEFORE_SUMMARY (5),
+   a background compaction worker folds the oldest raw chunk (never the newest
+   MEMORY_KEEP_RECENT_ENTRIES) into a level-1 summary without holding the memory lock,
+   so writers return immediately. When level-1 summaries exceed their own budget they
+   are merged into a single rolling level-2 summary. Every step's input is bounded by
+   MEMORY_SUMMARY_INPUT_CHARS, so summarization latency stays flat as history grows.
+   MEMORY_SUMMARIZER picks the agent, the local extractive summarizer
+   (src.summarizer) or both ("auto"); the extractive one is the fallback on agent failure.
 
-3. **Memory Replacement**: The original messages are replaced with a single summary
-   entry, keeping memory compact while preserving important context.
+3. **Memory Replacement**: The folded entries are replaced with their summary in one
+   transaction; turns added while the agent was summarizing are kept after it.
 
-4. **Persistence**: Memory persists across agent restarts. When the agent starts,
-   previous memory is automatically loaded from disk.
+4. **Archive and Retrieval**: Every raw turn is also written to an append-only archive
+   in the same commit, and search_archive() ranks archived turns against a query
+   with a local BM25 index (src.memory_index), so details folded into summaries
+   can still be recalled.
 
-5. **Thread/Process Safety**: Uses file locking to prevent race conditions when
-   multiple processes access memory simultaneously.
+5. **Persistence**: Memory persists across agent restarts. The first start after an
+   upgrade migrates the legacy persistqueue store found in the same directory.
 
-Example flow:
-    t=0: [msg_1, msg_2, msg_3, msg_4]           # 4 messages
-    t=1: [msg_1, msg_2, msg_3, msg_4, msg_5]   # 5 messages (at threshold)
-    t=2: [summary_of_1_to_5]                    # Summarized to 1 entry
-    t=3: [summary_of_1_to_5, msg_6]            # New message added
-    t=4: [summary_of_1_to_5, msg_6, msg_7, ...] # Continues...
+6. **Namespaces**: Each Discord channel, scheduled task and the proactive loop get
+   their own namespace per repo (see namespace_for) with their own store file and
+   lock, so unrelated conversations neither share context nor wait on each other.
+
+7. **Read Cache**: Decoded and rendered entries are cached in-process per namespace
+   and reused until the store's generation counter (bumped by every write, from
+   any process) changes, so a warm read costs one integer read.
+
+8. **Novelty Filter**: add_turn compares a turn with the recent turns of the same
+   source (content hash + SimHash, see src.novelty) and, depending on the source's
+   policy, drops it or merges it into the earlier turn instead of storing it, so
+   repeated "No updates." ticks never trigger summarization.
+
+9. **Async API**: Coroutines use the a* variants (alist_messages, aadd_turn,
+   areset_memory, ...), which run the blocking work (file locks, disk I/O) on a
+   small dedicated executor so the event loop keeps serving Discord heartbeats.
+
+10. **Thread/Process Safety**: Uses shared/exclusive file locking (flock on a
+   per-namespace lock file, one descriptor per acquisition, so it works across
+   threads and processes). Readers share the lock; appends, compaction swaps and
+   resets take it exclusively. A reader that cannot get the shared lock within
+   MEMORY_READ_LOCK_TIMEOUT_SECONDS reads the last committed SQLite snapshot instead
+   of raising. Lock waits are recorded in lock_stats().
+
+Example flow (threshold 5, keep 2 recent):
+    t=0: [msg_1, ..., msg_5]                      # 5 raw entries (at threshold)
+    t=1: [msg_1, ..., msg_6]                      # over threshold
+    t=2: [L1(1-4), msg_5, msg_6]                  # oldest chunk folded, recent kept verbatim
+    t=3: [L1(1-4), L1(5-8), L1(9-12), L1(13-16), msg_17, msg_18]
+    t=4: [L2(1-16), msg_17, msg_18]               # level-1 summaries merged into level 2
 
 Benefits:
 - Maintains context across multiple interactions
 - Prevents memory from growing unbounded
 - Preserves important information through summarization
 - Survives agent restarts and system reboots
-- Thread-safe and process-safe with file locking
+- Thread-safe and process-safe with shared/exclusive file locking
 """
+import asyncio
+import dataclasses
+import functools
+import hashlib
 import json
 import os
 import re
+import struct
+import threading
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Optional, Tuple
+from typing import Any, Iterable, Optional, Tuple
 
 import persistqueue
 import portalocker
 
+import src.novelty as novelty
 from src.ai import generate_response
 from src.config_store import get_repo_path
 from src.logs import get_logger
+from src.memory_index import LexicalIndex
+from src.memory_store import DEFAULT_NAMESPACE, MemoryStore, SqliteMemoryStore, StoredEntry
+from src.summarizer import extractive_summary
 
 logger = get_logger(__name__)
 
-# Prefix to distinguish structured JSON entries from legacy plain strings.
+# Prefix to distinguish structured JSON entries (v1) from legacy plain strings.
 _STRUCTURED_PREFIX = "__fullauto_msg__:"
 
+# Compact binary record (v2): fixed header, then the body (zlib-compressed above a threshold).
+#   header: magic, version, flags, role code, kind code, ts (float64),
+#           meta["tokens"] (u32, all ones if absent), meta["source"] code
+#   body:   [u8 len + role]  [u8 len + kind]  (only for roles/kinds without a code)
+#           u32 content length, UTF-8 content, compact JSON of the remaining meta (absent if empty)
+_RECORD_MAGIC = 0xFA
+_RECORD_VERSION = 2
+_RECORD_HEADER = struct.Struct("!BBBBBdIB")
+_RECORD_LEN = struct.Struct("!I")
+_FLAG_ZLIB = 0x01
+_RECORD_ROLES = ("system", "user", "assistant")
+_RECORD_KINDS = ("turn", "summary", "note")
+_RECORD_SOURCES = ("discord", "scheduler", "proactive")
+_CUSTOM_CODE = 0xFF
+_NO_TOKENS = 0xFFFFFFFF
+MEMORY_COMPRESS_MIN_BYTES = int(os.getenv("MEMORY_COMPRESS_MIN_BYTES", "2048"))
+
 
 @dataclass(frozen=True)
 class Message:
@@ -78,14 +138,41 @@ class Message:
 FULLAUTO_HOME = Path(os.getenv("FULLAUTO_HOME", str(Path.home() / ".fullauto"))).expanduser()
 QUEUE_DIR = FULLAUTO_HOME / "memory"
 QUEUE_DIR.mkdir(parents=True, exist_ok=True)
-queue = persistqueue.Queue(str(QUEUE_DIR))
+
+# Storage backend: "sqlite" (default). The legacy persistqueue store is only read for migration.
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "sqlite")
+SQLITE_FILENAME = "memory.sqlite3"
+_MIGRATION_META_KEY = "migrated_persistqueue"
 
 # Lock file for synchronizing access across processes
 LOCK_FILE = QUEUE_DIR / ".lock"
+MEMORY_WRITE_LOCK_TIMEOUT_SECONDS = float(os.getenv("MEMORY_WRITE_LOCK_TIMEOUT_SECONDS", "30"))
+MEMORY_READ_LOCK_TIMEOUT_SECONDS = float(os.getenv("MEMORY_READ_LOCK_TIMEOUT_SECONDS", "5"))
+_LOCK_CHECK_INTERVAL = 0.02
 MAX_MESSAGES_BEFORE_SUMMARY = 5  # legacy name; counts queue entries
 MAX_ENTRIES_BEFORE_SUMMARY = int(os.getenv("MAX_MEMORY_ENTRIES_BEFORE_SUMMARY", str(MAX_MESSAGES_BEFORE_SUMMARY)))
 MAX_ENTRY_CHARS = int(os.getenv("MAX_MEMORY_ENTRY_CHARS", "8000"))
 
+# Tiered compaction: raw turns -> level-1 summaries -> one rolling level-2 summary.
+# The newest raw entries are never folded, so recent turns keep their full detail.
+MEMORY_KEEP_RECENT_ENTRIES = int(os.getenv("MEMORY_KEEP_RECENT_ENTRIES", "2"))
+# Bound on the rendered text sent to one summarization, so latency stays flat as history grows.
+MEMORY_SUMMARY_INPUT_CHARS = int(os.getenv("MEMORY_SUMMARY_INPUT_CHARS", "16000"))
+# Level-1 summaries are merged into the level-2 summary once they exceed either budget.
+MEMORY_MAX_LEVEL1_SUMMARIES = int(os.getenv("MEMORY_MAX_LEVEL1_SUMMARIES", "3"))
+MEMORY_LEVEL1_BUDGET_CHARS = int(os.getenv("MEMORY_LEVEL1_BUDGET_CHARS", "4000"))
+# Summarizer: "agent" (Cursor CLI), "extractive" (local, milliseconds) or "auto"
+# (extractive for routine level-1 folds, agent for level-2 merges). The extractive
+# summarizer is also the fallback when the agent fails or exceeds its timeout.
+MEMORY_SUMMARIZER = os.getenv("MEMORY_SUMMARIZER", "auto").strip().lower()
+MEMORY_AGENT_SUMMARY_TIMEOUT_SECONDS = float(os.getenv("MEMORY_AGENT_SUMMARY_TIMEOUT_SECONDS", "300"))
+# Safety bound on fold/merge steps per compaction run.
+_MAX_COMPACTION_STEPS = 4
+
+# Raw turns are also archived (append-only) and indexed for lexical retrieval.
+MEMORY_RETRIEVAL_TOP_K = int(os.getenv("MEMORY_RETRIEVAL_TOP_K", "3"))
+_index = LexicalIndex()
+
 
 _SECRET_PATTERNS: list[tuple[re.Pattern[str], str]] = [
     # Common env-var style secrets
@@ -119,11 +206,93 @@ def _encode_message(msg: Message) -> str:
     return _STRUCTURED_PREFIX + json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
 
 
+def _code_for(value: str, table: tuple[str, ...]) -> int:
+    try:
+        return table.index(value)
+    except ValueError:
+        return _CUSTOM_CODE
+
+
+def _encode_record(msg: Message) -> bytes:
+    """Encode a message as a compact v2 record."""
+    role_code = _code_for(msg.role, _RECORD_ROLES)
+    kind_code = _code_for(msg.kind, _RECORD_KINDS)
+    meta = dict(msg.meta or {})
+    tokens = meta.get("tokens")
+    if type(tokens) is int and 0 <= tokens < _NO_TOKENS:
+        del meta["tokens"]
+    else:
+        tokens = _NO_TOKENS
+    source_code = _code_for(meta.get("source"), _RECORD_SOURCES)
+    if source_code != _CUSTOM_CODE:
+        del meta["source"]
+    parts: list[bytes] = []
+    for code, value in ((role_code, msg.role), (kind_code, msg.kind)):
+        if code == _CUSTOM_CODE:
+            raw = value.encode("utf-8")[:255]
+            parts.append(bytes([len(raw)]) + raw)
+    content = msg.content.encode("utf-8")
+    parts.append(_RECORD_LEN.pack(len(content)))
+    parts.append(content)
+    if meta:
+        parts.append(json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    body = b"".join(parts)
+    flags = 0
+    if len(body) >= MEMORY_COMPRESS_MIN_BYTES:
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body):
+            body, flags = packed, _FLAG_ZLIB
+    header = _RECORD_HEADER.pack(
+        _RECORD_MAGIC, _RECORD_VERSION, flags, role_code, kind_code, msg.ts, tokens, source_code
+    )
+    return header + body
+
+
+def _decode_record(record: bytes) -> Message:
+    """Decode a v2 record; raises ValueError if it is malformed."""
+    try:
+        magic, version, flags, role_code, kind_code, ts, tokens, source_code = _RECORD_HEADER.unpack_from(record)
+        if magic != _RECORD_MAGIC or version != _RECORD_VERSION:
+            raise ValueError(f"not a v{_RECORD_VERSION} memory record")
+        body = record[_RECORD_HEADER.size:]
+        if flags & _FLAG_ZLIB:
+            body = zlib.decompress(body)
+        pos = 0
+        if role_code == _CUSTOM_CODE:
+            role = body[pos + 1:pos + 1 + body[pos]].decode("utf-8")
+            pos += 1 + body[pos]
+        else:
+            role = _RECORD_ROLES[role_code]
+        if kind_code == _CUSTOM_CODE:
+            kind = body[pos + 1:pos + 1 + body[pos]].decode("utf-8")
+            pos += 1 + body[pos]
+        else:
+            kind = _RECORD_KINDS[kind_code]
+        (size,) = _RECORD_LEN.unpack_from(body, pos)
+        pos += _RECORD_LEN.size
+        content = body[pos:pos + size].decode("utf-8")
+        meta = json.loads(body[pos + size:]) if len(body) > pos + size else {}
+    except (struct.error, IndexError, UnicodeDecodeError, zlib.error, json.JSONDecodeError) as e:
+        raise ValueError(f"malformed memory record: {e}") from e
+    if not isinstance(meta, dict):
+        meta = {}
+    if source_code != _CUSTOM_CODE:
+        meta["source"] = _RECORD_SOURCES[source_code]
+    if tokens != _NO_TOKENS:
+        meta["tokens"] = tokens
+    return Message(role=role, content=content, ts=ts, kind=kind, meta=meta)
+
+
 def _try_decode_item(item: Any) -> Tuple[Optional[Message], Optional[str]]:
     """
-    Decode a queue item.
+    Decode a stored item: a v2 binary record, a v1 JSON-prefixed string or a legacy plain string.
     Returns (Message|None, legacy_text|None).
     """
+    if isinstance(item, (bytes, bytearray, memoryview)):
+        try:
+            return _decode_record(item if isinstance(item, bytes) else bytes(item)), None
+        except ValueError:
+            return None, bytes(item).decode("utf-8", errors="replace")
     if isinstance(item, str) and item.startswith(_STRUCTURED_PREFIX):
         raw = item[len(_STRUCTURED_PREFIX) :]
         try:
@@ -143,7 +312,15 @@ def _try_decode_item(item: Any) -> Tuple[Optional[Message], Optional[str]]:
     return None, str(item)
 
 
-def _render_for_context(msg: Message) -> str:
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token, never fewer than the word count)."""
+    if not text:
+        return 0
+    return max((len(text) + 3) // 4, len(text.split()))
+
+
+def render_for_context(msg: Message) -> str:
+    """Render a message the way it appears in the agent prompt."""
     if msg.kind == "summary":
         return f"Summary: {msg.content}".strip()
     if msg.role == "user":
@@ -153,70 +330,469 @@ def _render_for_context(msg: Message) -> str:
     return msg.content.strip()
 
 
-def _summarize_items(items: list[Any]) -> str:
+def _to_stored(msg: Message) -> StoredEntry:
+    """Encode a message for the store, recording its rendered token estimate in meta["tokens"] once."""
+    meta = dict(msg.meta or {})
+    if "tokens" not in meta:
+        meta["tokens"] = estimate_tokens(render_for_context(msg))
+    msg = dataclasses.replace(msg, meta=meta)
+    return StoredEntry(ts=msg.ts, kind=msg.kind, role=msg.role, payload=_encode_record(msg))
+
+
+def _decode_entry(entry: StoredEntry) -> Message:
+    """Decode a stored entry; legacy plain strings become system notes."""
+    msg, legacy = _try_decode_item(entry.payload)
+    if msg is not None:
+        return msg
+    return Message(role="system", content=(legacy or "").strip(), ts=entry.ts, kind="note")
+
+
+def _summary_level(msg: Message) -> int:
+    """0 for raw entries; 1/2 for summaries (summaries written before tiering count as level 1)."""
+    if msg.kind != "summary":
+        return 0
+    try:
+        return int((msg.meta or {}).get("level", 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _summarize_items(items: list[StoredEntry], level: int = 1) -> str:
     rendered: list[str] = []
+    for it in items:
+        text = render_for_context(_decode_entry(it))
+        if text:
+            rendered.append(text)
+    return _summarize_messages(rendered, level=level)
+
+
+_BACKENDS = {
+    "sqlite": lambda directory: SqliteMemoryStore(directory / SQLITE_FILENAME),
+}
+
+
+def _migrate_persistqueue(directory: Path, target: MemoryStore) -> int:
+    """
+    One-shot import of the legacy persistqueue store in `directory` into `target`.
+    Structured (_STRUCTURED_PREFIX) and plain-string items are both kept, in order.
+    The legacy queue is read without consuming it; the entries and the migration marker
+    are committed together, and only then are the legacy queue files deleted.
+    """
+    if target.get_meta(_MIGRATION_META_KEY) is not None:
+        return 0
+    if not (directory / "info").exists():
+        target.set_meta(_MIGRATION_META_KEY, str(time.time()))
+        return 0
+    # autosave=False: reads are not persisted until task_done(), which is never called.
+    legacy_queue = persistqueue.Queue(str(directory), autosave=False)
+    items: list[Any] = []
+    try:
+        while True:
+            items.append(legacy_queue.get_nowait())
+    except Exception:
+        pass
+    del legacy_queue
+    entries: list[StoredEntry] = []
+    archived: list[tuple[float, str]] = []
     for it in items:
         msg, legacy = _try_decode_item(it)
-        if msg is not None:
-            rendered.append(_render_for_context(msg))
-        elif legacy is not None and legacy.strip():
-            rendered.append(legacy.strip())
-    return _summarize_messages(rendered)
+        if msg is None:
+            if legacy is None or not legacy.strip():
+                continue
+            msg = Message(role="system", content=legacy.strip(), ts=time.time(), kind="note")
+        entries.append(_to_stored(msg))
+        if msg.kind != "summary":
+            archived.append((msg.ts, render_for_context(msg)))
+    target.append(DEFAULT_NAMESPACE, entries, archive=archived, meta={_MIGRATION_META_KEY: str(time.time())})
+    logger.info("Migrated %d legacy persistqueue entries to %s memory store", len(entries), MEMORY_BACKEND)
+    _remove_migrated_queue_files(directory, target)
+    return len(entries)
+
+
+def open_store(directory: Path = QUEUE_DIR, backend: str = MEMORY_BACKEND) -> MemoryStore:
+    """Open the configured memory backend in `directory`, migrating legacy data on first use."""
+    factory = _BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f"Unknown MEMORY_BACKEND: {backend!r} (expected one of {sorted(_BACKENDS)})")
+    directory.mkdir(parents=True, exist_ok=True)
+    opened = factory(directory)
+    try:
+        with portalocker.Lock(str(directory / ".lock"), timeout=30):
+            _migrate_persistqueue(directory, opened)
+    except BaseException:
+        opened.close()
+        raise
+    return opened
+
+
+store = open_store()
+
+# Non-default namespaces live under QUEUE_DIR/namespaces, opened on first use: name -> (store, index).
+_namespaces: dict[str, tuple[MemoryStore, LexicalIndex]] = {}
+_namespaces_lock = threading.Lock()
+_NAMESPACE_META_KEY = "namespace"
+
+
+@dataclass
+class _Namespace:
+    """Storage, retrieval index and lock file of one memory namespace."""
+
+    name: str
+    store: MemoryStore
+    index: LexicalIndex
+    lock_file: Path
+
+
+def _namespace_dir(name: str) -> Path:
+    return QUEUE_DIR / "namespaces" / re.sub(r"[^A-Za-z0-9_.@-]", "_", name)
+
+
+def _ns(name: str = DEFAULT_NAMESPACE) -> _Namespace:
+    """Resolve a namespace; each has its own store file and lock so namespaces never contend."""
+    if name == DEFAULT_NAMESPACE:
+        return _Namespace(name, store, _index, LOCK_FILE)
+    with _namespaces_lock:
+        opened = _namespaces.get(name)
+        if opened is None:
+            ns_store = open_store(_namespace_dir(name))
+            if ns_store.get_meta(_NAMESPACE_META_KEY) is None:
+                ns_store.set_meta(_NAMESPACE_META_KEY, name)
+            opened = (ns_store, LexicalIndex())
+            _namespaces[name] = opened
+    return _Namespace(name, opened[0], opened[1], _namespace_dir(name) / ".lock")
+
+
+def _repo_tag(repo_path: str) -> str:
+    real = os.path.realpath(repo_path)
+    return f"{os.path.basename(real) or 'root'}-{hashlib.sha1(real.encode('utf-8')).hexdigest()[:8]}"
+
+
+def namespace_for(
+    *,
+    channel_id: Optional[int] = None,
+    task: Optional[str] = None,
+    source: Optional[str] = None,
+    repo_path: Optional[str] = None,
+) -> str:
+    """
+    Derive a memory namespace.
+    Discord channels, scheduled tasks and other sources (e.g. the proactive loop) are
+    all scoped to the repo they run against, so switching repos (/cwd) starts fresh
+    context instead of carrying another repo's history into the prompt.
+    """
+    repo = _repo_tag(repo_path or get_repo_path())
+    if channel_id is not None:
+        return f"discord-{channel_id}@{repo}"
+    if task:
+        return f"task-{task}@{repo}"
+    if source:
+        return f"{source}@{repo}"
+    return DEFAULT_NAMESPACE
+
+
+def list_namespaces() -> list[str]:
+    """Return the default namespace plus every namespace that has storage on disk."""
+    names = [DEFAULT_NAMESPACE]
+    root = QUEUE_DIR / "namespaces"
+    if root.is_dir():
+        for d in sorted(root.iterdir()):
+            if not (d / SQLITE_FILENAME).exists():
+                continue
+            ns_store = open_store(d)
+            try:
+                name = ns_store.get_meta(_NAMESPACE_META_KEY)
+            finally:
+                ns_store.close()
+            if name:
+                names.append(name)
+    return names
+
+
+class _LockMetrics:
+    """Wait-time counters for the memory locks, per mode ("shared" / "exclusive")."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def record(self, mode: str, waited: float, *, timed_out: bool = False) -> None:
+        with self._lock:
+            st = self._stats.setdefault(
+                mode, {"acquired": 0, "timeouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            )
+            st["timeouts" if timed_out else "acquired"] += 1
+            st["wait_seconds"] += waited
+            st["max_wait_seconds"] = max(st["max_wait_seconds"], waited)
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {mode: dict(st) for mode, st in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+_lock_metrics = _LockMetrics()
+
+
+def lock_stats() -> dict[str, dict[str, float]]:
+    """Memory lock wait metrics: acquisitions, timeouts and total/max wait seconds per mode."""
+    return _lock_metrics.snapshot()
+
+
+def _lock(ns: Optional[_Namespace], *, shared: bool, timeout: float) -> portalocker.Lock:
+    lock_file = ns.lock_file if ns is not None else LOCK_FILE
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    flags = portalocker.LockFlags.SHARED if shared else portalocker.LockFlags.EXCLUSIVE
+    return portalocker.Lock(
+        str(lock_file),
+        timeout=timeout,
+        check_interval=_LOCK_CHECK_INTERVAL,
+        flags=flags | portalocker.LockFlags.NON_BLOCKING,
+    )
 
 
 @contextmanager
-def _memory_lock():
-    """Acquire an exclusive lock on the memory queue to prevent race conditions."""
-    LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with portalocker.Lock(str(LOCK_FILE), timeout=30):
+def _memory_lock(ns: Optional[_Namespace] = None):
+    """Acquire an exclusive (writer) lock on one namespace's store to prevent race conditions."""
+    lock = _lock(ns, shared=False, timeout=MEMORY_WRITE_LOCK_TIMEOUT_SECONDS)
+    started = time.monotonic()
+    try:
+        lock.acquire()
+    except portalocker.LockException:
+        _lock_metrics.record("exclusive", time.monotonic() - started, timed_out=True)
+        raise
+    _lock_metrics.record("exclusive", time.monotonic() - started)
+    try:
         yield
+    finally:
+        lock.release()
 
 
-def _summarize_messages(messages: list[str]) -> str:
-    """Use the agent to summarize the given messages into one concise summary."""
+@contextmanager
+def _memory_read_lock(ns: Optional[_Namespace] = None):
+    """
+    Acquire a shared (reader) lock; readers only wait for writers, never for each other.
+    On timeout the caller proceeds unlocked: every write is a single SQLite transaction,
+    so it reads the last committed (possibly stale) but consistent snapshot.
+    """
+    lock = _lock(ns, shared=True, timeout=MEMORY_READ_LOCK_TIMEOUT_SECONDS)
+    started = time.monotonic()
+    try:
+        lock.acquire()
+        acquired = True
+    except portalocker.LockException:
+        acquired = False
+    waited = time.monotonic() - started
+    _lock_metrics.record("shared", waited, timed_out=not acquired)
+    if not acquired:
+        logger.warning("Memory read lock timed out after %.1fs; serving last committed snapshot", waited)
+    try:
+        yield
+    finally:
+        if acquired:
+            lock.release()
+
+
+def _agent_summary(messages: list[str], level: int) -> str:
+    """Use the agent to summarize the given messages (level 1) or merge summaries (level 2)."""
     combined = "\n".join(f"- {m}" for m in messages)
-    prompt = (
-        "Summarize the following messages into one short, concise summary paragraph. "
-        "Keep only the main facts and decisions. Output only the summary text, no preamble.\n\n"
-        f"{combined}"
+    if level >= 2:
+        instruction = (
+            "Merge the following summaries of an ongoing conversation into one short, concise summary paragraph, "
+            "oldest first. Keep only the main facts and decisions. Output only the summary text, no preamble."
+        )
+    else:
+        instruction = (
+            "Summarize the following messages into one short, concise summary paragraph. "
+            "Keep only the main facts and decisions. Output only the summary text, no preamble."
+        )
+    return generate_response(f"{instruction}\n\n{combined}", timeout=MEMORY_AGENT_SUMMARY_TIMEOUT_SECONDS)
+
+
+def _summarize_messages(messages: list[str], level: int = 1) -> str:
+    """
+    Summarize with the configured MEMORY_SUMMARIZER. The local extractive summarizer
+    also stands in whenever the agent fails, times out or returns nothing.
+    """
+    if MEMORY_SUMMARIZER == "extractive" or (MEMORY_SUMMARIZER == "auto" and level < 2):
+        return extractive_summary(messages)
+    try:
+        summary = (_agent_summary(messages, level) or "").strip()
+    except Exception:
+        logger.exception("Agent summarization failed; using the extractive summarizer")
+        summary = ""
+    if not summary:
+        summary = extractive_summary(messages)
+    return summary
+
+
+def _bounded_chunk(entries: list[tuple[StoredEntry, Message]], budget: int) -> list[tuple[StoredEntry, Message]]:
+    """Oldest-first prefix of `entries` whose content fits in `budget` chars (always at least one entry)."""
+    chunk: list[tuple[StoredEntry, Message]] = []
+    used = 0
+    for pair in entries:
+        size = len(pair[1].content)
+        if chunk and used + size > budget:
+            break
+        chunk.append(pair)
+        used += size
+    return chunk
+
+
+def _plan_compaction(items: list[StoredEntry]) -> Optional[tuple[list[StoredEntry], int]]:
+    """
+    Decide the next compaction step: (entries to fold, target summary level), or None.
+    1. Too many raw entries: fold the oldest raw chunk (never the last MEMORY_KEEP_RECENT_ENTRIES) into a level-1 summary.
+    2. Level-1 summaries over budget: merge the level-2 summary and the oldest level-1 chunk into a new level-2 summary.
+    """
+    decoded = [(e, _decode_entry(e)) for e in items]
+    raw = [p for p in decoded if _summary_level(p[1]) == 0]
+    if len(raw) > MAX_ENTRIES_BEFORE_SUMMARY:
+        foldable = raw[: len(raw) - MEMORY_KEEP_RECENT_ENTRIES] if MEMORY_KEEP_RECENT_ENTRIES > 0 else raw
+        if foldable:
+            return [e for e, _ in _bounded_chunk(foldable, MEMORY_SUMMARY_INPUT_CHARS)], 1
+    level1 = [p for p in decoded if _summary_level(p[1]) == 1]
+    level1_chars = sum(len(m.content) for _, m in level1)
+    if len(level1) > MEMORY_MAX_LEVEL1_SUMMARIES or (len(level1) > 1 and level1_chars > MEMORY_LEVEL1_BUDGET_CHARS):
+        level2 = [e for e, m in decoded if _summary_level(m) >= 2]
+        return level2 + [e for e, _ in _bounded_chunk(level1, MEMORY_SUMMARY_INPUT_CHARS)], 2
+    return None
+
+
+def _compact_step(namespace: str = DEFAULT_NAMESPACE) -> Optional[bool]:
+    """
+    Run one fold/merge step. Returns None if nothing needed compacting, else whether the swap succeeded.
+
+    The lock is only held to snapshot the entries and to swap the summary in; the
+    (slow) summarization runs unlocked. The swap only succeeds if every snapshotted
+    entry still exists, and entries appended meanwhile are left untouched after the summary.
+    """
+    ns = _ns(namespace)
+    with _memory_read_lock(ns):
+        items = ns.store.scan(ns.name)
+    plan = _plan_compaction(items)
+    if plan is None:
+        return None
+    chunk, level = plan
+    logger.info(
+        "Memory [%s] has %d entries; folding %d into a level-%d summary", ns.name, len(items), len(chunk), level
     )
-    return generate_response(prompt)
+    seqs = [it.seq for it in chunk]
+    try:
+        summary = (_summarize_items(chunk, level=level) or "").strip()
+    except Exception:
+        logger.exception("Memory summarization failed")
+        summary = ""
+    with _memory_lock(ns):
+        if summary:
+            summary_msg = Message(role="system", content=summary, ts=time.time(), kind="summary", meta={"level": level})
+            swapped = ns.store.replace(ns.name, seqs, [_to_stored(summary_msg)], require_all=True)
+            if swapped:
+                logger.info("Memory replaced %d entries with 1 level-%d summary entry", len(seqs), level)
+        elif level == 1:
+            # summarization failed; drop the oldest raw chunk and keep the recent entries
+            swapped = ns.store.replace(ns.name, seqs, [], require_all=True)
+            if swapped:
+                logger.warning(
+                    "Summarization returned empty; kept last %d entries",
+                    ns.store.count(ns.name),
+                )
+        else:
+            # Never drop summaries; try again on the next compaction.
+            logger.warning("Summary merge returned empty; keeping %d level-1 summaries", len(seqs))
+            return False
+    if not swapped:
+        logger.info("Memory changed during summarization (reset or concurrent compaction); discarded result")
+    return swapped
+
+
+def compact_now(namespace: str = DEFAULT_NAMESPACE) -> bool:
+    """Run tiered compaction until memory is within budget. Returns True if anything was compacted."""
+    compacted = False
+    for _ in range(_MAX_COMPACTION_STEPS):
+        result = _compact_step(namespace)
+        if not result:
+            break
+        compacted = True
+    return compacted
+
+
+class _CompactionWorker:
+    """Daemon thread that runs compact_now() for namespaces whose writers asked for it."""
+
+    def __init__(self) -> None:
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._state_lock = threading.Lock()
+        self._pending: set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def request(self, namespace: str) -> None:
+        with self._state_lock:
+            self._pending.add(namespace)
+            self._idle.clear()
+            self._wake.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="memory-compaction", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            with self._state_lock:
+                self._wake.clear()
+                pending, self._pending = self._pending, set()
+            for namespace in sorted(pending):
+                try:
+                    compact_now(namespace)
+                except Exception:
+                    logger.exception("Background memory compaction failed for %s", namespace)
+            with self._state_lock:
+                if not self._wake.is_set():
+                    self._idle.set()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        return self._idle.wait(timeout)
+
+
+_compaction_worker = _CompactionWorker()
+
 
+def _request_compaction_if_needed(ns: _Namespace) -> None:
+    """Hand compaction to the background worker if memory is over the threshold. Caller holds the lock."""
+    if ns.store.count(ns.name) > MAX_ENTRIES_BEFORE_SUMMARY:
+        # Cheap pre-check; the worker decides exactly what (if anything) to fold.
+        _compaction_worker.request(ns.name)
 
-def add_memory(message: str) -> None:
+
+def wait_for_compaction(timeout: Optional[float] = None) -> bool:
+    """Block until pending background compaction has finished (for tests and CLI commands)."""
+    return _compaction_worker.wait_idle(timeout)
+
+
+def add_memory(message: str, *, namespace: str = DEFAULT_NAMESPACE) -> None:
     """
-    Append a legacy string message; if total > threshold, summarize and replace with one summary.
+    Append a plain string note; if total > threshold, summarize and replace with one summary.
 
     Prefer using add_turn(...) for new code so memory stays structured.
     """
     msg = _sanitize_for_storage(message)
     if not msg:
         return
-    
-    with _memory_lock():
-        queue.put(msg)
-        if queue.qsize() > MAX_ENTRIES_BEFORE_SUMMARY:
-            logger.info("Memory has %d messages; summarizing via agent", queue.qsize())
-            items: list[Any] = []
-            try:
-                while True:
-                    items.append(queue.get_nowait())
-            except Exception:
-                pass
-            if not items:
-                return
-            summary = (_summarize_items(items) or "").strip()
-            if summary:
-                queue.put(_encode_message(Message(role="system", content=summary, ts=time.time(), kind="summary")))
-                logger.info("Memory replaced with 1 summary entry")
-            else:
-                # summarization failed; keep last MAX messages
-                for m in items[-MAX_ENTRIES_BEFORE_SUMMARY:]:
-                    queue.put(m)
-                logger.warning(
-                    "Summarization returned empty; kept last %d messages",
-                    queue.qsize(),
-                )
+
+    ns = _ns(namespace)
+    with _memory_lock(ns):
+        now = time.time()
+        ns.store.append(
+            ns.name,
+            [_to_stored(Message(role="system", content=msg, ts=now, kind="note"))],
+            archive=[(now, msg)],
+        )
+        _request_compaction_if_needed(ns)
+    _sync_index_if_loaded(ns)
 
 
 def add_turn(
@@ -225,98 +801,396 @@ def add_turn(
     *,
     source: str = "discord",
     meta: Optional[dict[str, Any]] = None,
+    namespace: str = DEFAULT_NAMESPACE,
 ) -> None:
-    """Add a structured user+assistant turn to memory."""
-    u = _sanitize_for_storage(user_text)
-    a = _sanitize_for_storage(assistant_text)
-    if not u and not a:
-        return
+    """Add a structured user+assistant turn to memory. Summarization happens in the background."""
+    add_turns([(user_text, assistant_text)], source=source, meta=meta, namespace=namespace)
 
+
+def add_turns(
+    turns: Iterable[tuple[str, str]],
+    *,
+    source: str = "discord",
+    meta: Optional[dict[str, Any]] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+) -> int:
+    """
+    Add many (user, assistant) turns in one durable commit (group commit).
+    The lock, novelty check, compaction check and index update run once per batch.
+    Returns how many turns were stored (redundant turns may be dropped or merged).
+    """
     base_meta: dict[str, Any] = {"source": source}
     if meta:
         base_meta.update(meta)
+    policy = novelty.policy_for(source)
 
-    with _memory_lock():
+    ns = _ns(namespace)
+    with _memory_lock(ns):
         now = time.time()
-        if u:
-            queue.put(_encode_message(Message(role="user", content=u, ts=now, kind="turn", meta=base_meta)))
-        if a:
-            queue.put(_encode_message(Message(role="assistant", content=a, ts=now, kind="turn", meta=base_meta)))
-
-        if queue.qsize() > MAX_ENTRIES_BEFORE_SUMMARY:
-            logger.info("Memory has %d entries; summarizing via agent", queue.qsize())
-            items: list[Any] = []
-            try:
-                while True:
-                    items.append(queue.get_nowait())
-            except Exception:
-                pass
-            if not items:
-                return
-            summary = (_summarize_items(items) or "").strip()
-            if summary:
-                queue.put(_encode_message(Message(role="system", content=summary, ts=time.time(), kind="summary")))
-                logger.info("Memory replaced with 1 summary entry")
-            else:
-                for m in items[-MAX_ENTRIES_BEFORE_SUMMARY:]:
-                    queue.put(m)
-                logger.warning(
-                    "Summarization returned empty; kept last %d entries",
-                    queue.qsize(),
-                )
+        recent = _recent_turns(ns, source) if policy != novelty.POLICY_KEEP else []
+        new_turns: list[_RecentTurn] = []
+        for user_text, assistant_text in turns:
+            u = _sanitize_for_storage(user_text)
+            a = _sanitize_for_storage(assistant_text)
+            if not u and not a:
+                continue
+            turn: list[Message] = []
+            if u:
+                turn.append(Message(role="user", content=u, ts=now, kind="turn", meta=dict(base_meta)))
+            if a:
+                turn.append(Message(role="assistant", content=a, ts=now, kind="turn", meta=dict(base_meta)))
+            turn_text = "\n".join(render_for_context(m) for m in turn)
+            if policy != novelty.POLICY_KEEP:
+                duplicate = novelty.find_duplicate(turn_text, ((t, t.text) for t in recent))
+                if duplicate is not None:
+                    if policy == novelty.POLICY_MERGE:
+                        duplicate.repeat(now)
+                    action = "merged" if policy == novelty.POLICY_MERGE else "dropped"
+                    logger.info("Memory [%s]: %s redundant %s turn", ns.name, action, source)
+                    continue
+            new_turns.append(_RecentTurn(turn_text, turn))
+            if policy != novelty.POLICY_KEEP:
+                recent.append(new_turns[-1])
+        for t in recent:
+            if t.stored and t.repeated:
+                ns.store.replace(ns.name, [e.seq for e in t.stored], [_to_stored(m) for m in t.messages])
+        if new_turns:
+            # The archive keeps the raw turns after compaction folds them into a summary.
+            ns.store.append(
+                ns.name,
+                [_to_stored(m) for t in new_turns for m in t.messages],
+                archive=[(now, t.text) for t in new_turns],
+            )
+            _request_compaction_if_needed(ns)
+    if new_turns:
+        _sync_index_if_loaded(ns)
+    return len(new_turns)
+
+
+@dataclass
+class _RecentTurn:
+    """A recent turn the novelty filter compares against; stored entries are set if already persisted."""
+
+    text: str
+    messages: list[Message]
+    stored: Optional[list[StoredEntry]] = None
+    repeated: bool = False
+
+    def repeat(self, now: float) -> None:
+        for i, msg in enumerate(self.messages):
+            meta = dict(msg.meta or {})
+            meta["repeats"] = int(meta.get("repeats", 0)) + 1
+            meta["last_ts"] = now
+            self.messages[i] = dataclasses.replace(msg, meta=meta)
+        self.repeated = True
+
 
+def _recent_turns(ns: _Namespace, source: str) -> list[_RecentTurn]:
+    """The last MEMORY_NOVELTY_WINDOW stored turns of `source`, oldest first."""
+    turns: list[tuple[list[StoredEntry], list[Message]]] = []
+    for entry in ns.store.scan(ns.name, kinds=("turn",)):
+        msg = _decode_entry(entry)
+        if (msg.meta or {}).get("source") != source:
+            continue
+        # Both halves of one turn share a timestamp; a user entry always starts a new turn.
+        if turns and turns[-1][1][-1].ts == msg.ts and msg.role != "user":
+            turns[-1][0].append(entry)
+            turns[-1][1].append(msg)
+        else:
+            turns.append(([entry], [msg]))
+    recent = turns[-novelty.MEMORY_NOVELTY_WINDOW:] if novelty.MEMORY_NOVELTY_WINDOW > 0 else []
+    return [
+        _RecentTurn("\n".join(render_for_context(m) for m in msgs), msgs, stored=stored)
+        for stored, msgs in recent
+    ]
 
-def get_message_count() -> int:
+
+def _sync_index(ns: _Namespace) -> None:
+    """Index archive rows added since the index last looked (by this or any other process)."""
+    rows = ns.store.scan_archive(ns.name, after_seq=ns.index.last_seq)
+    added = ns.index.add_many((seq, text) for seq, _ts, text in rows)
+    if added > 1:
+        logger.info("Indexed %d archived memory entries for %s (%d total)", added, ns.name, len(ns.index))
+
+
+def _sync_index_if_loaded(ns: _Namespace) -> None:
+    # Keep a built index current incrementally; an unbuilt one loads everything on first search.
+    if ns.index.last_seq:
+        _sync_index(ns)
+
+
+def search_archive(query: str, k: int = MEMORY_RETRIEVAL_TOP_K, *, namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+    """Return up to k archived turns most relevant to `query` (BM25), best first."""
+    if k <= 0 or not query.strip():
+        return []
+    ns = _ns(namespace)
+    _sync_index(ns)
+    hits = ns.index.search(query, k)
+    rows = ns.store.get_archived(ns.name, [seq for seq, _ in hits])
+    return [rows[seq][1] for seq, _ in hits if seq in rows]
+
+
+def memory_generation(namespace: str = DEFAULT_NAMESPACE) -> int:
+    """Persisted counter bumped by every write, from any process; a single integer read."""
+    ns = _ns(namespace)
+    return ns.store.generation(ns.name)
+
+
+def get_message_count(namespace: str = DEFAULT_NAMESPACE) -> int:
     """Return the number of messages currently in memory."""
-    with _memory_lock():
-        return queue.qsize()
-
-def list_message_objects() -> list[Message]:
-    """Return structured messages (legacy strings are converted to system notes)."""
-    with _memory_lock():
-        objs: list[Message] = []
-        count = queue.qsize()
-        originals: list[Any] = []
-        for _ in range(count):
-            it = queue.get()
-            originals.append(it)
-            msg, legacy = _try_decode_item(it)
-            if msg is not None:
-                objs.append(msg)
-            elif legacy is not None and legacy.strip():
-                objs.append(Message(role="system", content=legacy.strip(), ts=time.time(), kind="note"))
-        for it in originals:
-            queue.put(it)
-        return objs
-
-
-def list_messages() -> list[str]:
-    """Return all messages as rendered strings without removing them from the queue. Thread-safe."""
-    with _memory_lock():
-        rendered: list[str] = []
-        count = queue.qsize()
-        originals: list[Any] = []
-        for _ in range(count):
-            it = queue.get()
-            originals.append(it)
-            msg, legacy = _try_decode_item(it)
-            if msg is not None:
-                rendered.append(_render_for_context(msg))
-            elif legacy is not None and legacy.strip():
-                rendered.append(legacy.strip())
-        # Requeue in original order
-        for it in originals:
-            queue.put(it)
-        return rendered
-
-
-def reset_memory() -> None:
-    """Clear all messages from memory. This permanently deletes all stored conversation history."""
-    with _memory_lock():
-        count = queue.qsize()
-        try:
-            while True:
-                queue.get_nowait()
-        except Exception:
-            pass
-        logger.info(f"Memory reset: {count} message(s) cleared")
+    ns = _ns(namespace)
+    with _memory_read_lock(ns):
+        return ns.store.count(ns.name)
+
+
+@dataclass
+class _Snapshot:
+    """Decoded and rendered entries of one namespace as of a store generation."""
+
+    store: MemoryStore
+    generation: int
+    messages: list[Message]
+    rendered: list[str]
+    # seq -> (payload, message, rendered text), so a refresh only decodes changed entries.
+    decoded: dict[int, tuple[Any, Message, str]] = dataclasses.field(default_factory=dict)
+
+
+# namespace -> last decoded snapshot; reused until the store's generation moves.
+_snapshots: dict[str, _Snapshot] = {}
+
+
+def _snapshot(ns: _Namespace) -> _Snapshot:
+    generation = ns.store.generation(ns.name)
+    cached = _snapshots.get(ns.name)
+    if cached is not None and cached.store is ns.store and cached.generation == generation:
+        return cached
+    previous = cached.decoded if cached is not None and cached.store is ns.store else {}
+    with _memory_read_lock(ns):
+        # Re-read under the lock; the generation is read before the scan, so a write racing
+        # an unlocked (timed-out) read only makes the next call decode again.
+        generation = ns.store.generation(ns.name)
+        entries = ns.store.scan(ns.name)
+    messages: list[Message] = []
+    rendered: list[str] = []
+    decoded: dict[int, tuple[Any, Message, str]] = {}
+    for entry in entries:
+        hit = previous.get(entry.seq)
+        if hit is not None and hit[0] == entry.payload:
+            _, msg, text = hit
+        else:
+            msg = _decode_entry(entry)
+            text = render_for_context(msg)
+        decoded[entry.seq] = (entry.payload, msg, text)
+        if msg.content.strip():
+            messages.append(msg)
+        if text:
+            rendered.append(text)
+    snap = _Snapshot(ns.store, generation, messages, rendered, decoded)
+    _snapshots[ns.name] = snap
+    return snap
+
+
+def list_message_objects(namespace: str = DEFAULT_NAMESPACE) -> list[Message]:
+    """Return structured messages (legacy strings are converted to system notes). Treat them as read-only."""
+    return list(_snapshot(_ns(namespace)).messages)
+
+
+def list_messages(namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+    """Return all messages as rendered strings (cached until memory changes). Thread-safe."""
+    return list(_snapshot(_ns(namespace)).rendered)
+
+
+def without_prompt_turns(messages: list[Message], prompt: str) -> list[Message]:
+    """Drop earlier turns that asked exactly `prompt`: the user entry and the reply stored with it."""
+    stored = _sanitize_for_storage(prompt)
+    kept: list[Message] = []
+    skip_ts: Optional[float] = None
+    for msg in messages:
+        if msg.kind == "turn" and msg.role == "user" and msg.content == stored:
+            skip_ts = msg.ts
+            continue
+        # add_turn stores both halves of a turn with the same timestamp.
+        if skip_ts is not None and msg.kind == "turn" and msg.role == "assistant" and msg.ts == skip_ts:
+            skip_ts = None
+            continue
+        skip_ts = None
+        kept.append(msg)
+    return kept
+
+
+def reset_memory(namespace: str = DEFAULT_NAMESPACE) -> None:
+    """Clear one namespace. This permanently deletes its stored conversation history."""
+    ns = _ns(namespace)
+    with _memory_lock(ns):
+        count = ns.store.clear(ns.name)
+        ns.index.clear()
+        logger.info(f"Memory reset [{ns.name}]: {count} message(s) cleared")
+
+
+def reset_all_memory() -> None:
+    """Clear every namespace. This permanently deletes all stored conversation history."""
+    for name in list_namespaces():
+        reset_memory(name)
+
+
+@dataclass
+class StoreMaintenanceReport:
+    """Outcome of compact_store() for one namespace."""
+
+    namespace: str
+    entries: int
+    reencoded: int
+    undecodable: int
+    integrity_problems: list[str]
+    legacy_files_removed: int
+    size_before: int
+    size_after: int
+
+    @property
+    def reclaimed(self) -> int:
+        return self.size_before - self.size_after
+
+    @property
+    def ok(self) -> bool:
+        return not self.undecodable and not self.integrity_problems
+
+
+_LEGACY_QUEUE_FILE = re.compile(r"^(info|q\d{5,})$")
+
+
+def _remove_migrated_queue_files(directory: Path, target: MemoryStore) -> int:
+    """Delete persistqueue files left behind once their contents were migrated."""
+    if target.get_meta(_MIGRATION_META_KEY) is None or not directory.is_dir():
+        return 0
+    removed = 0
+    for path in directory.iterdir():
+        if path.is_file() and _LEGACY_QUEUE_FILE.match(path.name):
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def _legacy_bytes(directory: Path) -> int:
+    if not directory.is_dir():
+        return 0
+    return sum(p.stat().st_size for p in directory.iterdir() if p.is_file() and _LEGACY_QUEUE_FILE.match(p.name))
+
+
+def compact_store(namespace: str = DEFAULT_NAMESPACE) -> StoreMaintenanceReport:
+    """
+    Verify and rewrite one namespace's store into a minimal layout:
+    every entry must decode, older payload formats are re-encoded as v2 records,
+    migrated persistqueue files are removed and the database is vacuumed.
+    """
+    ns = _ns(namespace)
+    directory = QUEUE_DIR if ns.name == DEFAULT_NAMESPACE else _namespace_dir(ns.name)
+    with _memory_lock(ns):
+        size_before = ns.store.size_bytes() + _legacy_bytes(directory)
+        problems = ns.store.integrity_check()
+        entries = ns.store.scan(ns.name)
+        stale: list[StoredEntry] = []
+        undecodable = 0
+        for entry in entries:
+            if isinstance(entry.payload, (bytes, bytearray)):
+                try:
+                    _decode_record(bytes(entry.payload))
+                except ValueError:
+                    undecodable += 1
+                    logger.error("Memory [%s]: entry %s does not decode; leaving it untouched", ns.name, entry.seq)
+            else:
+                stale.append(entry)
+        if stale:
+            ns.store.replace(ns.name, [e.seq for e in stale], [_to_stored(_decode_entry(e)) for e in stale])
+        removed = _remove_migrated_queue_files(directory, ns.store)
+        ns.store.vacuum()
+        size_after = ns.store.size_bytes()
+    report = StoreMaintenanceReport(
+        namespace=ns.name,
+        entries=len(entries),
+        reencoded=len(stale),
+        undecodable=undecodable,
+        integrity_problems=problems,
+        legacy_files_removed=removed,
+        size_before=size_before,
+        size_after=size_after,
+    )
+    logger.info(
+        "Memory [%s] compacted: %d entries (%d re-encoded, %d undecodable), reclaimed %d bytes",
+        ns.name, report.entries, report.reencoded, report.undecodable, report.reclaimed,
+    )
+    return report
+
+
+def compact_all_stores() -> list[StoreMaintenanceReport]:
+    """Run compact_store() on every namespace."""
+    return [compact_store(name) for name in list_namespaces()]
+
+
+def snapshot_memory(path: Path, namespace: str = DEFAULT_NAMESPACE) -> Path:
+    """Write a consistent snapshot of one namespace's store to a single file."""
+    ns = _ns(namespace)
+    ns.store.backup(Path(path))
+    return Path(path)
+
+
+def restore_memory(path: Path, namespace: str = DEFAULT_NAMESPACE) -> None:
+    """Replace one namespace's store with a snapshot written by snapshot_memory()."""
+    ns = _ns(namespace)
+    with _memory_lock(ns):
+        ns.store.restore(Path(path), ns.name)
+        ns.index.clear()
+    _snapshots.pop(ns.name, None)
+    logger.info("Memory [%s] restored from %s", ns.name, path)
+
+
+# Dedicated executor for the async facade below: memory I/O never competes with (or
+# exhausts) the loop's default executor, and the loop itself never blocks on a lock.
+MEMORY_IO_WORKERS = int(os.getenv("MEMORY_IO_WORKERS", "2"))
+_io_executor = ThreadPoolExecutor(max_workers=MEMORY_IO_WORKERS, thread_name_prefix="memory-io")
+
+
+async def _run_io(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def alist_messages(namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+    """Async list_messages()."""
+    return await _run_io(list_messages, namespace)
+
+
+async def alist_message_objects(namespace: str = DEFAULT_NAMESPACE) -> list[Message]:
+    """Async list_message_objects()."""
+    return await _run_io(list_message_objects, namespace)
+
+
+async def amemory_generation(namespace: str = DEFAULT_NAMESPACE) -> int:
+    """Async memory_generation()."""
+    return await _run_io(memory_generation, namespace)
+
+
+async def asearch_archive(query: str, k: int = MEMORY_RETRIEVAL_TOP_K, *, namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+    """Async search_archive(); the first call in a process also builds the index."""
+    return await _run_io(search_archive, query, k, namespace=namespace)
+
+
+async def aadd_turn(
+    user_text: str,
+    assistant_text: str,
+    *,
+    source: str = "discord",
+    meta: Optional[dict[str, Any]] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+) -> None:
+    """Async add_turn()."""
+    await _run_io(add_turn, user_text, assistant_text, source=source, meta=meta, namespace=namespace)
+
+
+async def areset_memory(namespace: str = DEFAULT_NAMESPACE) -> None:
+    """Async reset_memory()."""
+    await _run_io(reset_memory, namespace)
+
+
+async def acompact_all_stores() -> list[StoreMaintenanceReport]:
+    """Async compact_all_stores()."""
+    return await _run_io(compact_all_stores)
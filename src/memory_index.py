@@ -0,0 +1,113 @@
+"""
+Local lexical retrieval over archived memory.
+
+Compaction replaces raw turns with summaries, so every turn is also written to an
+append-only archive (see MemoryStore.append(archive=...)). LexicalIndex is an
+in-process BM25 inverted index over that archive:
+
+- Built lazily from the archive on first use, then kept current incrementally by
+  indexing only archive rows with a higher sequence than it has seen.
+- Postings store term frequencies per archive seq; document texts stay on disk and
+  only the top-k hits are fetched back.
+- Very common terms (document frequency above MAX_DF_RATIO) carry almost no BM25
+  weight, so they are skipped when rarer query terms exist, and each term scores at
+  most its MAX_POSTINGS_PER_TERM newest documents. Queries stay in the low
+  milliseconds even with 100k archived turns (see benchmarks/bench_memory_index.py).
+
+No network access or external service is involved.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_DF_RATIO = 0.25
+# Each query term scores at most this many of its newest postings (bounds worst-case latency).
+MAX_POSTINGS_PER_TERM = 2000
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+_STOPWORDS = frozenset(
+    """
+    a an and are as at be but by can do for from had has have he her his i if in into is it its
+    me my no not of on or our she so than that the their them then there these they this to
+    was we were what when where which who will with you your agent user
+    """.split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens without stopwords or single characters."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """Incremental BM25 index keyed by archive sequence number. Thread-safe."""
+
+    def __init__(self) -> None:
+        self._postings: dict[str, dict[int, int]] = {}
+        self._doc_len: dict[int, int] = {}
+        self._total_len = 0
+        self.last_seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, seq: int, text: str) -> None:
+        tokens = tokenize(text)
+        with self._lock:
+            if seq in self._doc_len:
+                return
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, {})[seq] = tf
+            self._doc_len[seq] = len(tokens)
+            self._total_len += len(tokens)
+            if seq > self.last_seq:
+                self.last_seq = seq
+
+    def add_many(self, docs: Iterable[tuple[int, str]]) -> int:
+        n = 0
+        for seq, text in docs:
+            self.add(seq, text)
+            n += 1
+        return n
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._doc_len.clear()
+            self._total_len = 0
+            self.last_seq = 0
+
+    def search(self, query: str, k: int = 3, exclude: Optional[Callable[[int], bool]] = None) -> list[tuple[int, float]]:
+        """Return up to k (seq, score) pairs, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not terms or not n_docs:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            present = [(t, self._postings[t]) for t in terms if t in self._postings]
+            rare = [(t, p) for t, p in present if len(p) <= MAX_DF_RATIO * n_docs]
+            scores: dict[int, float] = {}
+            for _term, postings in (rare or present):
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                # Postings are insertion-ordered by seq, so reversed() walks newest first.
+                for n, seq in enumerate(reversed(postings)):
+                    if n >= MAX_POSTINGS_PER_TERM:
+                        break
+                    tf = postings[seq]
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[seq] / avg_len)
+                    scores[seq] = scores.get(seq, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        if exclude is not None:
+            scores = {seq: sc for seq, sc in scores.items() if not exclude(seq)}
+        return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
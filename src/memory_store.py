@@ -0,0 +1,419 @@
+"""
+Storage backends for src.memory.
+
+A backend stores encoded memory entries in order, per namespace. Each entry has a
+monotonically increasing sequence number plus the indexed columns memory needs
+to filter on (ts, kind, role); the payload is the encoded Message (a binary record,
+or text for entries written by older versions) and is opaque here.
+
+SqliteMemoryStore is the default backend:
+- WAL journal, so readers never block writers (and vice versa) across processes.
+- Reads are plain range scans over an index on (namespace, seq); nothing is
+  removed and re-inserted to read it.
+- replace() deletes a set of entries and inserts their replacement (e.g. a summary)
+  in one transaction, reusing the lowest freed sequence numbers so the replacement
+  keeps its place in the order even if newer entries were appended meanwhile.
+- Every write bumps a per-namespace generation counter in the same transaction, so
+  readers (in any process) can detect changes with one integer read.
+- Maintenance: vacuum() rewrites the file into a minimal layout, integrity_check()
+  runs SQLite's own check, and backup()/restore() copy the whole store to or from a
+  single file through the online backup API (a consistent snapshot, no downtime).
+"""
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+DEFAULT_NAMESPACE = "default"
+
+
+@dataclass(frozen=True)
+class StoredEntry:
+    """One stored memory entry. seq is assigned by the store (None before insertion)."""
+
+    ts: float
+    kind: str
+    role: str
+    payload: Union[bytes, str]
+    seq: Optional[int] = None
+    namespace: str = DEFAULT_NAMESPACE
+
+
+class MemoryStore(ABC):
+    """Ordered, namespaced storage of encoded memory entries."""
+
+    @abstractmethod
+    def append(
+        self,
+        namespace: str,
+        entries: Iterable[StoredEntry],
+        *,
+        archive: Iterable[tuple[float, str]] = (),
+        meta: Optional[dict[str, str]] = None,
+    ) -> list[int]:
+        """
+        Append entries in one durable commit; returns their sequence numbers.
+        `archive` (ts, text) rows go to the append-only archive and `meta` values are
+        set in the same commit.
+        """
+
+    @abstractmethod
+    def scan_archive(self, namespace: str, *, after_seq: int = 0, limit: Optional[int] = None) -> list[tuple[int, float, str]]:
+        """Return archived (seq, ts, text) rows in sequence order."""
+
+    @abstractmethod
+    def get_archived(self, namespace: str, seqs: Iterable[int]) -> dict[int, tuple[float, str]]:
+        """Return {seq: (ts, text)} for the requested archive rows."""
+
+    @abstractmethod
+    def scan(
+        self,
+        namespace: str,
+        *,
+        after_seq: int = 0,
+        kinds: Optional[Iterable[str]] = None,
+        limit: Optional[int] = None,
+    ) -> list[StoredEntry]:
+        """Return entries in sequence order without modifying the store."""
+
+    @abstractmethod
+    def count(self, namespace: str) -> int:
+        """Return the number of entries in the namespace."""
+
+    @abstractmethod
+    def generation(self, namespace: str) -> int:
+        """Counter bumped by every write to the namespace (0 if never written)."""
+
+    @abstractmethod
+    def replace(
+        self,
+        namespace: str,
+        seqs: Iterable[int],
+        entries: Iterable[StoredEntry],
+        *,
+        require_all: bool = False,
+    ) -> bool:
+        """
+        Atomically delete `seqs` and insert `entries` in their place (empty `entries` = delete).
+        With require_all, nothing changes (and False is returned) unless every seq still exists.
+        """
+
+    @abstractmethod
+    def clear(self, namespace: str) -> int:
+        """Delete every entry (and archived turn) in the namespace; returns how many entries were removed."""
+
+    @abstractmethod
+    def get_meta(self, key: str) -> Optional[str]:
+        """Read a store-level metadata value."""
+
+    @abstractmethod
+    def set_meta(self, key: str, value: str) -> None:
+        """Write a store-level metadata value."""
+
+    @abstractmethod
+    def vacuum(self) -> None:
+        """Rewrite storage into a minimal layout, reclaiming free space."""
+
+    @abstractmethod
+    def integrity_check(self) -> list[str]:
+        """Return storage-level integrity problems (empty if the store is healthy)."""
+
+    @abstractmethod
+    def backup(self, path: Path) -> None:
+        """Write a consistent snapshot of the whole store to a single file."""
+
+    @abstractmethod
+    def restore(self, path: Path, namespace: str) -> None:
+        """Replace the store's contents with a snapshot of `namespace` written by backup()."""
+
+    @abstractmethod
+    def size_bytes(self) -> int:
+        """Bytes used on disk by the store."""
+
+    def close(self) -> None:
+        """Release resources held by the store."""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    role TEXT NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_ns_seq ON entries(namespace, seq);
+CREATE INDEX IF NOT EXISTS idx_entries_ns_kind ON entries(namespace, kind, seq);
+CREATE INDEX IF NOT EXISTS idx_entries_ns_ts ON entries(namespace, ts);
+CREATE TABLE IF NOT EXISTS archive (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    ts REAL NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_archive_ns_seq ON archive(namespace, seq);
+CREATE TABLE IF NOT EXISTS generations (
+    namespace TEXT PRIMARY KEY,
+    gen INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SqliteMemoryStore(MemoryStore):
+    """SQLite (WAL) backend. Connections are per thread; the file is shared across processes."""
+
+    def __init__(self, path: Path, *, busy_timeout_ms: int = 30000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE.
+            conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _write(self):
+        return _WriteTxn(self._conn())
+
+    def append(
+        self,
+        namespace: str,
+        entries: Iterable[StoredEntry],
+        *,
+        archive: Iterable[tuple[float, str]] = (),
+        meta: Optional[dict[str, str]] = None,
+    ) -> list[int]:
+        seqs: list[int] = []
+        with self._write() as conn:
+            for e in entries:
+                cur = conn.execute(
+                    "INSERT INTO entries (namespace, ts, kind, role, payload) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, e.ts, e.kind, e.role, e.payload),
+                )
+                seqs.append(int(cur.lastrowid))
+            conn.executemany(
+                "INSERT INTO archive (namespace, ts, text) VALUES (?, ?, ?)",
+                [(namespace, ts, text) for ts, text in archive],
+            )
+            if meta:
+                _set_meta(conn, meta)
+            _bump_generation(conn, namespace)
+        return seqs
+
+    def scan_archive(self, namespace: str, *, after_seq: int = 0, limit: Optional[int] = None) -> list[tuple[int, float, str]]:
+        sql = "SELECT seq, ts, text FROM archive WHERE namespace = ? AND seq > ? ORDER BY seq"
+        params: list = [namespace, after_seq]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [(int(seq), float(ts), text) for seq, ts, text in self._conn().execute(sql, params)]
+
+    def get_archived(self, namespace: str, seqs: Iterable[int]) -> dict[int, tuple[float, str]]:
+        wanted = list(seqs)
+        if not wanted:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT seq, ts, text FROM archive WHERE namespace = ? AND seq IN ({','.join('?' * len(wanted))})",
+            [namespace, *wanted],
+        )
+        return {int(seq): (float(ts), text) for seq, ts, text in rows}
+
+    def scan(
+        self,
+        namespace: str,
+        *,
+        after_seq: int = 0,
+        kinds: Optional[Iterable[str]] = None,
+        limit: Optional[int] = None,
+    ) -> list[StoredEntry]:
+        sql = "SELECT seq, namespace, ts, kind, role, payload FROM entries WHERE namespace = ? AND seq > ?"
+        params: list = [namespace, after_seq]
+        if kinds is not None:
+            kinds = list(kinds)
+            sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        sql += " ORDER BY seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._conn().execute(sql, params).fetchall()
+        return [
+            StoredEntry(seq=seq, namespace=ns, ts=ts, kind=kind, role=role, payload=payload)
+            for seq, ns, ts, kind, role, payload in rows
+        ]
+
+    def count(self, namespace: str) -> int:
+        row = self._conn().execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()
+        return int(row[0])
+
+    def generation(self, namespace: str) -> int:
+        row = self._conn().execute("SELECT gen FROM generations WHERE namespace = ?", (namespace,)).fetchone()
+        return 0 if row is None else int(row[0])
+
+    def replace(
+        self,
+        namespace: str,
+        seqs: Iterable[int],
+        entries: Iterable[StoredEntry],
+        *,
+        require_all: bool = False,
+    ) -> bool:
+        freed = sorted(set(seqs))
+        new = list(entries)
+        if len(new) > len(freed):
+            raise ValueError("replace() cannot insert more entries than it removes")
+        try:
+            with self._write() as conn:
+                before = conn.total_changes
+                conn.executemany(
+                    "DELETE FROM entries WHERE namespace = ? AND seq = ?",
+                    [(namespace, s) for s in freed],
+                )
+                if require_all and conn.total_changes - before != len(freed):
+                    raise _StaleReplace()
+                conn.executemany(
+                    "INSERT INTO entries (seq, namespace, ts, kind, role, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(seq, namespace, e.ts, e.kind, e.role, e.payload) for seq, e in zip(freed, new)],
+                )
+                _bump_generation(conn, namespace)
+        except _StaleReplace:
+            return False
+        return True
+
+    def clear(self, namespace: str) -> int:
+        with self._write() as conn:
+            cur = conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            conn.execute("DELETE FROM archive WHERE namespace = ?", (namespace,))
+            _bump_generation(conn, namespace)
+            return int(cur.rowcount)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else str(row[0])
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._write() as conn:
+            _set_meta(conn, {key: value})
+
+    def vacuum(self) -> None:
+        conn = self._conn()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def integrity_check(self) -> list[str]:
+        rows = self._conn().execute("PRAGMA integrity_check").fetchall()
+        return [str(r[0]) for r in rows if r[0] != "ok"]
+
+    def backup(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        dest = sqlite3.connect(str(tmp))
+        try:
+            self._conn().backup(dest)
+            dest.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dest.close()
+        tmp.replace(path)
+
+    def restore(self, path: Path, namespace: str) -> None:
+        src = sqlite3.connect(f"file:{Path(path)}?mode=ro", uri=True)
+        try:
+            problems = [r[0] for r in src.execute("PRAGMA integrity_check").fetchall() if r[0] != "ok"]
+            tables = {r[0] for r in src.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if problems or not {"entries", "archive", "meta"} <= tables:
+                raise ValueError(f"{path} is not a valid memory snapshot")
+            others = src.execute("SELECT 1 FROM entries WHERE namespace != ? LIMIT 1", (namespace,)).fetchone()
+            if others is not None:
+                raise ValueError(f"{path} is a snapshot of a different memory namespace than {namespace!r}")
+            conn = self._conn()
+            before = dict(conn.execute("SELECT namespace, gen FROM generations").fetchall())
+            src.backup(conn)
+        finally:
+            src.close()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        with self._write() as conn:
+            # Generations must keep moving forward so readers never mistake restored data for cached data.
+            after = dict(conn.execute("SELECT namespace, gen FROM generations").fetchall())
+            for namespace in set(before) | set(after):
+                conn.execute(
+                    "INSERT INTO generations (namespace, gen) VALUES (?, ?) "
+                    "ON CONFLICT(namespace) DO UPDATE SET gen = excluded.gen",
+                    (namespace, before.get(namespace, 0) + after.get(namespace, 0) + 1),
+                )
+
+    def size_bytes(self) -> int:
+        total = 0
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                total += self.path.with_name(self.path.name + suffix).stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def close(self) -> None:
+        with self._conns_lock:
+            for conn in self._conns:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._conns.clear()
+        self._local = threading.local()
+
+
+def _set_meta(conn: sqlite3.Connection, values: dict[str, str]) -> None:
+    conn.executemany(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        list(values.items()),
+    )
+
+
+def _bump_generation(conn: sqlite3.Connection, namespace: str) -> None:
+    conn.execute(
+        "INSERT INTO generations (namespace, gen) VALUES (?, 1) "
+        "ON CONFLICT(namespace) DO UPDATE SET gen = gen + 1",
+        (namespace,),
+    )
+
+
+class _StaleReplace(Exception):
+    """Internal: aborts a replace() whose entries changed underneath it."""
+
+
+class _WriteTxn:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block (takes the write lock up front)."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
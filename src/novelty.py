@@ -0,0 +1,118 @@
+"""
+Novelty filtering for memory writes.
+
+Some sources (notably the proactive loop) write the same prompt and a near-identical
+"No updates." reply on every tick. Storing those turns fills memory with noise and
+triggers summarization just to compress it. Before a turn is persisted, src.memory
+compares it against the recent turns of the same source:
+
+- Exact duplicates are detected with a content hash of the normalized text.
+- Near duplicates are detected with a 64-bit SimHash over word unigrams and bigrams;
+  two turns are near duplicates when their fingerprints differ in at most
+  MEMORY_NOVELTY_MAX_DISTANCE bits.
+
+What happens to a redundant turn depends on the source's policy:
+- "keep": always store it (no filtering).
+- "drop": do not store it.
+- "merge": do not store it; bump a repeat counter on the earlier matching turn instead.
+
+Policies come from MEMORY_NOVELTY_POLICIES, e.g. "proactive=merge,scheduler=keep".
+"""
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+POLICY_KEEP = "keep"
+POLICY_DROP = "drop"
+POLICY_MERGE = "merge"
+_POLICIES = (POLICY_KEEP, POLICY_DROP, POLICY_MERGE)
+
+MEMORY_NOVELTY_POLICIES = os.getenv("MEMORY_NOVELTY_POLICIES", "proactive=merge,scheduler=keep,discord=keep")
+MEMORY_NOVELTY_DEFAULT_POLICY = os.getenv("MEMORY_NOVELTY_DEFAULT_POLICY", POLICY_KEEP)
+# How many recent turns of the same source a new turn is compared against.
+MEMORY_NOVELTY_WINDOW = int(os.getenv("MEMORY_NOVELTY_WINDOW", "8"))
+MEMORY_NOVELTY_MAX_DISTANCE = int(os.getenv("MEMORY_NOVELTY_MAX_DISTANCE", "3"))
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+def parse_policies(spec: str) -> dict[str, str]:
+    """Parse "source=policy,..." into a dict; unknown policies are ignored with a warning."""
+    policies: dict[str, str] = {}
+    for part in spec.split(","):
+        source, sep, policy = part.partition("=")
+        source, policy = source.strip(), policy.strip().lower()
+        if not sep or not source:
+            continue
+        if policy not in _POLICIES:
+            logger.warning("Ignoring unknown memory novelty policy %r for source %r", policy, source)
+            continue
+        policies[source] = policy
+    return policies
+
+
+_policies = parse_policies(MEMORY_NOVELTY_POLICIES)
+
+
+def policy_for(source: str) -> str:
+    return _policies.get(source, MEMORY_NOVELTY_DEFAULT_POLICY)
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def content_hash(text: str) -> str:
+    """Hash of the text with case, punctuation and whitespace normalized away."""
+    return hashlib.sha1(" ".join(_words(text)).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word unigrams and bigrams."""
+    words = _words(text)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    weights = [0] * 64
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    digest: str
+    sim: int
+
+    @classmethod
+    def of(cls, text: str) -> "Fingerprint":
+        return cls(content_hash(text), simhash(text))
+
+    def matches(self, other: "Fingerprint", max_distance: int = MEMORY_NOVELTY_MAX_DISTANCE) -> bool:
+        if self.digest == other.digest:
+            return True
+        # Texts without words all hash to 0; only their exact digest can match.
+        if not self.sim or not other.sim:
+            return False
+        return hamming(self.sim, other.sim) <= max_distance
+
+
+def find_duplicate(text: str, recent: Iterable[tuple[object, str]]) -> Optional[object]:
+    """Return the key of the newest recent (key, text) pair that `text` duplicates, or None."""
+    fp = Fingerprint.of(text)
+    for key, other in reversed(list(recent)):
+        if fp.matches(Fingerprint.of(other)):
+            return key
+    return None
@@ -0,0 +1,143 @@
+"""
+Change detection and pacing for the proactive loop.
+
+The proactive loop used to run a full agent invocation every PROACTIVE_INTERVAL_SECONDS,
+and most of those runs answered "No updates.". Before each tick the loop now
+captures a ProactiveState:
+
+- the repo's HEAD commit and a fingerprint of its working tree (git status plus
+  size/mtime of every changed path, so edits to an already-dirty file count);
+- the memory generation of the proactive namespace;
+- the time of the last user activity (see ProactivePacer.note_activity).
+
+If the state equals the one recorded after the previous run, the agent is skipped.
+
+ProactivePacer adapts the interval: quiet ticks (skipped, empty or "No updates.")
+multiply it by PROACTIVE_BACKOFF_FACTOR up to PROACTIVE_MAX_INTERVAL_SECONDS, while a
+tick that had something to say, or any user activity, resets it to the base interval.
+User activity also wakes a sleeping loop, so it tightens right away rather than
+after a long backed-off sleep.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from src.logs import get_logger
+from src.memory import amemory_generation
+
+logger = get_logger(__name__)
+
+PROACTIVE_MAX_INTERVAL_SECONDS = float(os.getenv("PROACTIVE_MAX_INTERVAL_SECONDS", "86400"))
+PROACTIVE_BACKOFF_FACTOR = float(os.getenv("PROACTIVE_BACKOFF_FACTOR", "2"))
+# Set to 0 to run the agent on every tick even when nothing changed.
+PROACTIVE_SKIP_UNCHANGED = os.getenv("PROACTIVE_SKIP_UNCHANGED", "1") == "1"
+
+_QUIET_REPLY_RE = re.compile(r"^\W*no (new )?updates?\W*$", re.IGNORECASE)
+
+
+def is_quiet_reply(reply: str) -> bool:
+    """True for empty replies and "No updates."-style answers."""
+    reply = reply.strip()
+    return not reply or bool(_QUIET_REPLY_RE.match(reply))
+
+
+async def _git(repo: str, *args: str) -> Optional[str]:
+    """Output of `git <args>` in repo, or None if git fails (e.g. not a repository)."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "git", *args,
+            cwd=repo,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        out, _ = await proc.communicate()
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    return out.decode("utf-8", errors="replace")
+
+
+def _tree_fingerprint(repo: str, status: str) -> str:
+    h = hashlib.sha1(status.encode("utf-8"))
+    for entry in status.split("\0"):
+        # Porcelain v1 -z entries are "XY path"; rename sources follow as bare paths.
+        path = entry[3:] if len(entry) > 3 and entry[2] == " " else entry
+        if not path:
+            continue
+        try:
+            st = os.stat(os.path.join(repo, path))
+        except OSError:
+            continue
+        h.update(f"\0{path}\0{st.st_size}\0{st.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class ProactiveState:
+    head: Optional[str]
+    tree: Optional[str]
+    memory_generation: int
+    last_activity: float
+
+
+async def capture_state(repo: str, namespace: str, last_activity: float) -> ProactiveState:
+    """Snapshot everything a proactive update could react to."""
+    head = await _git(repo, "rev-parse", "HEAD")
+    status = await _git(repo, "status", "--porcelain=v1", "-z", "--untracked-files=normal")
+    return ProactiveState(
+        head=head.strip() if head else None,
+        tree=_tree_fingerprint(repo, status) if status is not None else None,
+        memory_generation=await amemory_generation(namespace),
+        last_activity=last_activity,
+    )
+
+
+class ProactivePacer:
+    """Adaptive proactive interval with exponential backoff while quiet."""
+
+    def __init__(
+        self,
+        base_interval: float,
+        *,
+        max_interval: float = PROACTIVE_MAX_INTERVAL_SECONDS,
+        factor: float = PROACTIVE_BACKOFF_FACTOR,
+    ):
+        self.base_interval = base_interval
+        self.max_interval = max(base_interval, max_interval)
+        self.factor = max(1.0, factor)
+        self.interval = base_interval
+        self.last_activity = 0.0
+        self._wake: Optional[asyncio.Event] = None
+
+    def quiet(self) -> None:
+        self.interval = min(self.interval * self.factor, self.max_interval)
+
+    def active(self) -> None:
+        self.interval = self.base_interval
+
+    def note_activity(self) -> None:
+        """Record user activity: reset the interval and wake a loop sleeping on a longer one."""
+        self.last_activity = time.time()
+        self.active()
+        if self._wake is not None:
+            self._wake.set()
+
+    async def sleep(self) -> None:
+        """Sleep for the current interval, re-evaluated whenever activity resets it."""
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        started = time.monotonic()
+        while True:
+            remaining = started + self.interval - time.monotonic()
+            if remaining <= 0:
+                return
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return
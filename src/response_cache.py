@@ -0,0 +1,185 @@
+"""
+Content-addressed on-disk cache of agent responses.
+
+Keyed by a SHA-256 over everything that determines the agent's answer:
+the sanitized prompt, the memory state, the model, the repo path, `git rev-parse HEAD`
+of that repo and a fingerprint of its working tree (see proactive._tree_fingerprint).
+A new commit, an uncommitted edit, a memory change or a model switch therefore
+produces a different key; stale entries simply age out.
+
+The memory state is supplied by the caller and must not include earlier turns of the
+same prompt (comm_service uses memory.without_prompt_turns); otherwise every answer
+would change the key of the next identical request and the cache would never hit.
+
+Entries live as one JSON file each under FULLAUTO_HOME/cache/responses.
+- TTL: entries older than RESPONSE_CACHE_TTL_SECONDS are treated as misses and removed.
+- LRU: a hit touches the file's mtime; eviction removes the least recently used
+  entries until both RESPONSE_CACHE_MAX_ENTRIES and RESPONSE_CACHE_MAX_BYTES hold.
+- Repos that are not git repositories are never cached (no way to detect changes).
+
+stats() exposes hit/miss counters and the agent time saved by hits.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from src.ai import _sanitize_prompt, get_model
+from src.logs import get_logger
+from src.proactive import _git, _tree_fingerprint
+
+logger = get_logger(__name__)
+
+FULLAUTO_HOME = Path(os.getenv("FULLAUTO_HOME", str(Path.home() / ".fullauto"))).expanduser()
+CACHE_DIR = FULLAUTO_HOME / "cache" / "responses"
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+async def _git_head(repo: str) -> Optional[str]:
+    """Return the HEAD commit of `repo`, or None if it is not a git repository."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "git", "rev-parse", "HEAD",
+            cwd=repo,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        out, _ = await proc.communicate()
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    return out.decode().strip() or None
+
+
+async def _worktree_fingerprint(repo: str) -> Optional[str]:
+    """Fingerprint of the uncommitted changes in `repo`, or None if git status fails."""
+    status = await _git(repo, "status", "--porcelain=v1", "-z", "--untracked-files=normal")
+    return _tree_fingerprint(repo, status) if status is not None else None
+
+
+class ResponseCache:
+    """LRU + TTL bounded response cache with one file per entry."""
+
+    def __init__(
+        self,
+        directory: Path = CACHE_DIR,
+        *,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    async def make_key(self, prompt: str, memory_state: str, repo: str) -> Optional[str]:
+        """Return the cache key for this request, or None if it must not be cached."""
+        if not self.enabled:
+            return None
+        head = await _git_head(repo)
+        if head is None:
+            return None
+        tree = await _worktree_fingerprint(repo)
+        if tree is None:
+            return None
+        h = hashlib.sha256()
+        for part in (_sanitize_prompt(prompt), memory_state, get_model(), os.path.realpath(repo), head, tree):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response and refresh its LRU position, or None on a miss."""
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if time.time() - float(entry.get("created", 0)) > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        self.saved_seconds += float(entry.get("elapsed", 0.0))
+        logger.info("Response cache hit %s (hits=%d misses=%d)", key[:12], self.hits, self.misses)
+        return str(entry.get("response", ""))
+
+    def put(self, key: str, response: str, elapsed: float = 0.0) -> None:
+        """Store a response (written atomically) and evict down to the configured bounds."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "elapsed": elapsed, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        """(mtime, size, path) for every entry, least recently used first."""
+        entries: list[tuple[float, int, Path]] = []
+        if not self.directory.is_dir():
+            return entries
+        for path in self.directory.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        cutoff = time.time() - self.ttl_seconds
+        total = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for mtime, size, path in entries:
+            # mtime >= created, so anything not touched since the cutoff is certainly expired.
+            if mtime >= cutoff and count <= self.max_entries and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            count -= 1
+
+    def clear(self) -> None:
+        for _, _, path in self._entries():
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, Any]:
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 1),
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,118 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+Concurrent SingleFlight.do() calls with the same key share one underlying task:
+the first caller starts it, later callers attach to it, and everyone gets the same
+result (or exception).
+
+- Each caller waits on the shared task through asyncio.shield, so cancelling one
+  caller only detaches that caller. The shared task is cancelled only when its
+  last waiter goes away.
+- Progress chunks emitted by the shared work are fanned out to every attached
+  caller's on_chunk; callers that join late first get a replay of what was emitted so far.
+  A late joiner is registered before its replay starts, and chunks broadcast while it
+  replays are held back and delivered after the replay, so none are lost or reordered.
+- Side effects that must happen exactly once (e.g. recording memory) belong inside
+  the factory, not in the callers.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Hashable, Optional, TypeVar
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+ChunkCallback = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class _Call:
+    task: Optional[asyncio.Task] = None
+    waiters: int = 0
+    listeners: list[ChunkCallback] = field(default_factory=list)
+    emitted: list[str] = field(default_factory=list)
+
+    async def broadcast(self, chunk: str) -> None:
+        self.emitted.append(chunk)
+        for listener in list(self.listeners):
+            try:
+                await listener(chunk)
+            except Exception:
+                logger.exception("Single-flight chunk listener failed")
+
+
+class _Listener:
+    """A caller's on_chunk that holds live chunks back while a replay is in progress."""
+
+    def __init__(self, on_chunk: ChunkCallback, backlog: list[str]) -> None:
+        self.on_chunk = on_chunk
+        self.backlog = backlog
+        self.held: Optional[list[str]] = [] if backlog else None
+
+    async def __call__(self, chunk: str) -> None:
+        if self.held is not None:
+            self.held.append(chunk)
+        else:
+            await self.on_chunk(chunk)
+
+    async def replay(self) -> None:
+        for chunk in self.backlog:
+            await self.on_chunk(chunk)
+        while self.held:
+            await self.on_chunk(self.held.pop(0))
+        self.held = None
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls by key."""
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(
+        self,
+        key: Hashable,
+        factory: Callable[[ChunkCallback], Awaitable[T]],
+        *,
+        on_chunk: Optional[ChunkCallback] = None,
+    ) -> T:
+        """
+        Run `factory(broadcast)` once per key among concurrent callers and return its result.
+        `broadcast` forwards progress chunks to every caller's on_chunk.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call()
+            call.task = asyncio.create_task(factory(call.broadcast))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget(k, c))
+        else:
+            logger.info("Coalescing identical in-flight request (%d waiter(s) already)", call.waiters)
+        # Join before the first await: a replay that awaits must neither miss chunks nor
+        # let another waiter's cancellation think it is the last one.
+        listener = _Listener(on_chunk, list(call.emitted)) if on_chunk is not None else None
+        if listener is not None:
+            call.listeners.append(listener)
+        call.waiters += 1
+        try:
+            if listener is not None and listener.backlog:
+                await listener.replay()
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+            if listener is not None and listener in call.listeners:
+                call.listeners.remove(listener)
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,105 @@
+"""
+Progressive Discord replies for streamed agent output.
+
+DiscordStreamWriter receives text deltas from ai.generate_response_async(on_chunk=...)
+and keeps a single Discord message up to date by editing it, instead of waiting
+minutes for the CLI to exit before the user sees anything.
+
+- Edits are throttled to one per STREAM_EDIT_INTERVAL_SECONDS per reply, which keeps us
+  well inside Discord's per-channel edit rate limit.
+- When the text outgrows DISCORD_MESSAGE_LIMIT, the reply rolls over into a new
+  message; text is split with delivery.split_for_discord, so code blocks survive.
+- Messages are posted, edited and deleted through the channel's delivery queue
+  (src.delivery), sharing its token bucket and 429 retries with every other reply.
+- finish() reconciles the messages with the agent's final response text. A final text
+  longer than DELIVERY_ATTACHMENT_CHARS replaces the streamed messages with an
+  attachment; streaming stops updating once the text grows past that size.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Optional
+
+import src.delivery as delivery
+from src.delivery import DISCORD_MESSAGE_LIMIT, split_for_discord
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.5"))
+# Appended to the last message while the agent is still producing output.
+_CURSOR = " ▌"
+
+
+class DiscordStreamWriter:
+    """Render a growing response into one or more Discord messages via throttled edits."""
+
+    def __init__(self, channel: Any, interval: float = STREAM_EDIT_INTERVAL_SECONDS):
+        self.channel = channel
+        self.interval = interval
+        self._text = ""
+        self._messages: list[Any] = []
+        self._rendered: list[str] = []
+        self._last_flush = 0.0
+        self._pending: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def push(self, delta: str) -> None:
+        """Append a delta; flush now if the throttle allows, otherwise schedule one flush for later."""
+        self._text += delta
+        wait = self._last_flush + self.interval - time.monotonic()
+        if wait <= 0:
+            await self._flush(final=False)
+        elif self._pending is None or self._pending.done():
+            self._pending = asyncio.create_task(self._delayed_flush(wait))
+
+    async def _delayed_flush(self, wait: float) -> None:
+        await asyncio.sleep(wait)
+        await self._flush(final=False)
+
+    async def _flush(self, final: bool) -> None:
+        async with self._lock:
+            self._last_flush = time.monotonic()
+            text = self._text.strip()
+            if not text:
+                return
+            out = delivery.delivery_for(self.channel)
+            if len(text) > delivery.DELIVERY_ATTACHMENT_CHARS:
+                if final:
+                    await self._render(out, [])
+                    self._messages = list(await out.submit(text, batchable=False))
+                    self._rendered = [""] * len(self._messages)
+                return
+            suffix = "" if final else _CURSOR
+            chunks = split_for_discord(text, DISCORD_MESSAGE_LIMIT - len(suffix))
+            chunks[-1] += suffix
+            await self._render(out, chunks)
+
+    async def _render(self, out: "delivery.ChannelDelivery", bodies: list[str]) -> None:
+        for i, body in enumerate(bodies):
+            if i < len(self._messages):
+                if self._rendered[i] != body:
+                    await out.edit(self._messages[i], body)
+                    self._rendered[i] = body
+            else:
+                sent = await out.submit(body, batchable=False)
+                self._messages.append(sent[0])
+                self._rendered.append(body)
+        # The final text can be shorter than what was streamed; drop leftover messages.
+        for extra in self._messages[len(bodies):]:
+            await out.delete(extra)
+        del self._messages[len(bodies):]
+        del self._rendered[len(bodies):]
+
+    async def finish(self, final_text: Optional[str] = None) -> None:
+        """Cancel any scheduled edit and render the final response without the progress cursor."""
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+        if final_text is not None:
+            self._text = final_text
+        await self._flush(final=True)
+
+    @property
+    def started(self) -> bool:
+        """True once at least one message has been posted."""
+        return bool(self._messages)
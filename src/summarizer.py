@@ -0,0 +1,113 @@
+"""
+Offline extractive summarizer for memory compaction.
+
+Summarizing with the agent CLI takes minutes and spends API quota. extractive_summary()
+instead picks the most informative sentences of the rendered memory entries:
+
+- Sentences are scored by how many of the chunk's salient words they contain
+  (word frequency across the chunk, stopwords removed, length-normalized).
+- Key facts and decisions score higher: decision/commitment verbs ("decided",
+  "will", "must", "fixed"...), numbers, paths, URLs and code identifiers.
+- Filler scores lower: greetings, acknowledgements, "No updates."-style replies
+  and bare questions.
+- Later entries get a small recency boost; repeated sentences are kept once.
+
+The selected sentences are emitted in their original order, prefixed by role, within
+a character budget. Pure Python with no I/O: typical memory chunks take milliseconds.
+"""
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+from src.memory_index import tokenize
+
+SUMMARY_MAX_CHARS = int(os.getenv("MEMORY_EXTRACTIVE_SUMMARY_CHARS", "1200"))
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_ROLE_RE = re.compile(r"^(User|Agent|Summary):\s*")
+_DECISION_RE = re.compile(
+    r"\b(decid\w*|agreed?|will|must|should|need(?:s|ed)? to|plan(?:ned)?|chose|switch(?:ed)? to|"
+    r"use[sd]?|fix(?:ed|es)?|added|removed|renamed|deploy(?:ed)?|merged|released|todo|deadline|"
+    r"prefer(?:s|red)?|always|never|broke(?:n)?|fail(?:s|ed|ing)?|error)\b",
+    re.IGNORECASE,
+)
+_FACT_RE = re.compile(r"\d|https?://|[\w-]+/[\w./-]+|\w+\.\w{1,5}\b|`[^`]+`|\b\w+_\w+\b|\b[A-Z]{2,}\b")
+_FILLER_RE = re.compile(
+    r"^(hi|hello|hey|thanks|thank you|ok(ay)?|sure|got it|sounds good|no updates?|nothing (new|to report))\b",
+    re.IGNORECASE,
+)
+
+_DECISION_BOOST = 1.0
+_FACT_BOOST = 0.5
+_FILLER_PENALTY = 0.2
+_QUESTION_PENALTY = 0.6
+_RECENCY_BOOST = 0.3
+
+
+def _split_sentences(message: str) -> tuple[str, list[str]]:
+    """Return (role label, sentences) for one rendered memory entry; summaries carry no label."""
+    match = _ROLE_RE.match(message)
+    label = match.group(1) if match and match.group(1) != "Summary" else ""
+    body = message[match.end():] if match else message
+    return label, [s.strip(" -\t") for s in _SENTENCE_RE.split(body) if s.strip(" -\t")]
+
+
+def _score(sentence: str, freq: Counter, position: float) -> float:
+    words = tokenize(sentence)
+    if not words:
+        return 0.0
+    score = sum(freq[w] for w in set(words)) / (len(set(words)) ** 0.5)
+    if _DECISION_RE.search(sentence):
+        score += _DECISION_BOOST * score + _DECISION_BOOST
+    if _FACT_RE.search(sentence):
+        score += _FACT_BOOST * score + _FACT_BOOST
+    if _FILLER_RE.match(sentence):
+        score *= _FILLER_PENALTY
+    if sentence.endswith("?"):
+        score *= _QUESTION_PENALTY
+    return score * (1 + _RECENCY_BOOST * position)
+
+
+def extractive_summary(messages: list[str], *, max_chars: Optional[int] = None) -> str:
+    """Summarize rendered memory entries by picking their highest-scoring sentences (oldest first)."""
+    budget = SUMMARY_MAX_CHARS if max_chars is None else max_chars
+    sentences: list[tuple[str, str]] = []  # (label, sentence) in original order
+    positions: list[float] = []
+    for i, message in enumerate(messages):
+        label, parts = _split_sentences(message)
+        for part in parts:
+            sentences.append((label, part))
+            positions.append(i / max(len(messages) - 1, 1))
+    if not sentences:
+        return ""
+
+    counts = Counter(w for _, s in sentences for w in tokenize(s))
+    top = max(counts.values(), default=1)
+    freq = Counter({w: c / top for w, c in counts.items()})
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: _score(sentences[i][1], freq, positions[i]),
+        reverse=True,
+    )
+
+    picked: list[int] = []
+    seen: set[str] = set()
+    used = 0
+    for i in ranked:
+        label, sentence = sentences[i]
+        normalized = " ".join(_WORD_RE.findall(sentence.lower()))
+        if not normalized or normalized in seen:
+            continue
+        line = f"{label}: {sentence}" if label else sentence
+        if picked and used + len(line) + 1 > budget:
+            continue
+        picked.append(i)
+        seen.add(normalized)
+        used += len(line) + 1
+    out = []
+    for i in sorted(picked):
+        label, sentence = sentences[i]
+        out.append(f"{label}: {sentence}" if label else sentence)
+    return " ".join(out)[:budget].strip()
@@ -0,0 +1,129 @@
+"""
+Event-loop lag watchdog.
+
+A blocking call on the event loop (file locks, disk I/O, subprocess.run...) delays
+every other coroutine, including discord.py's gateway heartbeat. LoopWatchdog
+makes such stalls visible:
+
+- A heartbeat coroutine sleeps LOOP_WATCHDOG_INTERVAL_SECONDS at a time and records
+  how late it woke up (scheduling lag): max lag and a count of lags over the threshold.
+- A watcher thread notices when the heartbeat has not run for longer than
+  LOOP_WATCHDOG_THRESHOLD_SECONDS *while the loop is still blocked* and captures the
+  loop thread's current stack (via sys._current_frames) and the running task, so the
+  log shows exactly which call is blocking. Each stall is captured once.
+
+Opt-in with LOOP_WATCHDOG=1 (see main._run_all). stats() exposes the counters.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Optional
+
+from src.logs import get_logger
+
+logger = get_logger(__name__)
+
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "0") == "1"
+LOOP_WATCHDOG_THRESHOLD_SECONDS = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_SECONDS", "0.25"))
+LOOP_WATCHDOG_INTERVAL_SECONDS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_SECONDS", "0.1"))
+
+
+class LoopWatchdog:
+    """Measures event-loop scheduling lag and captures the stack of whatever blocks the loop."""
+
+    def __init__(
+        self,
+        *,
+        threshold: float = LOOP_WATCHDOG_THRESHOLD_SECONDS,
+        interval: float = LOOP_WATCHDOG_INTERVAL_SECONDS,
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._captured_beat: Optional[float] = None
+        self.max_lag = 0.0
+        self.lag_events = 0
+        self.blocked_events = 0
+        self.last_blocked_stack = ""
+        self.last_blocked_task = ""
+
+    def start(self) -> None:
+        """Start watching the running loop; call from a coroutine."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("Loop watchdog started: threshold=%.3fs interval=%.3fs", self.threshold, self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            self._record_lag(max(now - started - self.interval, 0.0))
+
+    def _record_lag(self, lag: float) -> None:
+        with self._lock:
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.lag_events += 1
+                logger.warning("Event loop lag %.3fs (threshold %.3fs)", lag, self.threshold)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled > self.threshold and self._captured_beat != beat:
+                self._captured_beat = beat
+                self._capture(stalled)
+
+    def _capture(self, stalled: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        task_name = task.get_name() if task is not None else "<no task>"
+        with self._lock:
+            self.blocked_events += 1
+            self.last_blocked_stack = stack
+            self.last_blocked_task = task_name
+        logger.warning(
+            "Event loop blocked for %.3fs+ in task %s; loop thread stack:\n%s", stalled, task_name, stack
+        )
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "max_lag": round(self.max_lag, 3),
+                "lag_events": self.lag_events,
+                "blocked_events": self.blocked_events,
+                "last_blocked_task": self.last_blocked_task,
+            }
+
+
+def start_watchdog_if_enabled() -> Optional[LoopWatchdog]:
+    """Start a LoopWatchdog on the running loop when LOOP_WATCHDOG=1."""
+    if not LOOP_WATCHDOG:
+        return None
+    watchdog = LoopWatchdog()
+    watchdog.start()
+    return watchdog
@@ -1,6 +1,13 @@
 """Pytest fixtures and configuration."""
+import os
+import tempfile
+
 import pytest
 
+# Module-level stores (memory, config, response cache) are opened at import time under
+# FULLAUTO_HOME, so point it away from the user's ~/.fullauto before any src import.
+os.environ["FULLAUTO_HOME"] = tempfile.mkdtemp(prefix="fullauto-tests-")
+
 
 @pytest.fixture(autouse=True)
 def reset_logger_config():
@@ -9,3 +16,32 @@ def reset_logger_config():
     logs_module._configured = False
     yield
     logs_module._configured = False
+
+
+@pytest.fixture(autouse=True)
+def isolated_response_cache(tmp_path, monkeypatch):
+    """Point the response cache at a per-test directory so runs never hit each other's entries."""
+    import src.response_cache as response_cache_module
+    monkeypatch.setattr(response_cache_module.response_cache, "directory", tmp_path / "response_cache")
+    yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_memory(tmp_path, monkeypatch):
+    """Point the default memory store and every namespace at a per-test directory."""
+    import src.memory as memory
+    from src.memory_index import LexicalIndex
+
+    qdir = tmp_path / ".fullauto_memory"
+    qdir.mkdir(parents=True, exist_ok=True)
+    monkeypatch.setattr(memory, "QUEUE_DIR", qdir)
+    monkeypatch.setattr(memory, "LOCK_FILE", qdir / ".lock")
+    monkeypatch.setattr(memory, "store", memory.open_store(qdir))
+    monkeypatch.setattr(memory, "_index", LexicalIndex())
+    monkeypatch.setattr(memory, "_namespaces", {})
+    monkeypatch.setattr(memory, "_snapshots", {})
+    yield
+    memory.wait_for_compaction(timeout=5)
+    memory.store.close()
+    for ns_store, _ in memory._namespaces.values():
+        ns_store.close()
@@ -1,5 +1,8 @@
 """Tests for src.ai."""
-from unittest.mock import patch, MagicMock
+import asyncio
+import os
+import sys
+from unittest.mock import patch
 
 import pytest
 
@@ -35,32 +38,151 @@ def test_generate_response_empty_prompt_raises():
         ai.generate_response("   ")
 
 
-@patch("src.ai.subprocess.run")
-def test_generate_response_success_returns_stdout(mock_run):
-    mock_run.return_value = MagicMock(returncode=0, stdout="Agent says hi", stderr="")
-    assert ai.generate_response("hello") == "Agent says hi"
-    mock_run.assert_called_once()
-    call_args = mock_run.call_args[0][0]
-    assert call_args[0] == "agent"
-    assert "-p" in call_args
-    assert "--force" in call_args
-    assert "hello" in call_args
+def _python_cmd(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
 
 
-@patch("src.ai.subprocess.run")
-def test_generate_response_failure_raises_agent_error(mock_run):
-    mock_run.return_value = MagicMock(returncode=1, stdout="", stderr="agent failed")
-    with pytest.raises(AgentError) as exc_info:
-        ai.generate_response("hello")
+def test_generate_response_success_returns_stdout():
+    with patch("src.ai._build_command", return_value=_python_cmd("print('Agent says hi')")) as mock_build:
+        assert ai.generate_response("hello").strip() == "Agent says hi"
+    mock_build.assert_called_once_with("hello", stream=False)
+
+
+def test_build_command_runs_agent_with_sanitized_prompt():
+    cmd = ai._build_command("  user input  ")
+    assert cmd[0] == "agent"
+    assert "-p" in cmd and "--force" in cmd
+    assert "user input" in cmd
+    assert cmd[-1].startswith("--output-format")
+
+
+def test_generate_response_failure_raises_agent_error():
+    code = "import sys; sys.stderr.write('agent failed'); sys.exit(1)"
+    with patch("src.ai._build_command", return_value=_python_cmd(code)):
+        with pytest.raises(AgentError) as exc_info:
+            ai.generate_response("hello")
     assert "error" in str(exc_info.value).lower()
     assert exc_info.value.stderr == "agent failed"
-    mock_run.assert_called_once()
 
 
-@patch("src.ai.subprocess.run")
-def test_generate_response_sanitizes_prompt_before_calling_agent(mock_run):
-    mock_run.return_value = MagicMock(returncode=0, stdout="ok", stderr="")
-    ai.generate_response("  user input  ")
-    call_args = mock_run.call_args[0][0]
-    assert "user input" in call_args
-    assert call_args[-1].startswith("--output-format")
+def test_generate_response_timeout_raises_agent_error_and_kills_group():
+    with patch("src.ai._build_command", return_value=_python_cmd("import time; time.sleep(30)")):
+        with patch("src.ai.os.killpg", wraps=os.killpg) as mock_killpg:
+            with pytest.raises(AgentError) as exc_info:
+                ai.generate_response("hello", timeout=0.2)
+    assert exc_info.value.stderr == "timeout"
+    mock_killpg.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_generate_response_works_when_called_on_event_loop_thread():
+    with patch("src.ai._build_command", return_value=_python_cmd("print('hi')")):
+        assert ai.generate_response("hello").strip() == "hi"
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_returns_stdout():
+    with patch("src.ai._build_command", return_value=_python_cmd("print('Agent says hi')")):
+        assert (await ai.generate_response_async("hello")).strip() == "Agent says hi"
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_empty_prompt_raises():
+    with pytest.raises(EmptyPromptError):
+        await ai.generate_response_async("   ")
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_failure_raises_agent_error():
+    code = "import sys; sys.stderr.write('agent failed'); sys.exit(1)"
+    with patch("src.ai._build_command", return_value=_python_cmd(code)):
+        with pytest.raises(AgentError) as exc_info:
+            await ai.generate_response_async("hello")
+    assert exc_info.value.stderr == "agent failed"
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_timeout_kills_process_group():
+    with patch("src.ai._build_command", return_value=_python_cmd("import time; time.sleep(30)")):
+        with patch("src.ai.os.killpg", wraps=os.killpg) as mock_killpg:
+            with pytest.raises(AgentError) as exc_info:
+                await ai.generate_response_async("hello", timeout=0.2)
+    assert exc_info.value.stderr == "timeout"
+    mock_killpg.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_cancel_kills_process_group():
+    with patch("src.ai._build_command", return_value=_python_cmd("import time; time.sleep(30)")):
+        with patch("src.ai.os.killpg", wraps=os.killpg) as mock_killpg:
+            task = asyncio.create_task(ai.generate_response_async("hello"))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+    mock_killpg.assert_called()
+
+
+def test_build_command_stream_uses_stream_json():
+    cmd = ai._build_command("hello", stream=True)
+    assert "--output-format=stream-json" in cmd
+    assert "--stream-partial-output" in cmd
+
+
+def test_stream_json_parser_collects_deltas_and_prefers_result():
+    parser = ai._StreamJsonParser()
+    assert parser.feed('{"type":"system","subtype":"init"}\n') == ""
+    assert parser.feed('{"type":"assistant","message":{"content":[{"type":"text","text":"Hel"}]}}\n') == "Hel"
+    assert parser.feed('{"type":"assistant","message":{"content":[{"type":"text","text":"lo"}]}}\n') == "lo"
+    assert parser.text() == "Hello"
+    parser.feed('{"type":"result","subtype":"success","result":"Hello!"}\n')
+    assert parser.text() == "Hello!"
+
+
+def test_stream_json_parser_passes_plain_text_through():
+    parser = ai._StreamJsonParser()
+    assert parser.feed("plain output\n") == "plain output\n"
+    assert parser.text() == "plain output\n"
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_streams_chunks():
+    code = (
+        "import json, sys\n"
+        "for t in ['Hel', 'lo']:\n"
+        "    print(json.dumps({'type': 'assistant', 'message': {'content': [{'type': 'text', 'text': t}]}}), flush=True)\n"
+        "print(json.dumps({'type': 'result', 'result': 'Hello'}), flush=True)\n"
+    )
+    chunks: list[str] = []
+
+    async def on_chunk(text):
+        chunks.append(text)
+
+    with patch("src.ai._build_command", return_value=_python_cmd(code)):
+        result = await ai.generate_response_async("hello", on_chunk=on_chunk)
+    assert chunks == ["Hel", "lo"]
+    assert result == "Hello"
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_reports_pid():
+    pids = []
+    with patch("src.ai._build_command", return_value=_python_cmd("print('hi')")):
+        await ai.generate_response_async("hello", on_start=pids.append)
+    assert len(pids) == 1 and pids[0] > 0
+
+
+@pytest.mark.asyncio
+async def test_generate_response_async_reader_failure_kills_process_group():
+    # A stream-json line longer than the reader limit makes readline() raise.
+    code = "import sys, time; sys.stdout.write('x' * 200000); sys.stdout.flush(); time.sleep(30)"
+
+    async def noop(_chunk):
+        pass
+
+    with patch("src.ai._build_command", return_value=_python_cmd(code)):
+        with patch("src.ai._STREAM_LINE_LIMIT", 1024):
+            with patch("src.ai.os.killpg", wraps=os.killpg) as mock_killpg:
+                with pytest.raises(ValueError):
+                    await asyncio.wait_for(ai.generate_response_async("hello", on_chunk=noop), timeout=10)
+    mock_killpg.assert_called()
@@ -1,13 +1,28 @@
 """Tests for src.comm_service."""
+import asyncio
+import subprocess
 from unittest.mock import AsyncMock, MagicMock, patch
 import os
 
 import pytest
 
-from src.comm_service import agent_run, client, listen_to_discord, on_message
+import src.comm_service as comm_service
+import src.memory as memory
+from src.comm_service import _build_memory_prefix, agent_run, client, listen_to_discord, on_message
+from src.inbox import Inbox
+from src.memory import Message, namespace_for
 from src.schema import AgentError, EmptyPromptError, EnvironmentVariablesNotFoundError
 
 
+@pytest.fixture(autouse=True)
+def reset_prefix_cache():
+    comm_service._prefix_cache.clear()
+    with patch("src.comm_service.asearch_archive", new_callable=AsyncMock, return_value=[]):
+        with patch("src.comm_service.inbox", Inbox(channel_max_depth=5, global_max_depth=10, debounce_seconds=0)):
+            yield
+    comm_service._prefix_cache.clear()
+
+
 def test_listen_to_discord_raises_when_discord_token_missing():
     with patch("src.comm_service.token", ""):
         with patch("src.comm_service.cursor_api_key", "key"):
@@ -26,9 +41,9 @@ def test_listen_to_discord_raises_when_cursor_api_key_missing():
 
 @pytest.mark.asyncio
 async def test_agent_run_calls_generate_response_and_add_memory():
-    with patch("src.comm_service.ai.generate_response") as mock_gen:
-        with patch("src.comm_service.add_memory") as mock_add:
-            with patch("src.comm_service.list_messages", return_value=["prior"]):
+    with patch("src.comm_service.ai.generate_response_async", new_callable=AsyncMock) as mock_gen:
+        with patch("src.comm_service.aadd_turn", new_callable=AsyncMock) as mock_add:
+            with patch("src.comm_service.alist_message_objects", new_callable=AsyncMock, return_value=[Message("user", "prior", ts=0)]):
                 mock_gen.return_value = "Agent reply"
                 result = await agent_run("user prompt")
                 assert result == "Agent reply"
@@ -55,25 +70,122 @@ async def test_on_message_calls_agent_run_and_sends_reply():
     mock_message.author = MagicMock()
     mock_message.author.__eq__ = lambda self, other: False  # not client.user
     mock_message.content = "hello"
+    mock_message.channel.id = 42
     mock_message.channel.send = AsyncMock()
     mock_message.add_reaction = AsyncMock()
-    with patch("src.comm_service.agent_run", new_callable=AsyncMock) as mock_agent:
-        mock_agent.return_value = "agent said hi"
-        await on_message(mock_message)
-        mock_agent.assert_called_once_with("hello")
-        mock_message.channel.send.assert_called_once_with("agent said hi")
+    with patch("src.comm_service.STREAM_RESPONSES", False):
+        with patch("src.comm_service.agent_run", new_callable=AsyncMock) as mock_agent:
+            mock_agent.return_value = "agent said hi"
+            await on_message(mock_message)
+            mock_agent.assert_called_once_with("hello", source="discord", namespace=namespace_for(channel_id=42, repo_path=comm_service.ai.repo_path))
+            mock_message.channel.send.assert_called_once_with("agent said hi")
+
+
+@pytest.mark.asyncio
+async def test_on_message_streams_reply_through_writer():
+    mock_message = MagicMock()
+    mock_message.author = MagicMock()
+    mock_message.content = "hello"
+    sent = MagicMock()
+    sent.edit = AsyncMock()
+    mock_message.channel.send = AsyncMock(return_value=sent)
+    mock_message.add_reaction = AsyncMock()
+
+    async def fake_agent_run(prompt, *, source, on_chunk, namespace):
+        await on_chunk("agent ")
+        await on_chunk("said hi")
+        return "agent said hi"
+
+    with patch("src.comm_service.STREAM_RESPONSES", True):
+        with patch("src.comm_service.agent_run", side_effect=fake_agent_run):
+            await on_message(mock_message)
+    mock_message.channel.send.assert_called_once()
+    assert sent.edit.call_args.kwargs["content"] == "agent said hi"
+
+
+def _discord_message(content, channel):
+    message = MagicMock()
+    message.author = MagicMock()
+    message.content = content
+    message.channel = channel
+    message.add_reaction = AsyncMock()
+    return message
+
+
+@pytest.mark.asyncio
+async def test_on_message_queues_second_request_and_replies_with_position():
+    channel = MagicMock()
+    channel.id = 7
+    channel.send = AsyncMock()
+    release = asyncio.Event()
+    prompts = []
+
+    async def fake_agent_run(prompt, *, source, namespace):
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            await release.wait()
+        return f"done {prompt}"
+
+    with patch("src.comm_service.STREAM_RESPONSES", False):
+        with patch("src.comm_service.agent_run", side_effect=fake_agent_run):
+            first = asyncio.create_task(on_message(_discord_message("one", channel)))
+            await asyncio.sleep(0.01)
+            second = asyncio.create_task(on_message(_discord_message("two", channel)))
+            await asyncio.sleep(0.01)
+            assert prompts == ["one"]
+            assert comm_service.inbox.depth(7) == 1
+            release.set()
+            await asyncio.gather(first, second)
+    sent = [c.args[0] for c in channel.send.await_args_list]
+    assert "position 1" in sent[0]
+    assert sent[1:] == ["done one", "done two"]
+
+
+@pytest.mark.asyncio
+async def test_on_message_coalesces_burst_from_same_author():
+    channel = MagicMock()
+    channel.id = 9
+    channel.send = AsyncMock()
+    author = MagicMock()
+    messages = [_discord_message(text, channel) for text in ("first", "second", "third")]
+    for m in messages:
+        m.author = author
+    with patch("src.comm_service.inbox", Inbox(channel_max_depth=5, global_max_depth=10, debounce_seconds=0.05)):
+        with patch("src.comm_service.STREAM_RESPONSES", False):
+            with patch("src.comm_service.agent_run", new_callable=AsyncMock, return_value="ok") as mock_agent:
+                tasks = []
+                for m in messages:
+                    tasks.append(asyncio.create_task(on_message(m)))
+                    await asyncio.sleep(0.01)
+                await asyncio.gather(*tasks)
+    mock_agent.assert_called_once_with("first\nsecond\nthird", source="discord", namespace=namespace_for(channel_id=9, repo_path=comm_service.ai.repo_path))
+    channel.send.assert_awaited_once_with("ok")
+
+
+@pytest.mark.asyncio
+async def test_on_message_rejects_when_inbox_full():
+    channel = MagicMock()
+    channel.id = 8
+    channel.send = AsyncMock()
+    with patch("src.comm_service.inbox", Inbox(channel_max_depth=0, global_max_depth=10, debounce_seconds=0)) as inbox:
+        inbox.submit(8, "busy")
+        with patch("src.comm_service.agent_run", new_callable=AsyncMock) as mock_agent:
+            await on_message(_discord_message("hello", channel))
+    mock_agent.assert_not_called()
+    assert "Busy" in channel.send.await_args.args[0]
 
 
 @pytest.mark.asyncio
 async def test_on_message_sends_error_and_does_not_add_memory_on_agent_error():
-    """When generate_response raises, on_message sends the error and add_memory is never called."""
+    """When the agent raises, on_message sends the error and nothing is added to memory."""
     mock_message = MagicMock()
     mock_message.author = MagicMock()
     mock_message.content = "hello"
+    mock_message.channel.id = 1
     mock_message.channel.send = AsyncMock()
     mock_message.add_reaction = AsyncMock()
-    with patch("src.comm_service.ai.generate_response") as mock_gen:
-        with patch("src.memory.add_memory") as mock_add:
+    with patch("src.comm_service.ai.generate_response_async", new_callable=AsyncMock) as mock_gen:
+        with patch("src.comm_service.aadd_turn", new_callable=AsyncMock) as mock_add:
             mock_gen.side_effect = AgentError("Sorry, something went wrong.")
             await on_message(mock_message)
             mock_message.channel.send.assert_called_once_with("Sorry, something went wrong.")
@@ -112,3 +224,216 @@ async def test_on_message_cwd_invalid_path_sends_error():
                 await on_message(mock_message)
                 mock_message.channel.send.assert_called_once()
                 assert mock_ai.REPO_PATH == "/tmp/old"
+
+
+@pytest.mark.asyncio
+async def test_agent_run_serves_repeated_prompt_from_cache(tmp_path):
+    # End to end against the real (temporary) memory store: recording each answer
+    # must not change the key of the next identical request.
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for args in (["init", "-q"], ["config", "user.email", "t@example.com"], ["config", "user.name", "t"]):
+        subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+    (repo / "a.txt").write_text("one")
+    subprocess.run(["git", "add", "a.txt"], cwd=repo, check=True, capture_output=True)
+    subprocess.run(["git", "commit", "-q", "-m", "init"], cwd=repo, check=True, capture_output=True)
+    memory.add_turn("earlier question", "earlier answer", namespace="task-nightly")
+
+    cache = comm_service.response_cache
+    hits, misses = cache.hits, cache.misses
+    with patch("src.comm_service.ai.repo_path", str(repo)):
+        with patch("src.comm_service.ai.generate_response_async", new_callable=AsyncMock, return_value="Agent reply") as mock_gen:
+            for _ in range(3):
+                assert await agent_run("status?", source="scheduler", namespace="task-nightly") == "Agent reply"
+            assert mock_gen.call_count == 1
+            assert (cache.hits - hits, cache.misses - misses) == (2, 1)
+            # Only the run that reached the agent is recorded.
+            assert memory.list_messages("task-nightly")[-2:] == ["User: status?", "Agent: Agent reply"]
+            assert memory.get_message_count("task-nightly") == 4
+
+            # An uncommitted edit invalidates the entry.
+            (repo / "a.txt").write_text("two")
+            await agent_run("status?", source="scheduler", namespace="task-nightly")
+            assert mock_gen.call_count == 2
+
+            # A different memory state invalidates it too.
+            memory.add_turn("another question", "another answer", namespace="task-nightly")
+            await agent_run("status?", source="scheduler", namespace="task-nightly")
+            assert mock_gen.call_count == 3
+
+            assert await agent_run("status?", source="scheduler", namespace="task-nightly", use_cache=False)
+            assert mock_gen.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_agent_run_coalesces_identical_concurrent_prompts():
+    async def slow_reply(prompt, on_chunk=None, on_start=None):
+        await asyncio.sleep(0.01)
+        return "Agent reply"
+
+    with patch("src.comm_service.ai.generate_response_async", side_effect=slow_reply) as mock_gen:
+        with patch("src.comm_service.aadd_turn", new_callable=AsyncMock) as mock_add:
+            with patch("src.comm_service.alist_message_objects", new_callable=AsyncMock, return_value=[]):
+                results = await asyncio.gather(
+                    agent_run("same question", use_cache=False),
+                    agent_run("same question", use_cache=False),
+                    agent_run("same question", use_cache=False),
+                )
+    assert results == ["Agent reply"] * 3
+    assert mock_gen.call_count == 1
+    mock_add.assert_called_once()
+
+
+def test_build_memory_prefix_keeps_whole_entries_within_token_budget():
+    prior = [Message("user", f"message {i} " + "x" * 40, ts=i, meta={"tokens": 12}) for i in range(10)]
+    with patch("src.comm_service.MAX_MEMORY_PROMPT_TOKENS", 30):
+        prefix = _build_memory_prefix(prior)
+    lines = prefix.split("\n")
+    assert lines == [f"User: message {i} " + "x" * 40 for i in (8, 9)]
+
+
+def test_build_memory_prefix_always_includes_latest_summary():
+    prior = [
+        Message("system", "old summary", ts=0, kind="summary", meta={"tokens": 5}),
+        Message("system", "latest summary", ts=1, kind="summary", meta={"tokens": 5}),
+    ] + [Message("user", f"m{i}", ts=2 + i, meta={"tokens": 10}) for i in range(5)]
+    with patch("src.comm_service.MAX_MEMORY_PROMPT_TOKENS", 25):
+        prefix = _build_memory_prefix(prior)
+    assert prefix.split("\n") == ["Summary: latest summary", "User: m3", "User: m4"]
+
+
+@pytest.mark.asyncio
+async def test_memory_prefix_is_cached_until_memory_changes():
+    objs = [Message("user", "prior", ts=0)]
+    with patch("src.comm_service.alist_message_objects", new_callable=AsyncMock, return_value=objs) as mock_list:
+        with patch("src.comm_service.amemory_generation", new_callable=AsyncMock, return_value=1) as mock_version:
+            assert await comm_service._memory_prefix() == "User: prior"
+            assert await comm_service._memory_prefix() == "User: prior"
+            assert mock_list.call_count == 1
+            mock_version.return_value = 2
+            await comm_service._memory_prefix()
+            assert mock_list.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_recalled_context_skips_entries_already_in_prefix():
+    hits = ["User: deploy target?\nAgent: staging", "User: hi\nAgent: hello"]
+    with patch("src.comm_service.asearch_archive", new_callable=AsyncMock, return_value=hits):
+        recalled = await comm_service._recalled_context("where do we deploy", "User: hi\nAgent: hello")
+    assert recalled == "Relevant earlier context:\nUser: deploy target?\nAgent: staging"
+
+
+@pytest.mark.asyncio
+async def test_agent_run_reads_and_writes_only_its_namespace():
+    with patch("src.comm_service.ai.generate_response_async", new_callable=AsyncMock, return_value="ok"):
+        with patch("src.comm_service.aadd_turn", new_callable=AsyncMock) as mock_add:
+            with patch("src.comm_service.alist_message_objects", new_callable=AsyncMock, return_value=[]) as mock_list:
+                with patch("src.comm_service.amemory_generation", new_callable=AsyncMock, return_value=0) as mock_version:
+                    await agent_run("hi", use_cache=False, namespace="discord-7")
+    mock_version.assert_called_once_with("discord-7")
+    mock_list.assert_called_once_with("discord-7")
+    assert mock_add.call_args.kwargs["namespace"] == "discord-7"
+
+
+@pytest.mark.asyncio
+async def test_on_message_reset_memory_only_clears_channel_namespace():
+    mock_message = MagicMock()
+    mock_message.author = MagicMock()
+    mock_message.content = "/reset-memory"
+    mock_message.channel.id = 9
+    mock_message.channel.send = AsyncMock()
+    mock_message.add_reaction = AsyncMock()
+    with patch("src.comm_service.areset_memory", new_callable=AsyncMock) as mock_reset:
+        await on_message(mock_message)
+    mock_reset.assert_called_once_with(namespace_for(channel_id=9, repo_path=comm_service.ai.repo_path))
+
+
+@pytest.mark.asyncio
+async def test_proactive_loop_skips_agent_when_nothing_changed():
+    from src.proactive import ProactivePacer, ProactiveState
+
+    channel = MagicMock()
+    channel.send = AsyncMock()
+    state = ProactiveState(head="abc", tree="t", memory_generation=1, last_activity=0.0)
+    pacer = ProactivePacer(10, max_interval=100, factor=2)
+    ticks = iter([False, False, False, True])
+    with patch("src.comm_service._get_target_channel", new_callable=AsyncMock, return_value=channel), \
+            patch("src.comm_service.PROACTIVE_CHANNEL_ID", "1"), \
+            patch("src.comm_service.proactive_pacer", pacer), \
+            patch.object(pacer, "sleep", new_callable=AsyncMock), \
+            patch("src.comm_service.capture_state", new_callable=AsyncMock, return_value=state), \
+            patch.object(client, "wait_until_ready", new_callable=AsyncMock), \
+            patch.object(client, "is_closed", side_effect=lambda: next(ticks)), \
+            patch("src.comm_service.agent_run", new_callable=AsyncMock, return_value="No updates.") as mock_agent:
+        await comm_service._proactive_loop()
+    mock_agent.assert_called_once()
+    assert mock_agent.call_args.kwargs["use_cache"] is False
+    # One quiet reply plus two skipped ticks: 10 -> 20 -> 40 -> 80.
+    assert pacer.interval == 80
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_running_agent_and_reports_error():
+    from src.job_registry import registry
+
+    started = asyncio.Event()
+
+    async def long_run(prompt, on_chunk=None, on_start=None):
+        on_start(4321)
+        started.set()
+        await asyncio.sleep(10)
+        return "never"
+
+    with patch("src.comm_service.ai.generate_response_async", side_effect=long_run):
+        with patch("src.comm_service.aadd_turn", new_callable=AsyncMock) as mock_add:
+            with patch("src.comm_service.alist_message_objects", new_callable=AsyncMock, return_value=[]):
+                run = asyncio.create_task(agent_run("long job", source="scheduler", use_cache=False))
+                await started.wait()
+                [job] = [j for j in registry.jobs() if j.preview == "long job"]
+                assert job.pid == 4321 and job.source == "scheduler"
+                assert registry.cancel(job.id)
+                with pytest.raises(AgentError) as exc_info:
+                    await run
+    assert f"#{job.id}" in str(exc_info.value)
+    mock_add.assert_not_called()
+    assert registry.get(job.id) is None
+    assert comm_service.scheduler.stats()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_on_message_jobs_and_cancel_commands():
+    channel = MagicMock()
+    channel.id = 11
+    channel.send = AsyncMock()
+    with patch("src.comm_service.registry") as mock_registry:
+        mock_registry.jobs.return_value = []
+        mock_registry.cancel.return_value = False
+        await on_message(_discord_message("/jobs", channel))
+        await on_message(_discord_message("/cancel #7", channel))
+        await on_message(_discord_message("/cancel abc", channel))
+    mock_registry.cancel.assert_called_once_with(7)
+    sent = [c.args[0] for c in channel.send.await_args_list]
+    assert sent == ["No agent jobs in flight.", "No job #7 is in flight.", "Usage: /cancel <job id> (see /jobs)"]
+
+
+@pytest.mark.asyncio
+async def test_on_message_finalizes_partial_stream_on_agent_error():
+    channel = MagicMock()
+    channel.id = 12
+    partial = MagicMock()
+    partial.edit = AsyncMock()
+    channel.send = AsyncMock(return_value=partial)
+
+    async def failing_agent_run(prompt, *, source, on_chunk, namespace):
+        await on_chunk("partial answer")
+        await on_chunk(" more")  # throttled: schedules a delayed edit
+        raise AgentError("Sorry, something went wrong.")
+
+    with patch("src.comm_service.STREAM_RESPONSES", True):
+        with patch("src.comm_service.agent_run", side_effect=failing_agent_run):
+            await on_message(_discord_message("hello", channel))
+    await asyncio.sleep(0.05)
+    sent = [c.args[0] for c in channel.send.await_args_list]
+    assert sent == ["partial answer ▌", "Sorry, something went wrong."]
+    # The partial reply ends without the cursor and no late edit brings it back.
+    partial.edit.assert_awaited_once_with(content="partial answer more")
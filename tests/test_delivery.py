@@ -0,0 +1,127 @@
+"""Tests for src.delivery."""
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import discord
+import pytest
+
+from src.delivery import ChannelDelivery, deliver, delivery_for, split_for_discord
+
+
+def _channel():
+    channel = MagicMock()
+    channel.send = AsyncMock()
+    return channel
+
+
+def test_split_short_text_is_single_chunk():
+    assert split_for_discord("hello") == ["hello"]
+
+
+def test_split_prefers_paragraph_boundaries():
+    text = "a" * 60 + "\n\n" + "b" * 60
+    assert split_for_discord(text, limit=100) == ["a" * 60, "b" * 60]
+
+
+def test_split_keeps_code_block_together_when_it_fits():
+    text = "intro " * 10 + "\n```py\n" + "x = 1\n" * 10 + "```"
+    chunks = split_for_discord(text, limit=100)
+    assert chunks[1].startswith("```py\n") and chunks[1].endswith("```")
+    assert all(len(c) <= 100 for c in chunks)
+
+
+def test_split_closes_and_reopens_long_code_block():
+    text = "```python\n" + "\n".join(f"line_{i} = {i}" for i in range(40)) + "\n```"
+    chunks = split_for_discord(text, limit=120)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 120
+        assert chunk.startswith("```python\n")
+        assert chunk.endswith("```")
+        assert chunk.count("```") == 2
+
+
+@pytest.mark.asyncio
+async def test_deliver_splits_long_text():
+    channel = _channel()
+    await deliver(channel, "para one\n\n" + "word " * 500)
+    assert channel.send.await_count == 2
+    sent = [c.args[0] for c in channel.send.await_args_list]
+    assert sent[0].startswith("para one\n\nword")
+    assert all(len(m) <= 2000 for m in sent)
+
+
+@pytest.mark.asyncio
+async def test_deliver_large_text_as_attachment():
+    channel = _channel()
+    with patch("src.delivery.DELIVERY_ATTACHMENT_CHARS", 1000):
+        await deliver(channel, "line\n" * 500)
+    channel.send.assert_awaited_once()
+    attachment = channel.send.await_args.kwargs["file"]
+    assert isinstance(attachment, discord.File)
+    assert attachment.filename == "response.md"
+    assert "Full response attached" in channel.send.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_small_messages_queued_while_busy_are_batched():
+    channel = _channel()
+    delivery = ChannelDelivery(channel)
+    futures = [delivery.submit(f"msg {i}") for i in range(3)]
+    await asyncio.gather(*futures)
+    channel.send.assert_awaited_once_with("msg 0\n\nmsg 1\n\nmsg 2")
+    assert delivery.batched == 2
+
+
+@pytest.mark.asyncio
+async def test_unbatchable_message_is_sent_on_its_own():
+    channel = _channel()
+    delivery = ChannelDelivery(channel)
+    futures = [delivery.submit("a"), delivery.submit("b", batchable=False), delivery.submit("c")]
+    await asyncio.gather(*futures)
+    assert [c.args[0] for c in channel.send.await_args_list] == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_sends_are_paced_by_bucket():
+    channel = _channel()
+    delivery = ChannelDelivery(channel, bucket_size=2, bucket_seconds=0.2)
+    started = time.monotonic()
+    await asyncio.gather(*(delivery.submit(f"m{i}", batchable=False) for i in range(4)))
+    # Two sends are free; the next two wait for refills at 0.1s each.
+    assert time.monotonic() - started >= 0.15
+    assert channel.send.await_count == 4
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_send_is_retried():
+    channel = _channel()
+    response = MagicMock(status=429, reason="Too Many Requests")
+    error = discord.HTTPException(response, "rate limited")
+    error.retry_after = 0.01
+    channel.send = AsyncMock(side_effect=[error, None])
+    delivery = ChannelDelivery(channel)
+    await delivery.submit("hi")
+    assert channel.send.await_count == 2
+    assert delivery.retried == 1
+
+
+@pytest.mark.asyncio
+async def test_send_errors_propagate_to_caller():
+    channel = _channel()
+    channel.send = AsyncMock(side_effect=RuntimeError("boom"))
+    with pytest.raises(RuntimeError):
+        await deliver(channel, "hi")
+
+
+@pytest.mark.asyncio
+async def test_same_channel_id_shares_one_queue():
+    first, second = _channel(), _channel()
+    first.id = second.id = 4242
+    delivery = delivery_for(first)
+    assert delivery_for(second) is delivery
+    assert delivery.channel is second
+    await deliver(second, "hi")
+    second.send.assert_awaited_once_with("hi")
+    first.send.assert_not_awaited()
@@ -0,0 +1,189 @@
+"""Tests for src.inbox."""
+import asyncio
+
+import pytest
+
+from src.inbox import (
+    POLICY_DROP_OLDEST,
+    POLICY_MERGE,
+    POLICY_REJECT,
+    STATE_COALESCED,
+    STATE_DROPPED,
+    STATE_MERGED,
+    STATE_QUEUED,
+    STATE_REJECTED,
+    STATE_RUNNING,
+    Inbox,
+)
+
+
+@pytest.mark.asyncio
+async def test_first_request_runs_immediately_and_later_ones_queue():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10)
+    first = inbox.submit("c1", "a")
+    second = inbox.submit("c1", "b")
+    third = inbox.submit("c1", "c")
+    other = inbox.submit("c2", "x")
+    assert (first.state, first.position) == (STATE_RUNNING, 0)
+    assert (second.state, second.position) == (STATE_QUEUED, 1)
+    assert (third.state, third.position) == (STATE_QUEUED, 2)
+    assert (other.state, other.position) == (STATE_RUNNING, 0)
+    assert inbox.depth("c1") == 2 and inbox.depth() == 2
+
+
+@pytest.mark.asyncio
+async def test_channel_runs_requests_in_order_one_at_a_time():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10)
+    order: list[str] = []
+    active = 0
+
+    async def handle(prompt: str) -> None:
+        nonlocal active
+        ticket = inbox.submit("c1", prompt)
+        async with inbox.turn(ticket) as admitted:
+            assert admitted
+            active += 1
+            assert active == 1
+            await asyncio.sleep(0.01)
+            order.append(prompt)
+            active -= 1
+
+    await asyncio.gather(*(handle(p) for p in "abc"))
+    assert order == ["a", "b", "c"]
+    assert inbox.stats()["running"] == 0 and inbox.depth() == 0
+
+
+@pytest.mark.asyncio
+async def test_reject_policy_when_channel_full():
+    inbox = Inbox(channel_max_depth=1, global_max_depth=10, policy=POLICY_REJECT)
+    inbox.submit("c1", "a")
+    inbox.submit("c1", "b")
+    rejected = inbox.submit("c1", "c")
+    assert rejected.state == STATE_REJECTED
+    assert inbox.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_policy_frees_room():
+    inbox = Inbox(channel_max_depth=1, global_max_depth=10, policy=POLICY_DROP_OLDEST)
+    inbox.submit("c1", "a")
+    oldest = inbox.submit("c1", "b")
+    newest = inbox.submit("c1", "c")
+    assert oldest.state == STATE_DROPPED
+    assert newest.state == STATE_QUEUED and newest.position == 1
+    async with inbox.turn(oldest) as admitted:
+        assert not admitted
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_uses_global_oldest_when_global_full():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=2, policy=POLICY_DROP_OLDEST)
+    inbox.submit("c1", "a")
+    inbox.submit("c2", "x")
+    c1_waiting = inbox.submit("c1", "b")
+    inbox.submit("c2", "y")
+    newcomer = inbox.submit("c2", "z")
+    assert c1_waiting.state == STATE_DROPPED
+    assert newcomer.state == STATE_QUEUED
+    assert inbox.depth() == 2
+
+
+@pytest.mark.asyncio
+async def test_merge_policy_appends_to_newest_waiting_request():
+    inbox = Inbox(channel_max_depth=1, global_max_depth=10, policy=POLICY_MERGE)
+    inbox.submit("c1", "a")
+    waiting = inbox.submit("c1", "b")
+    merged = inbox.submit("c1", "c")
+    assert merged.state == STATE_MERGED and merged.merged_into is waiting
+    assert waiting.prompt == "b\n\nc" and waiting.merged == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10)
+    running = inbox.submit("c1", "a")
+    waiting = inbox.submit("c1", "b")
+
+    async def wait():
+        async with inbox.turn(waiting):
+            pass
+
+    task = asyncio.create_task(wait())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert inbox.depth("c1") == 0
+    async with inbox.turn(running):
+        pass
+    assert inbox.stats()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stats_report_waits_and_counters():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10)
+    inbox.submit("c1", "a")
+    inbox.submit("c1", "b")
+    stats = inbox.stats()
+    assert stats["running"] == 1 and stats["waiting"] == 1
+    assert stats["channels"] == {"c1": 1}
+    assert stats["admitted"] == 2 and stats["queued"] == 1
+
+
+@pytest.mark.asyncio
+async def test_burst_from_same_author_is_coalesced_while_debouncing():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10, debounce_seconds=0.05)
+    first = inbox.submit("c1", "a", author="u1")
+
+    async def run():
+        async with inbox.turn(first) as admitted:
+            assert admitted
+            return first.prompt
+
+    task = asyncio.create_task(run())
+    await asyncio.sleep(0.01)
+    follow_up = inbox.submit("c1", "b", author="u1")
+    other_author = inbox.submit("c1", "x", author="u2")
+    assert follow_up.state == STATE_COALESCED and follow_up.merged_into is first
+    assert other_author.state == STATE_QUEUED
+    assert await task == "a\nb"
+    assert inbox.stats()["coalesced"] == 1
+
+
+@pytest.mark.asyncio
+async def test_follow_up_joins_waiting_request_of_same_author():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10, debounce_seconds=0)
+    inbox.submit("c1", "busy", author="u2")
+    waiting = inbox.submit("c1", "a", author="u1")
+    follow_up = inbox.submit("c1", "b", author="u1")
+    assert follow_up.state == STATE_COALESCED and follow_up.position == 1
+    assert waiting.prompt == "a\nb"
+    assert inbox.depth("c1") == 1
+
+
+@pytest.mark.asyncio
+async def test_started_request_no_longer_absorbs_follow_ups():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10, debounce_seconds=0)
+    first = inbox.submit("c1", "a", author="u1")
+    async with inbox.turn(first):
+        later = inbox.submit("c1", "b", author="u1")
+        assert later.state == STATE_QUEUED
+    assert first.prompt == "a"
+
+
+@pytest.mark.asyncio
+async def test_debounce_is_capped_by_max_window():
+    inbox = Inbox(channel_max_depth=5, global_max_depth=10, debounce_seconds=0.05, debounce_max_seconds=0.08)
+    first = inbox.submit("c1", "a", author="u1")
+
+    async def chatter():
+        for i in range(10):
+            await asyncio.sleep(0.02)
+            inbox.submit("c1", f"m{i}", author="u1")
+
+    chat = asyncio.create_task(chatter())
+    started = asyncio.get_running_loop().time()
+    async with inbox.turn(first):
+        elapsed = asyncio.get_running_loop().time() - started
+    chat.cancel()
+    assert elapsed < 0.15
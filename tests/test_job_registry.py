@@ -0,0 +1,48 @@
+"""Tests for src.job_registry."""
+import asyncio
+
+import pytest
+
+from src.job_registry import JobRegistry, format_elapsed, format_jobs
+
+
+@pytest.mark.asyncio
+async def test_register_list_and_finish():
+    registry = JobRegistry()
+    job = registry.register("discord", "please   look at\nthe build " + "x" * 100)
+    assert job.task is asyncio.current_task()
+    assert job.state == "waiting"
+    assert "please look at the build" in job.preview and job.preview.endswith("…")
+    job.pid = 1234
+    assert job.state == "running"
+    assert registry.jobs() == [job]
+    registry.finish(job)
+    assert registry.jobs() == []
+
+
+@pytest.mark.asyncio
+async def test_cancel_cancels_task_and_flags_job():
+    registry = JobRegistry()
+    task = asyncio.create_task(asyncio.sleep(10))
+    job = registry.register("scheduler", "task", task=task)
+    assert registry.cancel(job.id)
+    assert job.cancel_requested
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert not registry.cancel(job.id)
+    assert not registry.cancel(999)
+
+
+def test_format_elapsed():
+    assert format_elapsed(5) == "5s"
+    assert format_elapsed(125) == "2m05s"
+    assert format_elapsed(3700) == "1h01m"
+
+
+@pytest.mark.asyncio
+async def test_format_jobs():
+    registry = JobRegistry()
+    assert format_jobs(registry.jobs()) == "No agent jobs in flight."
+    job = registry.register("proactive", "status")
+    job.pid = 42
+    assert format_jobs(registry.jobs()).startswith("#1 [proactive] 0s pid=42 — status")
@@ -0,0 +1,152 @@
+"""Tests for src.job_scheduler."""
+import asyncio
+
+import pytest
+
+from src.job_scheduler import (
+    PRIORITY_INTERACTIVE,
+    PRIORITY_PROACTIVE,
+    PRIORITY_SCHEDULED,
+    AgentScheduler,
+    priority_for_source,
+)
+
+
+def test_priority_for_source():
+    assert priority_for_source("discord") == PRIORITY_INTERACTIVE
+    assert priority_for_source("scheduler") == PRIORITY_SCHEDULED
+    assert priority_for_source("proactive") == PRIORITY_PROACTIVE
+    assert priority_for_source("unknown") == PRIORITY_PROACTIVE
+
+
+@pytest.mark.asyncio
+async def test_run_bounds_concurrency():
+    sched = AgentScheduler(max_workers=2, aging_seconds=0)
+    active = 0
+    peak = 0
+
+    async def job():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return "ok"
+
+    results = await asyncio.gather(*(sched.run(job) for _ in range(6)))
+    assert results == ["ok"] * 6
+    assert peak == 2
+    assert sched.stats()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_runs_first():
+    sched = AgentScheduler(max_workers=1, aging_seconds=0)
+    order: list[str] = []
+    gate = asyncio.Event()
+
+    async def blocker():
+        await gate.wait()
+
+    async def job(name):
+        order.append(name)
+
+    first = asyncio.create_task(sched.run(blocker))
+    await asyncio.sleep(0)
+    tasks = [
+        asyncio.create_task(sched.run(lambda: job("proactive"), priority=PRIORITY_PROACTIVE)),
+        asyncio.create_task(sched.run(lambda: job("scheduled"), priority=PRIORITY_SCHEDULED)),
+        asyncio.create_task(sched.run(lambda: job("discord"), priority=PRIORITY_INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(first, *tasks)
+    assert order == ["discord", "scheduled", "proactive"]
+
+
+@pytest.mark.asyncio
+async def test_aging_promotes_long_waiting_jobs():
+    sched = AgentScheduler(max_workers=1, aging_seconds=0.01)
+    order: list[str] = []
+    gate = asyncio.Event()
+
+    async def blocker():
+        await gate.wait()
+
+    async def job(name):
+        order.append(name)
+
+    first = asyncio.create_task(sched.run(blocker))
+    await asyncio.sleep(0)
+    old = asyncio.create_task(sched.run(lambda: job("proactive"), priority=PRIORITY_PROACTIVE))
+    await asyncio.sleep(0.05)  # waited 5 aging periods: now outranks a fresh interactive job
+    new = asyncio.create_task(sched.run(lambda: job("discord"), priority=PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(first, old, new)
+    assert order == ["proactive", "discord"]
+
+
+@pytest.mark.asyncio
+async def test_same_repo_is_serialized_other_repos_are_not(tmp_path):
+    sched = AgentScheduler(max_workers=3, aging_seconds=0, serialize_per_repo=True)
+    repo_a = str(tmp_path / "a")
+    repo_b = str(tmp_path / "b")
+    active: dict[str, int] = {repo_a: 0, repo_b: 0}
+    peak: dict[str, int] = {repo_a: 0, repo_b: 0}
+    overall_peak = 0
+
+    async def job(repo):
+        nonlocal overall_peak
+        active[repo] += 1
+        peak[repo] = max(peak[repo], active[repo])
+        overall_peak = max(overall_peak, sum(active.values()))
+        await asyncio.sleep(0.01)
+        active[repo] -= 1
+
+    await asyncio.gather(
+        *(sched.run(lambda r=r: job(r), repo=r) for r in (repo_a, repo_a, repo_b, repo_b))
+    )
+    assert peak == {repo_a: 1, repo_b: 1}
+    assert overall_peak == 2
+
+
+@pytest.mark.asyncio
+async def test_same_repo_runs_concurrently_by_default(tmp_path):
+    sched = AgentScheduler(max_workers=2, aging_seconds=0, serialize_per_repo=False)
+    gate = asyncio.Event()
+
+    async def job():
+        await gate.wait()
+
+    tasks = [asyncio.create_task(sched.run(job, repo=str(tmp_path))) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert sched.stats()["running"] == 2 and sched.stats()["busy_repos"] == []
+    gate.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_is_removed_and_slot_is_reused():
+    sched = AgentScheduler(max_workers=1, aging_seconds=0)
+    gate = asyncio.Event()
+
+    async def blocker():
+        await gate.wait()
+
+    async def job():
+        return "done"
+
+    first = asyncio.create_task(sched.run(blocker))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(sched.run(job))
+    await asyncio.sleep(0)
+    assert sched.stats()["pending"] == 1
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert sched.stats()["pending"] == 0
+    gate.set()
+    await first
+    assert await sched.run(job) == "done"
+    assert sched.stats()["running"] == 0
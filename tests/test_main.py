@@ -23,3 +23,25 @@ def test_job_runner_invokes_agent_run():
         mock_agent.assert_called_once()
         assert "TBC" in str(mock_agent.call_args[0][0])
         assert result.exit_code == 0
+
+
+def test_memory_compact_reports_each_namespace():
+    from src.memory import StoreMaintenanceReport
+
+    report = StoreMaintenanceReport("default", 4, 1, 0, [], 2, 9000, 4000)
+    with patch("src.main.compact_all_stores", return_value=[report]) as mock_compact:
+        result = runner.invoke(app, ["memory-compact"])
+    mock_compact.assert_called_once()
+    assert result.exit_code == 0
+    assert "default: ok entries=4" in result.output
+    assert "reclaimed=5000" in result.output
+
+
+def test_memory_compact_fails_on_undecodable_entries():
+    from src.memory import StoreMaintenanceReport
+
+    report = StoreMaintenanceReport("discord-1", 4, 0, 1, [], 0, 100, 100)
+    with patch("src.main.compact_store", return_value=report) as mock_compact:
+        result = runner.invoke(app, ["memory-compact", "--namespace", "discord-1"])
+    mock_compact.assert_called_once_with("discord-1")
+    assert result.exit_code == 1
@@ -1,5 +1,9 @@
-"""Tests for persistqueue-backed memory."""
+"""Tests for the memory module and its SQLite backend."""
 
+import dataclasses
+import sqlite3
+import threading
+import time
 from pathlib import Path
 from unittest.mock import patch
 
@@ -7,17 +11,14 @@ import persistqueue
 import pytest
 
 import src.memory as memory
+from src.memory_store import DEFAULT_NAMESPACE
 
 
 @pytest.fixture(autouse=True)
-def clean_queue(tmp_path, monkeypatch):
-    # Redirect queue dir to temp for tests
-    qdir = tmp_path / ".fullauto_memory"
-    qdir.mkdir(parents=True, exist_ok=True)
-    monkeypatch.setattr(memory, "QUEUE_DIR", qdir)
-    memory.queue = persistqueue.Queue(str(qdir))
-    yield
-    # cleanup: remove files
+def summarizer_mode(monkeypatch):
+    # Storage is redirected to tmp_path by conftest.isolated_memory.
+    # Exercise the agent path by default; extractive tests opt in explicitly.
+    monkeypatch.setattr(memory, "MEMORY_SUMMARIZER", "agent")
 
 
 def test_add_and_count():
@@ -31,14 +32,462 @@ def test_summarize_when_over_limit(mock_gen):
     mock_gen.return_value = "summary text"
     for i in range(memory.MAX_MESSAGES_BEFORE_SUMMARY + 1):
         memory.add_memory(f"msg {i}")
-    assert memory.get_message_count() == 1
+    assert memory.wait_for_compaction(timeout=5)
+    # Oldest chunk folded into one summary; the most recent entries stay verbatim.
+    assert memory.get_message_count() == 1 + memory.MEMORY_KEEP_RECENT_ENTRIES
     mock_gen.assert_called_once()
 
 
 @patch("src.memory.generate_response")
-def test_summarize_empty_keeps_last_five(mock_gen):
+def test_summarize_empty_falls_back_to_extractive_summary(mock_gen):
     mock_gen.return_value = ""
     limit = memory.MAX_MESSAGES_BEFORE_SUMMARY
     for i in range(limit + 1):
         memory.add_memory(f"msg {i}")
-    assert memory.get_message_count() == limit
+    assert memory.wait_for_compaction(timeout=5)
+    objs = memory.list_message_objects()
+    assert objs[0].kind == "summary" and "msg 0" in objs[0].content
+    assert [m.content for m in objs[1:]] == [f"msg {i}" for i in range(limit + 1)][-memory.MEMORY_KEEP_RECENT_ENTRIES:]
+
+
+@patch("src.memory.extractive_summary", return_value="")
+@patch("src.memory.generate_response", side_effect=TimeoutError("agent timed out"))
+def test_summarize_failure_without_fallback_keeps_recent_entries(mock_gen, mock_extractive):
+    limit = memory.MAX_MESSAGES_BEFORE_SUMMARY
+    for i in range(limit + 1):
+        memory.add_memory(f"msg {i}")
+    assert memory.wait_for_compaction(timeout=5)
+    mock_extractive.assert_called()
+    assert memory.list_messages() == [f"msg {i}" for i in range(limit + 1)][-memory.MEMORY_KEEP_RECENT_ENTRIES:]
+
+
+@patch("src.memory.generate_response")
+def test_auto_summarizer_folds_level1_locally(mock_gen, monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_SUMMARIZER", "auto")
+    memory.add_turn("Which database should billing use?", "We decided to use Postgres 15 for billing.")
+    for i in range(3):
+        memory.add_turn(f"question {i}", f"answer {i}")
+    assert memory.wait_for_compaction(timeout=5)
+    mock_gen.assert_not_called()
+    summary = memory.list_message_objects()[0]
+    assert summary.kind == "summary"
+    assert "Postgres 15" in summary.content
+
+
+def test_add_turn_and_list_preserve_order_without_mutating():
+    memory.add_turn("hello", "hi there")
+    before = memory.list_messages()
+    assert before == ["User: hello", "Agent: hi there"]
+    assert memory.list_messages() == before
+    objs = memory.list_message_objects()
+    assert [m.role for m in objs] == ["user", "assistant"]
+    assert objs[0].meta["source"] == "discord"
+
+
+def test_reset_memory_clears_everything():
+    memory.add_turn("hello", "hi there")
+    memory.reset_memory()
+    assert memory.get_message_count() == 0
+
+
+def test_store_replace_keeps_summary_before_newer_entries():
+    s = memory.store
+    seqs = s.append(DEFAULT_NAMESPACE, [memory._to_stored(memory.Message("user", f"m{i}", ts=i)) for i in range(3)])
+    s.append(DEFAULT_NAMESPACE, [memory._to_stored(memory.Message("user", "newer", ts=10))])
+    summary = memory.Message("system", "sum", ts=11, kind="summary")
+    s.replace(DEFAULT_NAMESPACE, seqs, [memory._to_stored(summary)])
+    assert memory.list_messages() == ["Summary: sum", "User: newer"]
+
+
+def test_migrates_legacy_persistqueue(tmp_path):
+    legacy_dir = tmp_path / "legacy"
+    q = persistqueue.Queue(str(legacy_dir), autosave=True)
+    q.put("plain legacy note")
+    q.put(memory._encode_message(memory.Message(role="user", content="structured", ts=1.0)))
+    del q
+    migrated = memory.open_store(legacy_dir)
+    try:
+        entries = migrated.scan(DEFAULT_NAMESPACE)
+        texts = [memory.render_for_context(memory._decode_entry(e)) for e in entries]
+        assert texts == ["plain legacy note", "User: structured"]
+        assert not (legacy_dir / "info").exists()
+        # Second open does not import again.
+        migrated.close()
+        migrated = memory.open_store(legacy_dir)
+        assert migrated.count(DEFAULT_NAMESPACE) == 2
+    finally:
+        migrated.close()
+
+
+def test_failed_migration_keeps_legacy_queue(tmp_path):
+    legacy_dir = tmp_path / "legacy"
+    q = persistqueue.Queue(str(legacy_dir), autosave=True)
+    q.put("precious note")
+    del q
+    with patch.object(memory.SqliteMemoryStore, "append", side_effect=sqlite3.OperationalError("disk I/O error")):
+        with pytest.raises(sqlite3.OperationalError):
+            memory.open_store(legacy_dir)
+    # Nothing was consumed: the next start migrates it.
+    migrated = memory.open_store(legacy_dir)
+    try:
+        texts = [memory.render_for_context(memory._decode_entry(e)) for e in migrated.scan(DEFAULT_NAMESPACE)]
+        assert texts == ["precious note"]
+    finally:
+        migrated.close()
+
+
+def test_open_store_rejects_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        memory.open_store(tmp_path, backend="nope")
+
+
+def test_add_turn_returns_while_summarization_runs_and_keeps_new_turns():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_summary(prompt, **kwargs):
+        started.set()
+        release.wait(5)
+        return "summary text"
+
+    with patch("src.memory.generate_response", side_effect=slow_summary):
+        for i in range(3):
+            memory.add_turn(f"q{i}", f"a{i}")
+        assert started.wait(5)
+        # Summarization is in progress; writes and reads must not wait for it.
+        t0 = time.monotonic()
+        memory.add_turn("late question", "late answer")
+        assert memory.list_messages()[-1] == "Agent: late answer"
+        assert time.monotonic() - t0 < 1
+        release.set()
+        assert memory.wait_for_compaction(timeout=5)
+    assert memory.list_messages() == [
+        "Summary: summary text",
+        "User: q2",
+        "Agent: a2",
+        "User: late question",
+        "Agent: late answer",
+    ]
+
+
+def test_compaction_result_is_discarded_after_reset():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_summary(prompt, **kwargs):
+        started.set()
+        release.wait(5)
+        return "stale summary"
+
+    with patch("src.memory.generate_response", side_effect=slow_summary):
+        for i in range(3):
+            memory.add_turn(f"q{i}", f"a{i}")
+        assert started.wait(5)
+        memory.reset_memory()
+        release.set()
+        assert memory.wait_for_compaction(timeout=5)
+    assert memory.get_message_count() == 0
+
+
+@patch("src.memory.generate_response")
+def test_level1_summaries_merge_into_level2(mock_gen, monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_MAX_LEVEL1_SUMMARIES", 2)
+    prompts: list[str] = []
+
+    def fake_summary(prompt, **kwargs):
+        prompts.append(prompt)
+        return f"summary {len(prompts)}"
+
+    mock_gen.side_effect = fake_summary
+    for i in range(12):
+        memory.add_turn(f"q{i}", f"a{i}")
+        assert memory.wait_for_compaction(timeout=5)
+    objs = memory.list_message_objects()
+    levels = [memory._summary_level(m) for m in objs]
+    assert levels[0] == 2
+    assert levels.count(2) == 1
+    assert levels.count(1) <= 2
+    assert objs[-1].content == "a11"
+    assert any(p.startswith("Merge the following summaries") for p in prompts)
+
+
+def test_summarization_input_is_bounded(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_SUMMARY_INPUT_CHARS", 10)
+    entries = [memory._to_stored(memory.Message("user", "x" * 8, ts=i)) for i in range(8)]
+    seqs = memory.store.append("default", entries)
+    stored = memory.store.scan("default")
+    chunk, level = memory._plan_compaction(stored)
+    assert level == 1
+    assert [e.seq for e in chunk] == seqs[:1]
+
+
+def test_token_estimate_is_recorded_at_write_time():
+    memory.add_turn("hello there", "hi")
+    objs = memory.list_message_objects()
+    assert objs[0].meta["tokens"] == memory.estimate_tokens("User: hello there")
+    assert objs[1].meta["tokens"] == memory.estimate_tokens("Agent: hi")
+
+
+def test_snapshot_reused_until_generation_changes():
+    memory.add_turn("hello", "hi")
+    with patch("src.memory._decode_entry", wraps=memory._decode_entry) as mock_decode:
+        assert memory.list_messages() == ["User: hello", "Agent: hi"]
+        assert len(memory.list_message_objects()) == 2
+        assert mock_decode.call_count == 2
+        memory.add_memory("note")
+        assert memory.list_messages()[-1] == "note"
+        # Only the new entry is decoded; unchanged entries are reused from the last snapshot.
+        assert mock_decode.call_count == 3
+
+
+def test_generation_covers_writes_from_other_processes(tmp_path):
+    memory.add_turn("hello", "hi")
+    assert memory.list_messages() == ["User: hello", "Agent: hi"]
+    before = memory.memory_generation()
+    # A separate connection to the same file stands in for reset-memory-cmd in another process.
+    other = memory.open_store(memory.QUEUE_DIR)
+    other.clear(DEFAULT_NAMESPACE)
+    other.close()
+    assert memory.memory_generation() > before
+    assert memory.list_messages() == []
+
+
+@patch("src.memory.generate_response")
+def test_archived_turns_are_retrievable_after_compaction(mock_gen):
+    mock_gen.return_value = "summary text"
+    memory.add_turn("Which database do we use for billing?", "Postgres 15 on the billing cluster")
+    for i in range(5):
+        memory.add_turn(f"unrelated question {i}", f"unrelated answer {i}")
+    assert memory.wait_for_compaction(timeout=5)
+    assert "User: Which database do we use for billing?" not in memory.list_messages()
+    hits = memory.search_archive("billing database", k=1)
+    assert hits == ["User: Which database do we use for billing?\nAgent: Postgres 15 on the billing cluster"]
+
+
+def test_search_archive_indexes_new_turns_incrementally():
+    memory.add_turn("first topic kubernetes", "ok")
+    assert memory.search_archive("kubernetes", k=1)
+    memory.add_turn("second topic terraform", "ok")
+    assert memory.search_archive("terraform", k=1) == ["User: second topic terraform\nAgent: ok"]
+    memory.reset_memory()
+    assert memory.search_archive("terraform", k=1) == []
+
+
+def test_namespaces_are_isolated():
+    memory.add_turn("channel one", "reply one", namespace="discord-1")
+    memory.add_turn("channel two", "reply two", namespace="discord-2")
+    assert memory.list_messages("discord-1") == ["User: channel one", "Agent: reply one"]
+    assert memory.get_message_count() == 0
+    assert memory.search_archive("channel", namespace="discord-2") == ["User: channel two\nAgent: reply two"]
+    memory.reset_memory("discord-1")
+    assert memory.get_message_count("discord-1") == 0
+    assert memory.get_message_count("discord-2") == 2
+
+
+def test_list_namespaces_and_reset_all():
+    memory.add_memory("shared")
+    memory.add_memory("scoped", namespace="task-nightly@repo-abc")
+    assert set(memory.list_namespaces()) == {DEFAULT_NAMESPACE, "task-nightly@repo-abc"}
+    memory.reset_all_memory()
+    assert memory.get_message_count() == 0
+    assert memory.get_message_count("task-nightly@repo-abc") == 0
+
+
+def test_namespace_for():
+    channel_ns = memory.namespace_for(channel_id=123, repo_path="/tmp/some-repo")
+    assert channel_ns.startswith("discord-123@some-repo-")
+    assert memory.namespace_for(channel_id=123, repo_path="/tmp/other-repo") != channel_ns
+    task_ns = memory.namespace_for(task="nightly", repo_path="/tmp/some-repo")
+    assert task_ns.startswith("task-nightly@some-repo-")
+    assert memory.namespace_for(task="nightly", repo_path="/tmp/other/some-repo") != task_ns
+    assert memory.namespace_for(source="proactive", repo_path="/tmp/some-repo").startswith("proactive@some-repo-")
+    assert memory.namespace_for() == DEFAULT_NAMESPACE
+
+
+def test_readers_share_the_lock_and_record_wait_metrics():
+    memory._lock_metrics.reset()
+    memory.add_turn("hello", "hi there")
+    with memory._memory_read_lock():
+        # A second reader (another descriptor, as another thread/process would use) is not blocked.
+        assert memory.list_messages() == ["User: hello", "Agent: hi there"]
+    stats = memory.lock_stats()
+    assert stats["shared"]["acquired"] == 2
+    assert stats["shared"]["timeouts"] == 0
+    assert stats["exclusive"]["acquired"] == 1
+
+
+def test_read_lock_timeout_serves_committed_snapshot(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_READ_LOCK_TIMEOUT_SECONDS", 0.1)
+    memory._lock_metrics.reset()
+    memory.add_turn("hello", "hi there")
+    with memory._memory_lock():
+        # A writer holds the lock: readers degrade to the committed snapshot instead of raising.
+        assert memory.get_message_count() == 2
+        assert memory.list_messages() == ["User: hello", "Agent: hi there"]
+    assert memory.lock_stats()["shared"]["timeouts"] == 2
+
+
+def test_writer_waits_for_reader():
+    memory.add_memory("one")
+    order: list[str] = []
+
+    def writer():
+        memory.add_memory("two")
+        order.append("write")
+
+    with memory._memory_read_lock():
+        t = threading.Thread(target=writer)
+        t.start()
+        time.sleep(0.2)
+        order.append("read done")
+    t.join(timeout=5)
+    assert order == ["read done", "write"]
+    assert memory.get_message_count() == 2
+
+
+def test_proactive_repeats_merge_into_one_turn():
+    for _ in range(4):
+        memory.add_turn("Send a short proactive update.", "No updates.", source="proactive")
+    objs = memory.list_message_objects()
+    assert len(objs) == 2
+    assert objs[1].meta["repeats"] == 3
+    # Redundant ticks are not archived either.
+    assert memory.search_archive("proactive update", k=10) == ["User: Send a short proactive update.\nAgent: No updates."]
+
+
+def test_novel_proactive_turn_is_stored():
+    memory.add_turn("Send a short proactive update.", "No updates.", source="proactive")
+    memory.add_turn("Send a short proactive update.", "CI on main is failing since commit abc123.", source="proactive")
+    assert memory.get_message_count() == 4
+
+
+def test_drop_policy_and_keep_policy(monkeypatch):
+    monkeypatch.setattr(memory.novelty, "_policies", {"scheduler": "drop"})
+    memory.add_turn("nightly", "all good", source="scheduler")
+    memory.add_turn("nightly", "All good!", source="scheduler")
+    memory.add_turn("hello", "hi", source="discord")
+    memory.add_turn("hello", "hi", source="discord")
+    sources = [m.meta["source"] for m in memory.list_message_objects()]
+    assert sources == ["scheduler", "scheduler", "discord", "discord", "discord", "discord"]
+
+
+def test_add_turns_writes_batch_in_one_commit():
+    with patch.object(memory.store, "append", wraps=memory.store.append) as mock_append:
+        stored = memory.add_turns([("q1", "a1"), ("", ""), ("q2", "a2")], source="scheduler")
+    assert stored == 2
+    mock_append.assert_called_once()
+    assert memory.list_messages() == ["User: q1", "Agent: a1", "User: q2", "Agent: a2"]
+    assert memory.search_archive("q2", k=1) == ["User: q2\nAgent: a2"]
+
+
+def test_add_turns_applies_novelty_filter_within_batch():
+    stored = memory.add_turns([("tick", "No updates.")] * 3, source="proactive")
+    assert stored == 1
+    objs = memory.list_message_objects()
+    assert len(objs) == 2
+    assert objs[1].meta["repeats"] == 2
+
+
+def test_binary_record_roundtrip_and_compression():
+    long_reply = "The build failed in step lint because of trailing whitespace. " * 40
+    for msg in (
+        memory.Message("assistant", long_reply, ts=12.5, meta={"source": "discord", "tokens": 600}),
+        memory.Message("user", "short", ts=1.0),
+        memory.Message("tool", "custom role", ts=2.0, kind="observation", meta={"x": 1}),
+    ):
+        record = memory._encode_record(msg)
+        assert isinstance(record, bytes)
+        assert memory._decode_record(record) == dataclasses.replace(msg, meta=msg.meta or {})
+    assert len(memory._encode_record(memory.Message("assistant", long_reply, ts=0))) < len(long_reply) // 4
+
+
+def test_decoder_reads_all_payload_formats():
+    msg = memory.Message("user", "hello", ts=3.0, meta={"source": "discord"})
+    v1 = memory._encode_message(msg)
+    memory.store.append(
+        "default",
+        [
+            memory.StoredEntry(ts=3.0, kind="turn", role="user", payload=v1),
+            memory.StoredEntry(ts=4.0, kind="note", role="system", payload="legacy note"),
+            memory._to_stored(memory.Message("assistant", "hi", ts=5.0)),
+        ],
+    )
+    assert memory.list_messages() == ["User: hello", "legacy note", "Agent: hi"]
+    assert memory._try_decode_item(b"\xfa\x02garbage") == (None, "�\x02garbage")
+
+
+def test_compact_store_reencodes_old_formats_and_removes_migrated_queue_files():
+    msg = memory.Message("user", "hello", ts=3.0)
+    memory.store.append(
+        "default",
+        [
+            memory.StoredEntry(ts=3.0, kind="turn", role="user", payload=memory._encode_message(msg)),
+            memory.StoredEntry(ts=4.0, kind="note", role="system", payload="legacy note"),
+        ],
+    )
+    memory.add_turn("q", "a" * 5000)
+    memory.reset_memory()  # leaves free pages behind for VACUUM
+    memory.store.append("default", [memory.StoredEntry(ts=5.0, kind="note", role="system", payload="legacy note")])
+    (memory.QUEUE_DIR / "info").write_text("stale")
+    (memory.QUEUE_DIR / "q00000").write_text("stale")
+
+    report = memory.compact_store()
+    assert report.ok
+    assert (report.entries, report.reencoded, report.legacy_files_removed) == (1, 1, 2)
+    assert report.reclaimed > 0
+    assert not (memory.QUEUE_DIR / "info").exists()
+    assert isinstance(memory.store.scan("default")[0].payload, bytes)
+    assert memory.list_messages() == ["legacy note"]
+
+
+def test_snapshot_and_restore_roundtrip(tmp_path):
+    memory.add_turn("keep me", "kept")
+    snapshot = memory.snapshot_memory(tmp_path / "snap" / "memory.db")
+    memory.reset_memory()
+    memory.add_turn("after snapshot", "gone after restore")
+    assert memory.list_messages()[0] == "User: after snapshot"
+
+    memory.restore_memory(snapshot)
+    assert memory.list_messages() == ["User: keep me", "Agent: kept"]
+    assert memory.search_archive("keep", k=1) == ["User: keep me\nAgent: kept"]
+    memory.add_turn("next", "turn")
+    assert memory.get_message_count() == 4
+
+
+def test_restore_rejects_snapshot_of_other_namespace(tmp_path):
+    memory.add_turn("channel", "scoped", namespace="discord-5")
+    snapshot = memory.snapshot_memory(tmp_path / "discord-5.db", namespace="discord-5")
+    with pytest.raises(ValueError):
+        memory.restore_memory(snapshot)
+
+
+@pytest.mark.asyncio
+async def test_async_facade_keeps_event_loop_responsive():
+    import asyncio
+
+    await memory.aadd_turn("hello", "hi")
+    assert await memory.alist_messages() == ["User: hello", "Agent: hi"]
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    threads: list[str] = []
+
+    def slow_add_turn(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.2)
+
+    tick_task = asyncio.create_task(ticker())
+    with patch("src.memory.add_turn", side_effect=slow_add_turn):
+        await memory.aadd_turn("slow", "write")
+    tick_task.cancel()
+    assert ticks >= 5
+    assert threads[0].startswith("memory-io")
+
+    await memory.areset_memory()
+    assert await memory.alist_message_objects() == []
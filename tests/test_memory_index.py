@@ -0,0 +1,48 @@
+"""Tests for src.memory_index."""
+from src.memory_index import LexicalIndex, tokenize
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("User: What is the Deploy-Target?") == ["deploy", "target"]
+
+
+def test_search_ranks_relevant_documents_first():
+    index = LexicalIndex()
+    index.add(1, "we deploy the api to staging every friday")
+    index.add(2, "lunch menu for friday")
+    index.add(3, "api rate limits and retries")
+    hits = index.search("deploy api staging", k=2)
+    assert [seq for seq, _ in hits][0] == 1
+    assert len(hits) == 2
+
+
+def test_add_is_idempotent_and_tracks_last_seq():
+    index = LexicalIndex()
+    index.add(5, "alpha beta")
+    index.add(5, "alpha beta")
+    assert len(index) == 1
+    assert index.last_seq == 5
+
+
+def test_search_without_matches_returns_empty():
+    index = LexicalIndex()
+    index.add(1, "alpha beta")
+    assert index.search("gamma") == []
+    assert index.search("") == []
+
+
+def test_common_terms_do_not_drown_rare_ones():
+    index = LexicalIndex()
+    for i in range(20):
+        index.add(i + 1, f"status update number {i}")
+    index.add(100, "status update about the postgres migration")
+    hits = index.search("status postgres", k=1)
+    assert hits[0][0] == 100
+
+
+def test_exclude_filters_hits():
+    index = LexicalIndex()
+    index.add(1, "postgres migration")
+    index.add(2, "postgres backup")
+    hits = index.search("postgres", k=5, exclude=lambda seq: seq == 1)
+    assert [seq for seq, _ in hits] == [2]
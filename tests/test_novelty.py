@@ -0,0 +1,28 @@
+"""Tests for src.novelty."""
+from src.novelty import Fingerprint, find_duplicate, hamming, parse_policies, simhash
+
+
+def test_simhash_is_stable_and_close_for_near_duplicates():
+    base = "Checked the repo: no new commits, CI is green, nothing needs attention right now."
+    near = "Checked the repo: no new commits, CI is green, nothing needs attention at the moment."
+    other = "Refactored the scheduler to age queued jobs and added tests for starvation."
+    assert simhash(base) == simhash(base)
+    assert hamming(simhash(base), simhash(near)) < hamming(simhash(base), simhash(other))
+
+
+def test_fingerprint_exact_match_ignores_case_and_punctuation():
+    assert Fingerprint.of("No updates.").matches(Fingerprint.of("no updates"))
+    assert not Fingerprint.of("No updates.").matches(Fingerprint.of("Deployed v2"))
+
+
+def test_find_duplicate_returns_newest_match():
+    recent = [("a", "User: ping\nAgent: No updates."), ("b", "User: ping\nAgent: Deployed"), ("c", "User: ping\nAgent: no updates")]
+    assert find_duplicate("User: ping\nAgent: No updates.", recent) == "c"
+    assert find_duplicate("User: what changed?\nAgent: Merged PR 12", recent) is None
+
+
+def test_parse_policies_skips_unknown_entries():
+    assert parse_policies("proactive=merge, scheduler=drop,discord=bogus,junk") == {
+        "proactive": "merge",
+        "scheduler": "drop",
+    }
@@ -0,0 +1,85 @@
+"""Tests for src.proactive."""
+import asyncio
+import subprocess
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.proactive import ProactivePacer, capture_state, is_quiet_reply
+
+
+def _git(repo, *args):
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "config", "user.email", "t@example.com")
+    _git(tmp_path, "config", "user.name", "t")
+    (tmp_path / "a.txt").write_text("one")
+    _git(tmp_path, "add", "a.txt")
+    _git(tmp_path, "commit", "-q", "-m", "init")
+    return tmp_path
+
+
+def test_is_quiet_reply():
+    assert is_quiet_reply("")
+    assert is_quiet_reply("No updates.")
+    assert is_quiet_reply("no update")
+    assert not is_quiet_reply("Build is failing on main.")
+
+
+@pytest.mark.asyncio
+async def test_capture_state_is_stable_and_sees_repo_changes(repo):
+    with patch("src.proactive.amemory_generation", new_callable=AsyncMock, return_value=3):
+        first = await capture_state(str(repo), "ns", 0.0)
+        assert first.head and first.tree and first.memory_generation == 3
+        assert await capture_state(str(repo), "ns", 0.0) == first
+
+        (repo / "a.txt").write_text("two")
+        dirty = await capture_state(str(repo), "ns", 0.0)
+        assert dirty.tree != first.tree and dirty.head == first.head
+
+        # Editing an already-modified file changes the fingerprint too.
+        time.sleep(0.01)
+        (repo / "a.txt").write_text("three!")
+        assert (await capture_state(str(repo), "ns", 0.0)).tree != dirty.tree
+
+        _git(repo, "commit", "-q", "-am", "change")
+        committed = await capture_state(str(repo), "ns", 0.0)
+        assert committed.head != first.head
+
+
+@pytest.mark.asyncio
+async def test_capture_state_outside_git_repo(tmp_path):
+    with patch("src.proactive.amemory_generation", new_callable=AsyncMock, return_value=0):
+        state = await capture_state(str(tmp_path), "ns", 0.0)
+    assert state.head is None and state.tree is None
+
+
+def test_pacer_backs_off_exponentially_and_resets():
+    pacer = ProactivePacer(10, max_interval=50, factor=2)
+    pacer.quiet()
+    pacer.quiet()
+    assert pacer.interval == 40
+    pacer.quiet()
+    assert pacer.interval == 50
+    pacer.active()
+    assert pacer.interval == 10
+    pacer.quiet()
+    pacer.note_activity()
+    assert pacer.interval == 10 and pacer.last_activity > 0
+
+
+@pytest.mark.asyncio
+async def test_pacer_sleep_is_cut_short_by_activity():
+    pacer = ProactivePacer(0.05, max_interval=10, factor=100)
+    pacer.quiet()
+    started = time.monotonic()
+    sleeper = asyncio.create_task(pacer.sleep())
+    await asyncio.sleep(0.01)
+    pacer.note_activity()
+    await sleeper
+    assert time.monotonic() - started < 1
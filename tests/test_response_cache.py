@@ -0,0 +1,103 @@
+"""Tests for src.response_cache."""
+import os
+import subprocess
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(tmp_path / "cache", enabled=True, ttl_seconds=3600, max_entries=10, max_bytes=10**6)
+
+
+def test_miss_then_hit_updates_counters(cache):
+    assert cache.get("k1") is None
+    cache.put("k1", "answer", elapsed=42.0)
+    assert cache.get("k1") == "answer"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["saved_seconds"] == 42.0
+    assert stats["entries"] == 1
+
+
+def test_expired_entry_is_a_miss(cache):
+    cache.ttl_seconds = 0.01
+    cache.put("k1", "answer")
+    time.sleep(0.02)
+    assert cache.get("k1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_respects_max_entries(cache):
+    cache.max_entries = 2
+    cache.put("a", "1")
+    cache.put("b", "2")
+    # Make "a" most recently used, then push a third entry.
+    past = time.time() - 100
+    os.utime(cache.directory / "b.json", (past, past))
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_size_cap_evicts_oldest(cache):
+    cache.max_bytes = 300
+    cache.put("a", "x" * 200)
+    past = time.time() - 100
+    os.utime(cache.directory / "a.json", (past, past))
+    cache.put("b", "y" * 200)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 200
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / "repo"
+    path.mkdir()
+    for args in (["init", "-q"], ["config", "user.email", "t@example.com"], ["config", "user.name", "t"]):
+        subprocess.run(["git", *args], cwd=path, check=True, capture_output=True)
+    (path / "a.txt").write_text("one")
+    subprocess.run(["git", "add", "a.txt"], cwd=path, check=True, capture_output=True)
+    subprocess.run(["git", "commit", "-q", "-m", "init"], cwd=path, check=True, capture_output=True)
+    return path
+
+
+@pytest.mark.asyncio
+async def test_make_key_depends_on_head_prompt_and_memory(cache, repo):
+    k1 = await cache.make_key("hello", "mem", str(repo))
+    assert k1 is not None
+    assert k1 == await cache.make_key("  hello  ", "mem", str(repo))
+    assert k1 != await cache.make_key("hello", "other mem", str(repo))
+    with patch("src.response_cache._git_head", new_callable=AsyncMock) as mock_head:
+        mock_head.return_value = "def"
+        assert k1 != await cache.make_key("hello", "mem", str(repo))
+        mock_head.return_value = None
+        assert await cache.make_key("hello", "mem", str(repo)) is None
+
+
+@pytest.mark.asyncio
+async def test_make_key_changes_with_uncommitted_edits(cache, repo):
+    clean = await cache.make_key("hello", "mem", str(repo))
+    (repo / "a.txt").write_text("two")
+    dirty = await cache.make_key("hello", "mem", str(repo))
+    assert dirty != clean
+    (repo / "b.txt").write_text("new file")
+    assert await cache.make_key("hello", "mem", str(repo)) not in (clean, dirty)
+
+
+@pytest.mark.asyncio
+async def test_make_key_outside_git_repo_is_none(cache, tmp_path):
+    assert await cache.make_key("hello", "mem", str(tmp_path)) is None
+
+
+@pytest.mark.asyncio
+async def test_make_key_disabled_returns_none(cache, tmp_path):
+    cache.enabled = False
+    assert await cache.make_key("hello", "", str(tmp_path)) is None
@@ -0,0 +1,172 @@
+"""Tests for src.singleflight."""
+import asyncio
+
+import pytest
+
+from src.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work(broadcast):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    flight = SingleFlight()
+    calls: list[str] = []
+
+    async def work(name):
+        calls.append(name)
+        await asyncio.sleep(0)
+        return name
+
+    results = await asyncio.gather(flight.do("a", lambda b: work("a")), flight.do("b", lambda b: work("b")))
+    assert results == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared():
+    flight = SingleFlight()
+
+    async def work(broadcast):
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(flight.do("k", work), flight.do("k", work), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_shared_task_running():
+    flight = SingleFlight()
+    gate = asyncio.Event()
+
+    async def work(broadcast):
+        await gate.wait()
+        return "done"
+
+    first = asyncio.create_task(flight.do("k", work))
+    second = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    gate.set()
+    assert await second == "done"
+
+
+@pytest.mark.asyncio
+async def test_cancelling_last_waiter_cancels_shared_task():
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def work(broadcast):
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiter = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_chunks_fan_out_and_replay_to_late_joiners():
+    flight = SingleFlight()
+    gate = asyncio.Event()
+    seen_a: list[str] = []
+    seen_b: list[str] = []
+
+    async def work(broadcast):
+        await broadcast("one ")
+        await gate.wait()
+        await broadcast("two")
+        return "one two"
+
+    async def on_a(chunk):
+        seen_a.append(chunk)
+
+    async def on_b(chunk):
+        seen_b.append(chunk)
+
+    a = asyncio.create_task(flight.do("k", work, on_chunk=on_a))
+    await asyncio.sleep(0.01)
+    b = asyncio.create_task(flight.do("k", work, on_chunk=on_b))
+    await asyncio.sleep(0.01)
+    gate.set()
+    assert await a == await b == "one two"
+    assert seen_a == seen_b == ["one ", "two"]
+
+
+@pytest.mark.asyncio
+async def test_late_joiner_keeps_chunks_broadcast_during_its_replay():
+    flight = SingleFlight()
+    replaying = asyncio.Event()
+    release = asyncio.Event()
+    seen: list[str] = []
+
+    async def work(broadcast):
+        await broadcast("one ")
+        await replaying.wait()
+        await broadcast("two")
+        release.set()
+        await asyncio.sleep(0.01)
+        return "one two"
+
+    async def slow_listener(chunk):
+        # Like a Discord edit: the replay of "one " is still awaiting when "two" is broadcast.
+        seen.append(chunk)
+        if chunk == "one ":
+            replaying.set()
+            await release.wait()
+
+    first = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    late = asyncio.create_task(flight.do("k", work, on_chunk=slow_listener))
+    assert await late == await first == "one two"
+    assert seen == ["one ", "two"]
+
+
+@pytest.mark.asyncio
+async def test_waiter_cancelled_during_late_joiners_replay_keeps_shared_task():
+    flight = SingleFlight()
+    in_replay = asyncio.Event()
+    release = asyncio.Event()
+
+    async def work(broadcast):
+        await broadcast("one ")
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def slow_listener(chunk):
+        in_replay.set()
+        await release.wait()
+
+    first = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0.01)
+    late = asyncio.create_task(flight.do("k", work, on_chunk=slow_listener))
+    await in_replay.wait()
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    release.set()
+    assert await late == "done"
@@ -0,0 +1,113 @@
+"""Tests for src.streaming."""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import discord
+import pytest
+
+from src.streaming import DISCORD_MESSAGE_LIMIT, DiscordStreamWriter
+
+
+def _message(sent, content):
+    msg = MagicMock()
+    msg.content = content
+    msg.edit = AsyncMock()
+    msg.delete = AsyncMock()
+    sent.append(msg)
+    return msg
+
+
+def _channel():
+    channel = MagicMock()
+    sent: list[MagicMock] = []
+
+    async def send(content):
+        return _message(sent, content)
+
+    channel.send = AsyncMock(side_effect=send)
+    return channel, sent
+
+
+@pytest.mark.asyncio
+async def test_writer_edits_single_message_and_finishes_with_final_text():
+    channel, sent = _channel()
+    writer = DiscordStreamWriter(channel, interval=0)
+    await writer.push("Hello")
+    await writer.push(", world")
+    await writer.finish("Hello, world!")
+    assert channel.send.call_count == 1
+    assert sent[0].edit.call_args.kwargs["content"] == "Hello, world!"
+
+
+@pytest.mark.asyncio
+async def test_writer_throttles_edits():
+    channel, sent = _channel()
+    writer = DiscordStreamWriter(channel, interval=60)
+    await writer.push("a")
+    for _ in range(10):
+        await writer.push("b")
+    assert channel.send.call_count == 1
+    sent[0].edit.assert_not_called()
+    await writer.finish()
+    assert sent[0].edit.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_writer_rolls_over_past_discord_limit():
+    channel, sent = _channel()
+    writer = DiscordStreamWriter(channel, interval=0)
+    await writer.push("x" * (DISCORD_MESSAGE_LIMIT - 10))
+    await writer.push("y" * 100)
+    await writer.finish()
+    assert channel.send.call_count == 2
+    final_first = sent[0].edit.call_args.kwargs["content"] if sent[0].edit.called else sent[0].content
+    assert len(final_first) <= DISCORD_MESSAGE_LIMIT
+
+
+@pytest.mark.asyncio
+async def test_finish_without_stream_sends_final_text_once():
+    channel, sent = _channel()
+    writer = DiscordStreamWriter(channel, interval=0)
+    await writer.finish("done")
+    channel.send.assert_called_once_with("done")
+    assert writer.started
+
+
+@pytest.mark.asyncio
+async def test_writer_replaces_streamed_messages_with_attachment_for_huge_final_text():
+    channel, sent = _channel()
+    channel.send = AsyncMock(side_effect=lambda content, **kwargs: _message(sent, content))
+    writer = DiscordStreamWriter(channel, interval=0)
+    await writer.push("partial")
+    with patch("src.delivery.DELIVERY_ATTACHMENT_CHARS", 1000):
+        await writer.push("x" * 2000)
+        assert channel.send.call_count == 1
+        await writer.finish("line\n" * 500)
+    sent[0].delete.assert_awaited_once()
+    assert channel.send.call_count == 2
+    assert channel.send.call_args.kwargs["file"].filename == "response.md"
+    assert writer.started
+
+
+@pytest.mark.asyncio
+async def test_writer_keeps_code_blocks_intact_across_messages():
+    channel, sent = _channel()
+    writer = DiscordStreamWriter(channel, interval=0)
+    await writer.finish("```python\n" + "\n".join(f"value_{i} = {i}" for i in range(300)) + "\n```")
+    assert channel.send.call_count > 1
+    for msg in sent:
+        assert msg.content.startswith("```python\n") and msg.content.endswith("```")
+        assert len(msg.content) <= DISCORD_MESSAGE_LIMIT
+
+
+@pytest.mark.asyncio
+async def test_writer_edits_are_retried_after_rate_limit():
+    channel, sent = _channel()
+    writer = DiscordStreamWriter(channel, interval=0)
+    await writer.push("Hello")
+    response = MagicMock(status=429, reason="Too Many Requests")
+    error = discord.HTTPException(response, "rate limited")
+    error.retry_after = 0.01
+    sent[0].edit = AsyncMock(side_effect=[error, None])
+    await writer.finish("Hello, world!")
+    assert sent[0].edit.await_count == 2
+    assert sent[0].edit.call_args.kwargs["content"] == "Hello, world!"
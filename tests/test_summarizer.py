@@ -0,0 +1,43 @@
+"""Tests for src.summarizer."""
+import time
+
+from src.summarizer import extractive_summary
+
+
+def test_keeps_decisions_and_facts_over_filler():
+    messages = [
+        "User: hi",
+        "Agent: Hello! How can I help?",
+        "User: Which database should billing use?",
+        "Agent: We decided to use Postgres 15 for billing. The schema lives in db/billing.sql.",
+        "User: thanks",
+        "Agent: No updates.",
+    ]
+    summary = extractive_summary(messages, max_chars=140)
+    assert "Postgres 15" in summary
+    assert "db/billing.sql" in summary
+    assert "No updates" not in summary
+    assert len(summary) <= 140
+
+
+def test_output_keeps_original_order_and_drops_repeats():
+    messages = [
+        "Agent: Deploy failed because the API_KEY env var is missing.",
+        "Agent: Deploy failed because the API_KEY env var is missing.",
+        "Agent: We will rotate the key and redeploy on Friday.",
+    ]
+    summary = extractive_summary(messages)
+    assert summary.count("API_KEY") == 1
+    assert summary.index("API_KEY") < summary.index("Friday")
+
+
+def test_summary_entries_have_no_label_and_empty_input_is_empty():
+    assert extractive_summary(["Summary: Billing moved to Postgres 15."]) == "Billing moved to Postgres 15."
+    assert extractive_summary([]) == ""
+
+
+def test_typical_chunk_takes_milliseconds():
+    messages = [f"User: question {i} about module_{i}.py?\nAgent: Fixed the bug in module_{i}.py and added tests." for i in range(200)]
+    started = time.perf_counter()
+    extractive_summary(messages)
+    assert time.perf_counter() - started < 0.5
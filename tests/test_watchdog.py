@@ -0,0 +1,52 @@
+"""Tests for src.watchdog."""
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.watchdog import LoopWatchdog, start_watchdog_if_enabled
+
+
+def _blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_watchdog_captures_stack_of_blocking_call():
+    watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.05)
+
+        async def handler():
+            _blocking_call()
+
+        await asyncio.create_task(handler(), name="blocking-handler")
+        await asyncio.sleep(0.05)
+    finally:
+        watchdog.stop()
+    stats = watchdog.stats()
+    assert stats["blocked_events"] == 1
+    assert stats["lag_events"] >= 1
+    assert stats["max_lag"] >= 0.2
+    assert stats["last_blocked_task"] == "blocking-handler"
+    assert "_blocking_call" in watchdog.last_blocked_stack
+
+
+@pytest.mark.asyncio
+async def test_watchdog_quiet_when_loop_is_responsive():
+    watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+    watchdog.start()
+    try:
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+    finally:
+        watchdog.stop()
+    assert watchdog.stats()["blocked_events"] == 0
+
+
+@pytest.mark.asyncio
+async def test_watchdog_is_opt_in():
+    with patch("src.watchdog.LOOP_WATCHDOG", False):
+        assert start_watchdog_if_enabled() is None